@@ -3,18 +3,27 @@
 Script para actualizar datos de publicaciones en MercadoLibre
 Lee un archivo Excel con columnas: ID, Precio, Cantidad disponible, SellerCustomSku, Status
 Hace requests PUT a ML para actualizar cada publicación
+Opcionalmente verifica lo escrito (--verificar) con el cuerpo del PUT o, si falta, por multiget
 Genera un reporte detallado con estadísticas de actualización
 """
 
+import numpy as np
 import pandas as pd
 import requests
 import time
 import json
 import os
+import shutil
+import threading
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
 from datetime import datetime
-from typing import List, Dict, Tuple, Any
+from typing import List, Dict, Tuple, Any, Callable, Optional
 from dotenv import load_dotenv
 
+from ml_comun import (RATE_RPM_DEFAULT, obtener_limitador, crear_sesion, leer_retry_after,
+                      ResultadoItem, ReporteStream)
+from validar_datos_ml import ValidadorML, TOLERANCIA_PRECIO
+
 load_dotenv()
 
 # === CONFIGURACIÓN ===
@@ -62,10 +71,20 @@ TIENDAS_ML = {
 }
 
 class ActualizadorML:
-    def __init__(self, tienda_config: Dict[str, str]):
+    def __init__(self, tienda_config: Dict[str, str], rpm: float = RATE_RPM_DEFAULT):
         self.tienda = tienda_config
         self.access_token = tienda_config["access_token"]
         self.nombre_tienda = tienda_config["nombre_tienda"]
+        self.limitador = obtener_limitador(self.nombre_tienda, rpm)
+        self.session = crear_sesion()
+        self._token_lock = threading.Lock()
+
+    def _renovar_si_vigente(self, token_usado: str) -> bool:
+        """Renueva el token solo si nadie lo renovó mientras esperábamos el lock"""
+        with self._token_lock:
+            if self.access_token != token_usado:
+                return True
+            return self.renovar_token()
         
     def renovar_token(self, max_intentos: int = 3, espera_inicial: int = 1) -> bool:
         """Renueva el token de acceso de MercadoLibre"""
@@ -134,62 +153,56 @@ class ActualizadorML:
         
         return payload
 
-    def actualizar_item(self, item_id: str, payload: Dict[str, Any]) -> Dict[str, Any]:
-        """Actualiza un item específico en MercadoLibre"""
+    def actualizar_item(self, item_id: str, payload: Dict[str, Any], max_reintentos: int = 5) -> ResultadoItem:
+        """Actualiza un item específico en MercadoLibre (devuelve solo id, estado, código y error)"""
         url = f"https://api.mercadolibre.com/items/{item_id}"
-        headers = {
-            "Authorization": f"Bearer {self.access_token}",
-            "Content-Type": "application/json"
-        }
         
         try:
-            resp = requests.put(url, headers=headers, json=payload)
-            
-            # Si el token expiró, intentar renovarlo
-            if resp.status_code == 401:
-                print(f"⚠️  Token expirado para {self.nombre_tienda}, intentando renovar...")
-                if self.renovar_token():
-                    headers = {"Authorization": f"Bearer {self.access_token}"}
-                    resp = requests.put(url, headers=headers, json=payload)
-                    print(f"✅ Token renovado, reintentando actualización de {item_id}")
-                else:
-                    return {
-                        'id': item_id,
-                        'exitoso': False,
-                        'error': 'No se pudo renovar token',
-                        'codigo_respuesta': 401
-                    }
+            for intento in range(max_reintentos + 1):
+                token_usado = self.access_token
+                headers = {
+                    "Authorization": f"Bearer {token_usado}",
+                    "Content-Type": "application/json"
+                }
+                self.limitador.adquirir()
+                resp = self.session.put(url, headers=headers, json=payload, timeout=30)
+                
+                # Si el token expiró, intentar renovarlo
+                if resp.status_code == 401:
+                    print(f"⚠️  Token expirado para {self.nombre_tienda}, intentando renovar...")
+                    if self._renovar_si_vigente(token_usado) and intento < max_reintentos:
+                        print(f"✅ Token renovado, reintentando actualización de {item_id}")
+                        continue
+                    return ResultadoItem(item_id, False, 401, 'No se pudo renovar token')
+                
+                # Límite de tasa: pausa global para toda la tienda y reintento
+                if resp.status_code == 429 and intento < max_reintentos:
+                    self.limitador.penalizar(leer_retry_after(resp))
+                    continue
+                break
             
             if resp.status_code == 200:
-                data = resp.json()
-                return {
-                    'id': item_id,
-                    'exitoso': True,
-                    'datos_actualizados': payload,
-                    'respuesta_ml': data,
-                    'codigo_respuesta': 200
-                }
+                return ResultadoItem(item_id, True, 200, estado=extraer_estado(resp))
             else:
                 error_data = resp.json() if resp.content else {}
-                return {
-                    'id': item_id,
-                    'exitoso': False,
-                    'error': error_data.get('message', f'Error HTTP {resp.status_code}'),
-                    'codigo_respuesta': resp.status_code,
-                    'datos_enviados': payload
-                }
+                return ResultadoItem(item_id, False, resp.status_code,
+                                     error_data.get('message', f'Error HTTP {resp.status_code}'))
                 
-        except requests.RequestException as e:
-            return {
-                'id': item_id,
-                'exitoso': False,
-                'error': f'Error de conexión: {str(e)}',
-                'codigo_respuesta': None,
-                'datos_enviados': payload
-            }
-
-    def actualizar_items_lote(self, items_data: List[Dict[str, Any]], batch_size: int = 10) -> List[Dict[str, Any]]:
-        """Actualiza múltiples items en lotes con logs de progreso"""
+        except (requests.RequestException, ValueError) as e:
+            return ResultadoItem(item_id, False, None, f'Error de conexión: {str(e)}')
+
+    def actualizar_items_lote(self, items_data: List[Dict[str, Any]], batch_size: int = 10,
+                              concurrente: bool = False,
+                              al_resultado: Optional[Callable] = None) -> List[Any]:
+        """
+        Actualiza múltiples items en lotes con logs de progreso.
+        Si se pasa `al_resultado(resultado, payload)`, cada resultado se entrega ahí
+        y no se acumula (la lista devuelta queda vacía).
+        """
+        if concurrente:
+            return self.actualizar_items_concurrente(items_data, max_en_vuelo=batch_size,
+                                                     al_resultado=al_resultado)
+
         total_items = len(items_data)
         total_batches = (total_items + batch_size - 1) // batch_size
         
@@ -212,7 +225,10 @@ class ActualizadorML:
                 
                 print(f"   🔄 Actualizando {item_id}...")
                 resultado = self.actualizar_item(item_id, payload)
-                todos_los_resultados.append(resultado)
+                if al_resultado:
+                    al_resultado(resultado, payload)
+                else:
+                    todos_los_resultados.append(resultado)
                 
                 if resultado['exitoso']:
                     exitosos += 1
@@ -231,9 +247,313 @@ class ActualizadorML:
                 print(f"⏳ Pausa entre lotes...")
                 time.sleep(2)
         
-        print(f"📊 Actualizaciones completadas: {len(todos_los_resultados)} items procesados")
+        print(f"📊 Actualizaciones completadas: {total_items} items procesados")
         return todos_los_resultados
 
+    def actualizar_items_concurrente(self, items_data: List[Dict[str, Any]], max_en_vuelo: int = 10,
+                                     log_cada: int = 100,
+                                     al_resultado: Optional[Callable] = None) -> List[Any]:
+        """
+        Actualiza items con un pool de hilos: como máximo `max_en_vuelo` requests
+        simultáneos y el ritmo global lo marca el limitador de la tienda.
+        Los resultados se devuelven en el mismo orden que items_data.
+        """
+        total_items = len(items_data)
+        print(f"📡 Iniciando actualizaciones concurrentes: {total_items} items, "
+              f"{max_en_vuelo} en vuelo, {self.limitador.rate * 60:.0f} req/min")
+        
+        resultados: List[Any] = [] if al_resultado else [None] * total_items
+        exitosos = 0
+        fallidos = 0
+        inicio = time.monotonic()
+        
+        def _registrar(futuro):
+            nonlocal exitosos, fallidos
+            idx = pendientes.pop(futuro)
+            resultado = futuro.result()
+            if al_resultado:
+                al_resultado(resultado, items_data[idx]['payload'])
+            else:
+                resultados[idx] = resultado
+            if resultado['exitoso']:
+                exitosos += 1
+            else:
+                fallidos += 1
+                print(f"   ❌ {resultado['id']} falló: {resultado.get('error', 'Error desconocido')}")
+            hechos = exitosos + fallidos
+            if hechos % log_cada == 0 or hechos == total_items:
+                velocidad = hechos / max(time.monotonic() - inicio, 1e-6)
+                print(f"   📈 Progreso: {hechos}/{total_items} ({hechos/total_items*100:.1f}%) "
+                      f"✅ {exitosos} ❌ {fallidos} - {velocidad:.1f} items/s")
+        
+        pendientes = {}
+        with ThreadPoolExecutor(max_workers=max_en_vuelo) as executor:
+            for idx, item_data in enumerate(items_data):
+                # Cola acotada: no se encolan más de 2x los requests en vuelo
+                while len(pendientes) >= max_en_vuelo * 2:
+                    listos, _ = wait(list(pendientes), return_when=FIRST_COMPLETED)
+                    for futuro in listos:
+                        _registrar(futuro)
+                futuro = executor.submit(self.actualizar_item, item_data['id'], item_data['payload'])
+                pendientes[futuro] = idx
+            while pendientes:
+                listos, _ = wait(list(pendientes), return_when=FIRST_COMPLETED)
+                for futuro in listos:
+                    _registrar(futuro)
+        
+        print(f"📊 Actualizaciones completadas: {total_items} items procesados "
+              f"en {time.monotonic() - inicio:.1f}s")
+        return resultados
+
+STATUS_VALIDOS = ['active', 'paused', 'closed']
+CAMPOS_ESCRITOS = ['price', 'available_quantity', 'seller_custom_field', 'status']
+
+def extraer_estado(resp) -> Optional[Dict[str, Any]]:
+    """Campos escritos tal como los devuelve el PUT (None si la respuesta no trae cuerpo útil)"""
+    try:
+        body = resp.json() if resp.content else None
+    except ValueError:
+        return None
+    if not isinstance(body, dict):
+        return None
+    estado = {campo: body[campo] for campo in CAMPOS_ESCRITOS if campo in body}
+    return estado or None
+
+def diferencias_payload(payload: Dict[str, Any], estado: Dict[str, Any]) -> List[str]:
+    """Compara lo enviado con el estado de ML; mismo formato de mensajes que validar_datos_ml"""
+    diferencias = []
+    try:
+        if 'price' in payload and abs(float(payload['price']) - float(estado.get('price'))) > TOLERANCIA_PRECIO:
+            diferencias.append(f"Precio: enviado={payload['price']}, ML={estado.get('price')}")
+    except (ValueError, TypeError):
+        diferencias.append(f"Precio: enviado={payload['price']}, ML={estado.get('price')}")
+    try:
+        if 'available_quantity' in payload and int(payload['available_quantity']) != int(estado.get('available_quantity')):
+            diferencias.append(f"Cantidad: enviado={payload['available_quantity']}, ML={estado.get('available_quantity')}")
+    except (ValueError, TypeError):
+        diferencias.append(f"Cantidad: enviado={payload['available_quantity']}, ML={estado.get('available_quantity')}")
+    if 'seller_custom_field' in payload and str(payload['seller_custom_field']).strip() != str(estado.get('seller_custom_field') or '').strip():
+        diferencias.append(f"SKU: enviado={payload['seller_custom_field']}, ML={estado.get('seller_custom_field')}")
+    if 'status' in payload and str(payload['status']).lower() != str(estado.get('status') or '').lower():
+        diferencias.append(f"Status: enviado={payload['status']}, ML={estado.get('status')}")
+    return diferencias
+
+class VerificadorPostEscritura:
+    """
+    Verificación fusionada con la actualización:
+      - si el PUT devolvió los campos escritos se compara en el momento (sin requests extra)
+      - los items con respuesta vacía o incompleta se guardan (id, payload) y se
+        verifican al final con multiget por lotes
+    Los resultados van al mismo ReporteActualizacion.
+    """
+    def __init__(self, reporte: 'ReporteActualizacion'):
+        self.reporte = reporte
+        self.pendientes: List[Tuple[str, Dict[str, Any]]] = []
+        self.desde_respuesta = 0
+        self.por_multiget = 0
+        self.discrepancias = 0
+        self.sin_verificar = 0
+        reporte.verificacion = self
+
+    def registrar(self, resultado, payload: Dict[str, Any]):
+        self.reporte.registrar(resultado, payload)
+        if not resultado['exitoso']:
+            return
+        estado = resultado.get('estado')
+        if estado and all(campo in estado for campo in payload):
+            self.desde_respuesta += 1
+            self._comparar(resultado['id'], payload, estado)
+        else:
+            self.pendientes.append((resultado['id'], payload))
+
+    def _comparar(self, item_id: str, payload: Dict[str, Any], estado: Dict[str, Any]):
+        diferencias = diferencias_payload(payload, estado)
+        if diferencias:
+            self.discrepancias += 1
+            self.reporte.registrar_discrepancia(item_id, diferencias, payload)
+
+    def verificar_pendientes(self, tienda_config: Dict[str, str], rpm: float = RATE_RPM_DEFAULT):
+        """Multiget por lotes solo de los items ambiguos (comparte el limitador de la tienda)"""
+        if not self.pendientes:
+            return
+        print(f"🔎 Verificando por multiget {len(self.pendientes)} items sin estado en la respuesta...")
+        validador = ValidadorML(tienda_config, rpm=rpm)
+        ids = [item_id for item_id, _ in self.pendientes]
+        datos = validador.obtener_detalles_multiget(ids, campos=['id'] + CAMPOS_ESCRITOS)
+        for (item_id, payload), estado in zip(self.pendientes, datos):
+            if 'error' in estado:
+                self.sin_verificar += 1
+                self.reporte.registrar_discrepancia(item_id, [f"Sin verificar: {estado['error']}"], payload)
+                continue
+            self.por_multiget += 1
+            self._comparar(item_id, payload, estado)
+        self.pendientes = []
+
+    def resumen(self) -> str:
+        verificados = self.desde_respuesta + self.por_multiget
+        return f"""
+VERIFICACIÓN POST-ESCRITURA
+==========================
+Items verificados: {verificados} (respuesta PUT: {self.desde_respuesta}, multiget: {self.por_multiget})
+Items con discrepancias: {self.discrepancias}
+Items sin verificar: {self.sin_verificar}
+"""
+
+def _columna_texto(df: pd.DataFrame, columna: str) -> pd.Series:
+    """Columna como texto sin espacios; NaN/None/'' quedan como NA"""
+    texto = df[columna].astype("string").str.strip()
+    return texto.mask(texto == "")
+
+def _unir_motivos(motivos: pd.DataFrame) -> np.ndarray:
+    """Texto 'motivo1; motivo2' por fila a partir de columnas booleanas"""
+    texto = np.full(len(motivos), "", dtype=object)
+    for columna in motivos.columns:
+        marca = motivos[columna].to_numpy()
+        separador = np.where(texto[marca] == "", "", "; ")
+        texto[marca] = texto[marca] + separador + columna
+    return texto
+
+def compilar_payloads(df: pd.DataFrame) -> Tuple[List[Dict[str, Any]], pd.DataFrame, int]:
+    """
+    Versión columnar de construir_payload para todo el DataFrame:
+    convierte y valida Precio, Cantidad disponible, SellerCustomSku y Status de una vez.
+    Devuelve (items_data, rechazados, sin_id):
+      - items_data: [{'id', 'payload'}] solo con los campos válidos de cada fila
+      - rechazados: filas con celdas inválidas (ID, fila, motivo, enviado)
+      - sin_id: filas ignoradas por no tener ID
+    """
+    ids = _columna_texto(df, 'ID')
+    tiene_id = ids.notna().to_numpy()
+
+    precio_txt = _columna_texto(df, 'Precio')
+    precio = pd.to_numeric(precio_txt, errors='coerce')
+    precio_invalido = precio_txt.notna() & precio.isna()
+
+    cantidad_txt = _columna_texto(df, 'Cantidad disponible')
+    cantidad = pd.to_numeric(cantidad_txt, errors='coerce')
+    cantidad_no_entera = cantidad.notna() & (cantidad != cantidad.round())
+    cantidad_invalida = (cantidad_txt.notna() & cantidad.isna()) | cantidad_no_entera
+    cantidad = cantidad.mask(cantidad_invalida)
+
+    sku = _columna_texto(df, 'SellerCustomSku')
+
+    status_txt = _columna_texto(df, 'Status')
+    status = status_txt.str.lower()
+    status_invalido = status.notna() & ~status.isin(STATUS_VALIDOS)
+    status = status.mask(status_invalido)
+
+    columnas = {
+        'price': precio.to_numpy(dtype=float),
+        'available_quantity': cantidad.to_numpy(dtype=float),
+        'seller_custom_field': sku.to_numpy(dtype=object, na_value=None),
+        'status': status.to_numpy(dtype=object, na_value=None),
+    }
+    presentes = {
+        'price': precio.notna().to_numpy(),
+        'available_quantity': cantidad.notna().to_numpy(),
+        'seller_custom_field': sku.notna().to_numpy(),
+        'status': status.notna().to_numpy(),
+    }
+    con_datos = np.logical_or.reduce(list(presentes.values()))
+
+    # Motivos de rechazo por fila (vectorizado; solo se arma texto para las filas con problemas)
+    motivos = pd.DataFrame({
+        'Precio inválido': precio_invalido.to_numpy(dtype=bool),
+        'Cantidad inválida': cantidad_invalida.to_numpy(dtype=bool),
+        'Status inválido (debe ser: active, paused, closed)': status_invalido.to_numpy(dtype=bool),
+        'Sin datos válidos para actualizar': tiene_id & ~con_datos,
+    })
+    con_motivo = tiene_id & motivos.to_numpy().any(axis=1)
+    filas_motivo = np.flatnonzero(con_motivo)
+    rechazados = pd.DataFrame({
+        'ID': ids.to_numpy(dtype=object, na_value=None)[filas_motivo],
+        'fila': filas_motivo + 2,  # fila de Excel (encabezado = 1)
+        'motivo': _unir_motivos(motivos.iloc[filas_motivo]),
+        'enviado': con_datos[filas_motivo],
+    })
+
+    items_data = []
+    ids_arr = ids.to_numpy(dtype=object, na_value=None)
+    for i in np.flatnonzero(tiene_id & con_datos):
+        payload = {}
+        if presentes['price'][i]:
+            payload['price'] = float(columnas['price'][i])
+        if presentes['available_quantity'][i]:
+            payload['available_quantity'] = int(columnas['available_quantity'][i])
+        if presentes['seller_custom_field'][i]:
+            payload['seller_custom_field'] = columnas['seller_custom_field'][i]
+        if presentes['status'][i]:
+            payload['status'] = columnas['status'][i]
+        items_data.append({'id': ids_arr[i], 'payload': payload})
+
+    return items_data, rechazados, int((~tiene_id).sum())
+
+class ReporteActualizacion:
+    """Acumula contadores y escribe el detalle de fallidos a medida que llegan los resultados"""
+
+    def __init__(self, tienda: str, archivo_salida: Optional[str] = None):
+        self.tienda = tienda
+        self.fecha = datetime.now().isoformat()
+        self.stream = ReporteStream(archivo_salida)
+        self.exitosos = 0
+        self.fallidos = 0
+        self.ignorados = 0
+        self.verificacion = None  # VerificadorPostEscritura opcional
+
+    def registrar(self, resultado, payload: Optional[Dict[str, Any]] = None):
+        if resultado['exitoso']:
+            self.exitosos += 1
+            return
+        self.fallidos += 1
+        error = resultado.get('error', 'Error desconocido')
+        self.stream.registrar_error(error)
+        datos_enviados = payload if payload is not None else resultado.get('datos_enviados')
+        lineas = [
+            f"\nID: {resultado['id']}\n",
+            f"Error: {error}\n",
+            f"Código de respuesta: {resultado.get('codigo_respuesta', 'N/A')}\n",
+        ]
+        if datos_enviados:
+            lineas.append(f"Datos enviados: {json.dumps(datos_enviados, indent=2)}\n")
+        lineas.append("-" * 50 + "\n")
+        self.stream.escribir_detalle("".join(lineas))
+
+    def registrar_discrepancia(self, item_id: str, diferencias: List[str], payload: Dict[str, Any]):
+        """Detalle de un item actualizado cuyo estado en ML no coincide con lo enviado"""
+        for diferencia in diferencias:
+            self.stream.registrar_error(f"Verificación {diferencia}")
+        self.stream.escribir_detalle(
+            f"\nID: {item_id}\n"
+            f"Verificación: {', '.join(diferencias)}\n"
+            f"Datos enviados: {json.dumps(payload, indent=2)}\n"
+            + "-" * 50 + "\n"
+        )
+
+    def cerrar(self) -> str:
+        total_items = self.exitosos + self.fallidos
+        base = total_items or 1
+        encabezado = f"""
+REPORTE DE ACTUALIZACIÓN MERCADOLIBRE
+=====================================
+Tienda: {self.tienda}
+Fecha: {self.fecha}
+Total de items procesados: {total_items}
+
+ESTADÍSTICAS GENERALES
+=====================
+Items actualizados exitosamente: {self.exitosos} ({self.exitosos/base*100:.1f}%)
+Items fallidos: {self.fallidos} ({self.fallidos/base*100:.1f}%)
+Items ignorados: {self.ignorados}
+{self.verificacion.resumen() if self.verificacion else ""}
+ERRORES MÁS COMUNES
+==================
+"""
+        titulo_detalle = """
+DETALLE DE ITEMS FALLIDOS
+=========================
+"""
+        return self.stream.cerrar(encabezado, titulo_detalle)
+
 def leer_archivo_excel(ruta_archivo: str) -> pd.DataFrame:
     """Lee el archivo Excel y valida las columnas requeridas"""
     print(f"   📖 Leyendo archivo: {ruta_archivo}")
@@ -259,8 +579,14 @@ def leer_archivo_excel(ruta_archivo: str) -> pd.DataFrame:
     print(f"   ✅ Estructura del archivo válida: todas las columnas requeridas presentes")
     return df
 
-def procesar_actualizacion(archivo_excel: str, tienda: str = "CO") -> Dict[str, Any]:
-    """Procesa la actualización completa de datos"""
+def procesar_actualizacion(archivo_excel: str, tienda: str = "CO", batch_size: int = 10,
+                           concurrente: bool = False, rpm: float = RATE_RPM_DEFAULT,
+                           archivo_reporte: Optional[str] = None,
+                           verificar: bool = False) -> Dict[str, Any]:
+    """
+    Procesa la actualización completa de datos; el reporte se escribe mientras avanza.
+    Con `verificar` se comprueba lo escrito sin una segunda pasada completa de validación.
+    """
     print(f"🚀 Iniciando actualización para tienda: {tienda}")
     print("=" * 60)
     
@@ -278,51 +604,56 @@ def procesar_actualizacion(archivo_excel: str, tienda: str = "CO") -> Dict[str,
         print(f"❌ Error: Tienda {tienda} no encontrada. Tiendas disponibles: {list(TIENDAS_ML.keys())}")
         return None
     
-    actualizador = ActualizadorML(TIENDAS_ML[tienda])
+    actualizador = ActualizadorML(TIENDAS_ML[tienda], rpm=rpm)
     print(f"✅ Actualizador configurado para tienda: {tienda}")
     
     # Preparar datos para actualización
     print("\n📊 Paso 3/4: Preparando datos para actualización...")
-    items_data = []
-    items_ignorados = 0
-    
-    for idx, row in df.iterrows():
-        item_id = row['ID']
-        if pd.isna(item_id):
-            items_ignorados += 1
-            continue
-        
-        payload = actualizador.construir_payload(row.to_dict())
-        if not payload:
-            print(f"   ⚠️  Item {item_id} ignorado: no hay datos válidos para actualizar")
-            items_ignorados += 1
-            continue
-        
-        items_data.append({
-            'id': str(item_id),
-            'payload': payload,
-            'datos_originales': row.to_dict()
-        })
+    items_data, rechazados, sin_id = compilar_payloads(df)
+    del df
+    items_ignorados = sin_id + int((~rechazados['enviado']).sum())
     
+    archivo_reporte = archivo_reporte or f"reporte_actualizacion_{tienda}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.txt"
     print(f"✅ Preparados {len(items_data)} items para actualización")
     if items_ignorados > 0:
-        print(f"⚠️  {items_ignorados} items ignorados (sin datos válidos)")
+        print(f"⚠️  {items_ignorados} items ignorados (sin ID o sin datos válidos)")
+    if len(rechazados) > 0:
+        archivo_rechazados = f"{os.path.splitext(archivo_reporte)[0]}_rechazados.csv"
+        rechazados.to_csv(archivo_rechazados, index=False, encoding="utf-8")
+        print(f"⚠️  {len(rechazados)} filas con celdas inválidas → {archivo_rechazados}")
+        for motivo, cantidad in rechazados['motivo'].value_counts().items():
+            print(f"   • {motivo}: {cantidad}")
     
     # Actualizar items
     print("\n🌐 Paso 4/4: Actualizando items en MercadoLibre...")
-    resultados = actualizador.actualizar_items_lote(items_data)
-    
-    print(f"✅ Actualización completada: {len(resultados)} items procesados")
+    reporte = ReporteActualizacion(tienda, archivo_reporte)
+    reporte.ignorados = items_ignorados
+    verificador = VerificadorPostEscritura(reporte) if verificar else None
+    actualizador.actualizar_items_lote(items_data, batch_size=batch_size, concurrente=concurrente,
+                                       al_resultado=verificador.registrar if verificador else reporte.registrar)
+    del items_data
+    if verificador:
+        verificador.verificar_pendientes(TIENDAS_ML[tienda], rpm=rpm)
+        print(f"🔎 Verificación: {verificador.desde_respuesta} por respuesta PUT, "
+              f"{verificador.por_multiget} por multiget, {verificador.discrepancias} con discrepancias")
+    
+    total_items = reporte.exitosos + reporte.fallidos
+    print(f"✅ Actualización completada: {total_items} items procesados")
     print("=" * 60)
     
+    print(f"\n📋 Generando reporte: {archivo_reporte}")
+    resumen = reporte.cerrar()
+    
     return {
         'tienda': tienda,
-        'total_items': len(resultados),
-        'items_exitosos': sum(1 for r in resultados if r['exitoso']),
-        'items_fallidos': sum(1 for r in resultados if not r['exitoso']),
+        'total_items': total_items,
+        'items_exitosos': reporte.exitosos,
+        'items_fallidos': reporte.fallidos,
         'items_ignorados': items_ignorados,
-        'resultados': resultados,
-        'fecha_procesamiento': datetime.now().isoformat()
+        'items_con_discrepancias': verificador.discrepancias if verificador else None,
+        'archivo_reporte': archivo_reporte,
+        'reporte': resumen,
+        'fecha_procesamiento': reporte.fecha
     }
 
 def generar_reporte(resultados: Dict[str, Any], archivo_salida: str = None) -> str:
@@ -330,68 +661,20 @@ def generar_reporte(resultados: Dict[str, Any], archivo_salida: str = None) -> s
     if not resultados:
         return "No hay resultados para reportar"
     
-    print("📊 Generando reporte detallado...")
-    
-    # Calcular estadísticas
-    total_items = resultados['total_items']
-    items_exitosos = resultados['items_exitosos']
-    items_fallidos = resultados['items_fallidos']
-    items_ignorados = resultados['items_ignorados']
-    
-    print(f"   📈 Calculando estadísticas: {total_items} items totales")
-    
-    # Contar errores por tipo
-    print("   🔍 Analizando errores...")
-    errores_por_tipo = {}
-    for resultado in resultados['resultados']:
-        if not resultado['exitoso']:
-            error = resultado.get('error', 'Error desconocido')
-            tipo_error = error.split(':')[0] if ':' in error else error
-            errores_por_tipo[tipo_error] = errores_por_tipo.get(tipo_error, 0) + 1
-    
-    # Generar reporte
-    reporte = f"""
-REPORTE DE ACTUALIZACIÓN MERCADOLIBRE
-=====================================
-Tienda: {resultados['tienda']}
-Fecha: {resultados['fecha_procesamiento']}
-Total de items procesados: {total_items}
-
-ESTADÍSTICAS GENERALES
-=====================
-Items actualizados exitosamente: {items_exitosos} ({items_exitosos/total_items*100:.1f}%)
-Items fallidos: {items_fallidos} ({items_fallidos/total_items*100:.1f}%)
-Items ignorados: {items_ignorados}
-
-ERRORES MÁS COMUNES
-==================
-"""
-    
-    for tipo_error, cantidad in sorted(errores_por_tipo.items(), key=lambda x: x[1], reverse=True):
-        reporte += f"{tipo_error}: {cantidad} ocurrencias\n"
-    
-    reporte += f"""
-DETALLE DE ITEMS FALLIDOS
-=========================
-"""
+    # procesar_actualizacion ya escribió el reporte mientras llegaban los resultados
+    if 'resultados' not in resultados:
+        origen = resultados.get('archivo_reporte')
+        if archivo_salida and origen and os.path.abspath(origen) != os.path.abspath(archivo_salida):
+            shutil.copyfile(origen, archivo_salida)
+        return resultados.get('reporte', '')
     
+    print("📊 Generando reporte detallado...")
+    reporte = ReporteActualizacion(resultados['tienda'], archivo_salida)
+    reporte.fecha = resultados['fecha_procesamiento']
+    reporte.ignorados = resultados.get('items_ignorados', 0)
     for resultado in resultados['resultados']:
-        if not resultado['exitoso']:
-            reporte += f"\nID: {resultado['id']}\n"
-            reporte += f"Error: {resultado.get('error', 'Error desconocido')}\n"
-            reporte += f"Código de respuesta: {resultado.get('codigo_respuesta', 'N/A')}\n"
-            if 'datos_enviados' in resultado:
-                reporte += f"Datos enviados: {json.dumps(resultado['datos_enviados'], indent=2)}\n"
-            reporte += "-" * 50 + "\n"
-    
-    # Guardar reporte si se especifica archivo
-    if archivo_salida:
-        print(f"💾 Guardando reporte en: {archivo_salida}")
-        with open(archivo_salida, 'w', encoding='utf-8') as f:
-            f.write(reporte)
-        print(f"✅ Reporte guardado exitosamente")
-    
-    return reporte
+        reporte.registrar(resultado)
+    return reporte.cerrar()
 
 def main():
     """Función principal"""
@@ -403,7 +686,13 @@ def main():
                        help='Tienda a procesar (default: CO)')
     parser.add_argument('--salida', help='Archivo de salida para el reporte')
     parser.add_argument('--batch-size', type=int, default=10, 
-                       help='Tamaño del lote para procesamiento (default: 10)')
+                       help='Tamaño del lote (en modo --concurrente: requests simultáneos) (default: 10)')
+    parser.add_argument('--concurrente', action='store_true',
+                       help='Actualizar con pool de hilos limitado por tasa en lugar de pausas fijas')
+    parser.add_argument('--rpm', type=float, default=RATE_RPM_DEFAULT,
+                       help=f'Requests por minuto permitidos para la tienda (default: {RATE_RPM_DEFAULT})')
+    parser.add_argument('--verificar', action='store_true',
+                       help='Verificar lo escrito con la respuesta del PUT (multiget solo para respuestas ambiguas)')
     
     args = parser.parse_args()
     
@@ -412,6 +701,7 @@ def main():
     print(f"📁 Archivo: {args.archivo_excel}")
     print(f"🏪 Tienda: {args.tienda}")
     print(f"📦 Tamaño de lote: {args.batch_size}")
+    print(f"⚙️  Modo: {'concurrente' if args.concurrente else 'secuencial'}")
     print(f"⏰ Inicio: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
     print("=" * 50)
     
@@ -420,19 +710,17 @@ def main():
         print(f"❌ Error: El archivo {args.archivo_excel} no existe")
         return
     
-    # Procesar actualización
+    # Procesar actualización (el reporte se escribe en streaming)
+    archivo_reporte = args.salida or f"reporte_actualizacion_{args.tienda}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.txt"
     print("\n🚀 Iniciando proceso de actualización...")
-    resultados = procesar_actualizacion(args.archivo_excel, args.tienda)
+    resultados = procesar_actualizacion(args.archivo_excel, args.tienda, batch_size=args.batch_size,
+                                        concurrente=args.concurrente, rpm=args.rpm,
+                                        archivo_reporte=archivo_reporte, verificar=args.verificar)
     
     if not resultados:
         print("❌ Error en el procesamiento")
         return
     
-    # Generar reporte
-    archivo_reporte = args.salida or f"reporte_actualizacion_{args.tienda}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.txt"
-    print(f"\n📋 Generando reporte: {archivo_reporte}")
-    reporte = generar_reporte(resultados, archivo_reporte)
-    
     # Mostrar resumen en consola
     print("\n" + "="*60)
     print("📊 RESUMEN EJECUTIVO")
@@ -447,6 +735,8 @@ def main():
     print(f"✅ Items actualizados: {items_exitosos} ({items_exitosos/total_items*100:.1f}%)")
     print(f"❌ Items fallidos: {items_fallidos} ({items_fallidos/total_items*100:.1f}%)")
     print(f"⚠️  Items ignorados: {items_ignorados}")
+    if resultados['items_con_discrepancias'] is not None:
+        print(f"🔎 Items con discrepancias tras escribir: {resultados['items_con_discrepancias']}")
     print(f"📄 Reporte completo: {archivo_reporte}")
     print(f"⏰ Finalizado: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
     print("="*60)
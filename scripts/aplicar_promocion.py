@@ -1,77 +1,268 @@
 import os
 import time
-import pandas as pd
-import requests
+import asyncio
 import logging
+import argparse
+import pandas as pd
 from dotenv import load_dotenv
-from concurrent.futures import ThreadPoolExecutor, as_completed
-from threading import BoundedSemaphore
-
-# Configuración de logging
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(asctime)s [%(levelname)s] %(message)s",
-    handlers=[
-        logging.FileHandler("log_promociones_CO.log"),
-        logging.StreamHandler()
-    ]
-)
+
+from ml_comun import API_URL, RATE_RPM_DEFAULT, ClienteMLAsync, JournalItems
 
 # Cargar variables de entorno
 load_dotenv()
 
-PROMOTION_ID = os.getenv("CO_PROMOTION_ID")
-ACCESS_TOKEN = os.getenv("CO_ACCESS_TOKEN")
 EXCEL_PATH = "../Data/Promociones/CO.csv"
+OUTPUT_DIR = os.path.join("Output", "Promociones")
+
+PROMO_TYPE = "DEAL"
+RATE_RPM = RATE_RPM_DEFAULT   # tasa sostenida permitida por tienda (token bucket compartido)
+MAX_CONC = 16                 # corrutinas enviando POST; el ritmo real lo fija el limitador
+TOLERANCIA_PRECIO = 0.01
+
+# Estados de participación que se leen para el índice (mismo endpoint que get_candidates)
+ESTADOS_INDICE = ["candidate", "started", "pending"]
+ESTADOS_ACTIVOS = {"started", "pending"}
+LIMIT_PAGINA = 100
 
-HEADERS = {
-    "Authorization": f"Bearer {ACCESS_TOKEN}",
-    "Content-Type": "application/json"
+TIENDAS = {
+    code: {
+        "access_token": os.getenv(f"{code}_ACCESS_TOKEN"),
+        "refresh_token": os.getenv(f"{code}_REFRESH_TOKEN"),
+        "client_id": os.getenv(f"{code}_CLIENT_ID"),
+        "client_secret": os.getenv(f"{code}_CLIENT_SECRET"),
+        "promotion_id": os.getenv(f"{code}_PROMOTION_ID"),
+        "name": code
+    }
+    for code in ["CO", "DS", "TE", "TS", "CA"]
 }
 
-# Límite: 20 solicitudes por segundo
-RATE_LIMIT = 20
-semaphore = BoundedSemaphore(RATE_LIMIT)
+
+def configurar_logging(code):
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s [%(levelname)s] %(message)s",
+        handlers=[
+            logging.FileHandler(f"log_promociones_{code}.log"),
+            logging.StreamHandler()
+        ]
+    )
+
+
+def leer_items(ruta):
+    """Lee el archivo de la promoción (PublicacionID, PrecioOferta); el último precio prevalece por ID"""
+    df = pd.read_csv(ruta) if ruta.endswith(".csv") else pd.read_excel(ruta)
+    ids = df["PublicacionID"].astype("string").str.strip()
+    precios = pd.to_numeric(df["PrecioOferta"], errors="coerce")
+    validos = (ids.notna() & (ids.str.len() >= 8) & precios.notna()).fillna(False).astype(bool)
+    descartadas = len(df) - int(validos.sum())
+    if descartadas:
+        logging.warning(f"⚠️ {descartadas} filas descartadas por ID o precio inválido")
+    items = dict(zip(ids[validos].tolist(), precios[validos].astype(float).tolist()))
+    return list(items.items())
+
+
+def ruta_journal(code, promotion_id):
+    return os.path.join(OUTPUT_DIR, f"{code}_{promotion_id}_journal.csv")
+
+
+def aplicados_en_journal(ruta):
+    """id → deal_price de los items que ya quedaron aplicados en corridas anteriores"""
+    aplicados = {}
+    for item_id, fila in JournalItems.leer_ultimo_estado(ruta).items():
+        if fila["estado"] == "OK":
+            try:
+                aplicados[item_id] = float(fila["deal_price"])
+            except (TypeError, ValueError):
+                continue
+    return aplicados
+
+
+async def recorrer_estado(cliente, promotion_id, promo_type, estado, indice):
+    """Pagina los items de la promoción en un estado y los agrega al índice; False si falló"""
+    url = f"{API_URL}/seller-promotions/promotions/{promotion_id}/items"
+    params = {"promotion_type": promo_type, "status": estado, "limit": LIMIT_PAGINA, "app_version": "v2"}
+    leidos = 0
+    while True:
+        status, data = await cliente.get(url, params=params, headers={"version": "v2"})
+        if status != 200:
+            logging.warning(f"⚠️ [{status}] no se pudo leer la promoción {promotion_id} ({estado}): {data}")
+            return False
+        items = data.get("results", [])
+        for item in items:
+            indice[item["id"]] = (item.get("status") or estado, item.get("price"))
+        leidos += len(items)
+        paging = data.get("paging", {})
+        search_after = paging.get("searchAfter")
+        if not items or not search_after or leidos >= (paging.get("total") or 0):
+            return True
+        params["search_after"] = search_after
+
+
+async def cargar_indice(cliente, promotion_id, promo_type=PROMO_TYPE):
+    """
+    Índice id → (status, price) de la participación actual en la promoción.
+    Un cursor concurrente por estado; `completo` es False si alguno falló.
+    """
+    indice = {}
+    resultados = await asyncio.gather(*(
+        recorrer_estado(cliente, promotion_id, promo_type, estado, indice) for estado in ESTADOS_INDICE))
+    return indice, all(resultados)
 
 
-def aplicar_promocion(item_id, deal_price):
-    url = f"https://api.mercadolibre.com/seller-promotions/items/{item_id}?app_version=v2"
+def mismo_precio(a, b, tolerancia=TOLERANCIA_PRECIO):
+    """Diferencia dentro de la tolerancia; el margen absorbe el error de punto flotante (100.01 - 100.00)"""
+    return abs(float(a) - float(b)) <= tolerancia + 1e-9
+
+
+def pendientes_sin_indice(items, aplicados, tolerancia=TOLERANCIA_PRECIO):
+    """Índice incompleto: se envía todo como alta salvo lo ya aplicado con el mismo precio según el journal"""
+    return [(i, p, "alta") for i, p in items if i not in aplicados or not mismo_precio(aplicados[i], p, tolerancia)]
+
+
+def planificar(items, indice, tolerancia=TOLERANCIA_PRECIO):
+    """
+    Cruza el archivo con el índice de participación:
+      - candidate → alta (POST); started/pending con otro precio → cambio (PUT)
+      - started/pending con el mismo precio → sin cambio; fuera del índice → no elegible
+    """
+    envios = []
+    conteos = {"alta": 0, "cambio": 0, "sin_cambio": 0, "no_elegible": 0}
+    for item_id, deal_price in items:
+        estado, precio = indice.get(item_id, (None, None))
+        if estado in ESTADOS_ACTIVOS:
+            if precio is not None and mismo_precio(precio, deal_price, tolerancia):
+                conteos["sin_cambio"] += 1
+                continue
+            accion = "cambio"
+        elif estado == "candidate":
+            accion = "alta"
+        else:
+            conteos["no_elegible"] += 1
+            continue
+        conteos[accion] += 1
+        envios.append((item_id, deal_price, accion))
+    return envios, conteos
+
+
+async def aplicar_item(cliente, promotion_id, promo_type, item_id, deal_price, accion="alta"):
+    url = f"{API_URL}/seller-promotions/items/{item_id}"
     payload = {
         "deal_price": deal_price,
-        "promotion_id": PROMOTION_ID,
-        "promotion_type": "DEAL"
+        "promotion_id": promotion_id,
+        "promotion_type": promo_type
     }
+    metodo = cliente.put if accion == "cambio" else cliente.post
+    return await metodo(url, params={"app_version": "v2"}, json=payload)
 
-    with semaphore:
-        try:
-            response = requests.post(url, headers=HEADERS, json=payload)
-            status = response.status_code
 
-            if response.ok:
-                logging.info(f"✅ [{status}] {item_id} - {PROMOTION_ID} → promoción aplicada con precio {deal_price}")
-            else:
-                logging.warning(f"⚠️ [{status}] {item_id} - {PROMOTION_ID} → error aplicando promoción: {response.text}")
-        except Exception as e:
-            logging.error(f"❌ {item_id} → excepción al aplicar promoción: {str(e)}")
+async def aplicar_promocion(code, store, items, promotion_id=None, promo_type=PROMO_TYPE,
+                            rpm=RATE_RPM, concurrencia=MAX_CONC, progreso=None):
+    """
+    Aplica la promoción a los (item_id, deal_price) de una tienda.
+    Primero carga el índice de participación y solo envía altas y cambios de precio.
+    Si el índice no se pudo leer completo, se envía todo salvo lo ya aplicado según el journal.
+    `progreso` (dict opcional) se actualiza en vivo y es el mismo resumen que se devuelve.
+    """
+    promotion_id = promotion_id or store["promotion_id"]
+    os.makedirs(OUTPUT_DIR, exist_ok=True)
+    journal_path = ruta_journal(code, promotion_id)
+    resumen = progreso if progreso is not None else {}
+    resumen.update({"tienda": code, "promotion_id": promotion_id, "total": len(items), "fase": "indice",
+                    "pendientes": 0, "ya_aplicados": 0, "ok": 0, "fallidos": 0, "journal": journal_path})
+
+    async with ClienteMLAsync(store, nombre=code, rpm=rpm) as cliente:
+        indice, completo = await cargar_indice(cliente, promotion_id, promo_type)
+        if completo:
+            pendientes, plan = planificar(items, indice)
+            resumen["ya_aplicados"] = plan["sin_cambio"]
+            resumen["plan"] = plan
+            logging.info(f"[{code}] Índice de la promoción: {len(indice)} items; plan: {plan}")
+        else:
+            aplicados = aplicados_en_journal(journal_path)
+            pendientes = pendientes_sin_indice(items, aplicados)
+            resumen["ya_aplicados"] = len(items) - len(pendientes)
+            logging.warning(f"⚠️ [{code}] Índice incompleto: se omiten solo los "
+                            f"{resumen['ya_aplicados']} items ya aplicados según {journal_path}")
+        resumen["pendientes"] = len(pendientes)
+        if not pendientes:
+            resumen["fase"] = "terminado"
+            return resumen
+
+        resumen["fase"] = "enviando"
+        cola = asyncio.Queue()
+        for envio in pendientes:
+            cola.put_nowait(envio)
+        journal = JournalItems(journal_path, extras=["deal_price", "accion"])
+        start = time.time()
 
-        time.sleep(1 / RATE_LIMIT)  # Espera para respetar 20/s
+        async def worker():
+            while True:
+                try:
+                    item_id, deal_price, accion = cola.get_nowait()
+                except asyncio.QueueEmpty:
+                    return
+                status, cuerpo = await aplicar_item(cliente, promotion_id, promo_type, item_id, deal_price, accion)
+                if status is not None and 200 <= status < 300:
+                    resumen["ok"] += 1
+                    journal.registrar(item_id, "OK", status, deal_price=deal_price, accion=accion)
+                    logging.info(f"✅ [{status}] {item_id} - {promotion_id} → promoción aplicada con precio {deal_price}")
+                else:
+                    resumen["fallidos"] += 1
+                    mensaje = cuerpo.get("message", str(cuerpo)) if isinstance(cuerpo, dict) else str(cuerpo)
+                    journal.registrar(item_id, "FAIL", status, mensaje, deal_price=deal_price, accion=accion)
+                    logging.warning(f"⚠️ [{status}] {item_id} - {promotion_id} → error aplicando promoción: {mensaje}")
+
+                procesados = resumen["ok"] + resumen["fallidos"]
+                if procesados % 1000 == 0:
+                    velocidad = procesados / max(time.time() - start, 1e-6)
+                    logging.info(f"[{code}] {procesados}/{len(pendientes)} procesados ({velocidad:.1f} items/s)")
+
+        try:
+            await asyncio.gather(*(worker() for _ in range(max(1, concurrencia))))
+        finally:
+            journal.cerrar()
+        resumen["conteos_http"] = dict(cliente.conteos)
+        resumen["duracion"] = time.time() - start
+        resumen["fase"] = "terminado"
+
+    return resumen
 
 
 def main():
+    parser = argparse.ArgumentParser(description='Aplicar una promoción a las publicaciones de un archivo')
+    parser.add_argument('--tienda', default='CO', choices=list(TIENDAS.keys()))
+    parser.add_argument('--archivo', default=EXCEL_PATH, help='CSV/Excel con PublicacionID y PrecioOferta')
+    parser.add_argument('--promocion', help='ID de la promoción (default: <TIENDA>_PROMOTION_ID)')
+    parser.add_argument('--tipo', default=PROMO_TYPE, help=f'promotion_type (default: {PROMO_TYPE})')
+    parser.add_argument('--rpm', type=float, default=RATE_RPM, help=f'Requests por minuto (default: {RATE_RPM})')
+    parser.add_argument('--concurrencia', type=int, default=MAX_CONC)
+    args = parser.parse_args()
+
+    configurar_logging(args.tienda)
+    store = TIENDAS[args.tienda]
     try:
-        df = pd.read_csv(EXCEL_PATH)
-        print(df.columns)
-        items = [(str(row["PublicacionID"]).strip(), float(row["PrecioOferta"])) for _, row in df.iterrows()]
+        items = leer_items(args.archivo)
+    except FileNotFoundError:
+        logging.error(f"❌ Archivo no encontrado: {args.archivo}")
+        return
+    except KeyError as e:
+        logging.error(f"❌ Columna faltante en {args.archivo}: {e}")
+        return
 
-        with ThreadPoolExecutor(max_workers=RATE_LIMIT) as executor:
-            futures = [executor.submit(aplicar_promocion, item_id, deal_price) for item_id, deal_price in items]
-            for future in as_completed(futures):
-                pass  # Ya se maneja el log en `aplicar_promocion`
+    logging.info(f"[{args.tienda}] {len(items)} items a {args.rpm:.0f} rpm con {args.concurrencia} corrutinas")
+    resumen = asyncio.run(aplicar_promocion(
+        args.tienda, store, items, args.promocion, args.tipo, args.rpm, args.concurrencia))
+
+    logging.info(
+        f"[{args.tienda}] Total {resumen['total']}: {resumen['ok']} OK, {resumen['fallidos']} fallidos, "
+        f"{resumen['ya_aplicados']} ya aplicados con el mismo precio"
+    )
+    if resumen.get("conteos_http"):
+        logging.info(f"[{args.tienda}] HTTP: {resumen['conteos_http']}")
+    if resumen.get("plan", {}).get("no_elegible"):
+        logging.info(f"[{args.tienda}] {resumen['plan']['no_elegible']} items no son candidatos de la promoción")
+    logging.info(f"[{args.tienda}] Journal: {ruta_journal(args.tienda, resumen['promotion_id'])}")
 
-    except FileNotFoundError:
-        logging.error(f"❌ Archivo no encontrado: {EXCEL_PATH}")
-    except Exception as e:
-        logging.error(f"⚠️ Error general en ejecución: {e}")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
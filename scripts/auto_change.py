@@ -1,3 +1,4 @@
+import os
 import pandas as pd
 
 class ChangeStatus():
@@ -5,11 +6,18 @@ class ChangeStatus():
         print("\t Inicializando datos...")
     
     def load_data(self):
-        self.general_CO = pd.read_csv("../Data/Generales/General-CO.csv", low_memory=False)
-        self.general_DS = pd.read_csv("../Data/Generales/General-DS.csv", low_memory=False)
-        self.general_TE = pd.read_csv("../Data/Generales/General-TE.csv", low_memory=False)
-        self.general_TS = pd.read_csv("../Data/Generales/General-TS.csv", low_memory=False)
-        self.general_CA = pd.read_csv("../Data/Generales/General-CA.csv", low_memory=False)
+        self.general_CO = self.load_general("CO")
+        self.general_DS = self.load_general("DS")
+        self.general_TE = self.load_general("TE")
+        self.general_TS = self.load_general("TS")
+        self.general_CA = self.load_general("CA")
+
+    def load_general(self, tienda):
+        # El export Parquet (get_publicaciones_ml) carga mucho más rápido; el CSV queda como respaldo
+        ruta = f"../Data/Generales/General-{tienda}"
+        if os.path.exists(f"{ruta}.parquet"):
+            return pd.read_parquet(f"{ruta}.parquet")
+        return pd.read_csv(f"{ruta}.csv", low_memory=False)
 
 def print_menu_hero():
     print("\n=============== SISTEMA DE PAUSADO/ACTIVACION CARDIC AUTOMOTRIZ ===============")
@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+"""
+Campañas de promociones multi-tienda
+Lee un manifiesto (CSV/Excel) con columnas: tienda, promotion_id, tipo, archivo
+y ejecuta todas las entradas a la vez con aplicar_promocion:
+- cada tienda consume su propio limitador (entradas de la misma tienda lo comparten)
+- una vista de progreso consolidada cada pocos segundos
+- un resumen por entrada en Output/Promociones/campana_<timestamp>.csv (los journals quedan por entrada)
+La duración total queda acotada por la tienda más lenta, no por la suma de todas
+"""
+
+import os
+import time
+import asyncio
+import logging
+from datetime import datetime
+from typing import Any, Dict, List
+
+import pandas as pd
+
+from aplicar_promocion import (
+    MAX_CONC, OUTPUT_DIR, PROMO_TYPE, RATE_RPM, TIENDAS, aplicar_promocion, leer_items,
+)
+
+# === CONFIGURACIÓN ===
+COLUMNAS_MANIFIESTO = ["tienda", "promotion_id", "tipo", "archivo"]
+INTERVALO_PROGRESO = 5  # segundos entre líneas de progreso
+COLUMNAS_RESUMEN = ["tienda", "promotion_id", "tipo", "archivo", "total", "ya_aplicados",
+                    "pendientes", "ok", "fallidos", "duracion", "journal", "error"]
+
+
+def leer_manifiesto(ruta: str) -> List[Dict[str, str]]:
+    """Lee y valida el manifiesto; `tipo` vacío usa PROMO_TYPE"""
+    df = pd.read_excel(ruta, dtype=str) if ruta.endswith(".xlsx") else pd.read_csv(ruta, dtype=str)
+    df.columns = [c.strip().lower() for c in df.columns]
+    faltantes = [c for c in COLUMNAS_MANIFIESTO if c not in df.columns and c != "tipo"]
+    if faltantes:
+        raise ValueError(f"Columnas faltantes en el manifiesto: {faltantes}")
+    if "tipo" not in df.columns:
+        df["tipo"] = PROMO_TYPE
+    df = df[COLUMNAS_MANIFIESTO].fillna("").apply(lambda col: col.str.strip())
+    df["tipo"] = df["tipo"].replace("", PROMO_TYPE).str.upper()
+    df["tienda"] = df["tienda"].str.upper()
+
+    desconocidas = sorted(set(df["tienda"]) - set(TIENDAS))
+    if desconocidas:
+        raise ValueError(f"Tiendas desconocidas en el manifiesto: {desconocidas}")
+    sin_promocion = df["promotion_id"] == ""
+    if sin_promocion.any():
+        raise ValueError(f"Filas sin promotion_id en el manifiesto: {(df.index[sin_promocion] + 2).tolist()}")
+    return df.drop_duplicates(subset=["tienda", "promotion_id"], keep="last").to_dict("records")
+
+
+def texto_progreso(progresos: List[Dict[str, Any]]) -> str:
+    partes = []
+    for p in progresos:
+        etiqueta = f"{p['tienda']}:{p['promotion_id']}"
+        if p.get("error"):
+            partes.append(f"{etiqueta} error")
+        elif p.get("fase") == "enviando":
+            hechos = p["ok"] + p["fallidos"]
+            partes.append(f"{etiqueta} {hechos}/{p['pendientes']} ({p['fallidos']} fallidos)")
+        else:
+            partes.append(f"{etiqueta} {p.get('fase', 'en cola')}")
+    return " | ".join(partes)
+
+
+async def ejecutar_entrada(entrada: Dict[str, str], progreso: Dict[str, Any],
+                           rpm: float, concurrencia: int):
+    try:
+        items = leer_items(entrada["archivo"])
+        await aplicar_promocion(entrada["tienda"], TIENDAS[entrada["tienda"]], items,
+                                entrada["promotion_id"], entrada["tipo"], rpm, concurrencia, progreso)
+    except Exception as e:
+        progreso["error"] = f"{type(e).__name__}: {e}"
+        progreso["fase"] = "error"
+        logging.error(f"❌ [{entrada['tienda']}:{entrada['promotion_id']}] {progreso['error']}")
+
+
+async def ejecutar_campana(entradas: List[Dict[str, str]], rpm: float = RATE_RPM,
+                           concurrencia: int = MAX_CONC) -> List[Dict[str, Any]]:
+    """Ejecuta todas las entradas concurrentemente; devuelve un resumen por entrada"""
+    progresos = [{"tienda": e["tienda"], "promotion_id": e["promotion_id"], "tipo": e["tipo"],
+                  "archivo": e["archivo"], "fase": "en cola", "ok": 0, "fallidos": 0, "pendientes": 0}
+                 for e in entradas]
+
+    async def vista_progreso():
+        while True:
+            await asyncio.sleep(INTERVALO_PROGRESO)
+            print(f"⏳ {texto_progreso(progresos)}")
+
+    vista = asyncio.create_task(vista_progreso())
+    try:
+        await asyncio.gather(*(ejecutar_entrada(e, p, rpm, concurrencia) for e, p in zip(entradas, progresos)))
+    finally:
+        vista.cancel()
+    return progresos
+
+
+def guardar_resumen(progresos: List[Dict[str, Any]]) -> str:
+    os.makedirs(OUTPUT_DIR, exist_ok=True)
+    ruta = os.path.join(OUTPUT_DIR, f"campana_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv")
+    pd.DataFrame(progresos).reindex(columns=COLUMNAS_RESUMEN).to_csv(ruta, index=False, encoding="utf-8")
+    return ruta
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Ejecuta una campaña de promociones en varias tiendas a la vez')
+    parser.add_argument('manifiesto', help='CSV/Excel con columnas tienda, promotion_id, tipo, archivo')
+    parser.add_argument('--rpm', type=float, default=RATE_RPM, help=f'Requests por minuto por tienda (default: {RATE_RPM})')
+    parser.add_argument('--concurrencia', type=int, default=MAX_CONC, help='Corrutinas por entrada')
+    args = parser.parse_args()
+
+    # Detalle por item solo al archivo de log; en consola únicamente advertencias y la vista de progreso
+    consola = logging.StreamHandler()
+    consola.setLevel(logging.WARNING)
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s [%(levelname)s] %(message)s",
+        handlers=[logging.FileHandler("log_campana_promociones.log"), consola],
+    )
+
+    try:
+        entradas = leer_manifiesto(args.manifiesto)
+    except (OSError, ValueError) as e:
+        print(f"❌ Error leyendo manifiesto: {e}")
+        return
+
+    print("🎯 CAMPAÑA DE PROMOCIONES MERCADOLIBRE")
+    print("=" * 50)
+    for e in entradas:
+        print(f"   {e['tienda']}: {e['promotion_id']} ({e['tipo']}) ← {e['archivo']}")
+    print(f"⏰ Inicio: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
+    print("=" * 50)
+
+    start = time.time()
+    progresos = asyncio.run(ejecutar_campana(entradas, args.rpm, args.concurrencia))
+    ruta = guardar_resumen(progresos)
+
+    print("\n" + "=" * 60)
+    print("📊 RESUMEN DE LA CAMPAÑA")
+    print("=" * 60)
+    for p in progresos:
+        etiqueta = f"{p['tienda']}:{p['promotion_id']}"
+        if p.get("error"):
+            print(f"❌ {etiqueta}: {p['error']}")
+            continue
+        print(f"✅ {etiqueta}: {p['ok']} OK, {p['fallidos']} fallidos, "
+              f"{p['ya_aplicados']} sin cambio de {p['total']} ({p.get('duracion', 0):.1f}s)")
+    print(f"⏱️  Duración total: {time.time() - start:.1f}s")
+    print(f"📄 Resumen: {ruta}")
+    print("=" * 60)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,386 @@
+#!/usr/bin/env python3
+"""
+Ciclo de eliminación en dos fases: cerrar → verificar → eliminar
+Toma los IDs candidatos (por defecto ELIMINAR_SIN_VENTAS.xlsx de get_delete_items, una hoja por tienda)
+y los mueve por un pipeline en streaming:
+- verificar: multiget de estado en lotes de 20; activos → cerrar, cerrados → eliminar, 404 → terminado
+- cerrar: PUT status=closed y vuelve a verificar
+- eliminar: PUT deleted=true
+Cada fase consume su propio presupuesto de requests/min; el estado por item queda en un journal
+por tienda (la siguiente corrida retoma solo lo no terminado) y el espejo Mongo `items`
+se actualiza con bulk_write en segundo plano (cerrados → status closed, eliminados → se borran del espejo)
+Una excepción en un item queda como FAIL en el journal sin detener los workers; un error de Mongo solo se reporta
+"""
+
+import os
+import time
+import asyncio
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+import pandas as pd
+
+from get_publicaciones_ml import TIENDAS_ML
+from ml_comun import API_URL, ClienteMLAsync, JournalItems, LimitadorTasa, decodificar_multiget
+from snapshot_catalogo import MONGO_URI, MONGO_DB, MONGO_COLECCION
+
+# === CONFIGURACIÓN ===
+ARCHIVO_CANDIDATOS = "ELIMINAR_SIN_VENTAS.xlsx"
+COLUMNA_ID = "ID de la publicación"
+OUTPUT_DIR = os.path.join("Output", "Ciclo_Eliminacion")
+
+# Presupuesto por fase (requests/min); la suma no debería pasar la cuota de la tienda
+PRESUPUESTOS_RPM = {"verificar": 150, "cerrar": 450, "eliminar": 300}
+WORKERS = {"verificar": 2, "cerrar": 8, "eliminar": 6}
+LOTE_MULTIGET = 20
+ESPERA_LOTE = 0.5     # segundos máximos juntando IDs para un multiget
+EN_VUELO = 1024       # items dentro del pipeline a la vez (memoria plana)
+MAX_CIERRES = 2       # intentos de cierre por item antes de darlo por fallido
+LOTE_MONGO = 1000     # operaciones por bulk_write
+INTERVALO_MONGO = 5   # segundos máximos entre bulk_write del espejo
+INTERVALO_PROGRESO = 10
+
+
+def leer_candidatos(ruta: str, tiendas: List[str]) -> Dict[str, List[str]]:
+    """IDs por tienda: una hoja por origen con la columna 'ID de la publicación'"""
+    hojas = pd.read_excel(ruta, sheet_name=None, dtype={COLUMNA_ID: str})
+    candidatos = {}
+    for tienda in tiendas:
+        df = hojas.get(tienda)
+        if df is None or COLUMNA_ID not in df.columns:
+            continue
+        ids = df[COLUMNA_ID].dropna().astype(str).str.strip()
+        candidatos[tienda] = ids[ids != ""].drop_duplicates().tolist()
+    return candidatos
+
+
+def ruta_journal(tienda: str) -> str:
+    return os.path.join(OUTPUT_DIR, f"{tienda}_journal.csv")
+
+
+def terminados_en_journal(ruta: str) -> set:
+    """IDs cuyo último estado ya es final (eliminado o inexistente en ML)"""
+    return {item_id for item_id, fila in JournalItems.leer_ultimo_estado(ruta).items()
+            if (fila.get("estado"), fila.get("fase")) in {("OK", "eliminar"), ("OMITIDO", "verificar")}}
+
+
+class EspejoMongo:
+    """
+    Acumula cambios del espejo `items` y los escribe con bulk_write desde una tarea aparte
+    (volcador): los workers solo encolan y un error de Mongo no toca el pipeline de items
+    """
+
+    def __init__(self, coleccion):
+        self.coleccion = coleccion
+        self.operaciones = []
+        self.errores = 0
+        self._lock = asyncio.Lock()
+        self._lleno = asyncio.Event()
+
+    def cerrado(self, item_id: str):
+        from pymongo import UpdateOne
+        self._agregar(UpdateOne({"_id": item_id}, {"$set": {"status": "closed"}}))
+
+    def eliminado(self, item_id: str):
+        from pymongo import DeleteOne
+        self._agregar(DeleteOne({"_id": item_id}))
+
+    def _agregar(self, operacion):
+        self.operaciones.append(operacion)
+        if len(self.operaciones) >= LOTE_MONGO:
+            self._lleno.set()
+
+    async def volcar(self):
+        from pymongo.errors import BulkWriteError, PyMongoError
+
+        async with self._lock:
+            operaciones, self.operaciones = self.operaciones, []
+            if not operaciones:
+                return
+            try:
+                await asyncio.to_thread(self.coleccion.bulk_write, operaciones, ordered=False)
+            except BulkWriteError as e:
+                fallidas = len(e.details.get("writeErrors", []))
+                self.errores += fallidas
+                print(f"⚠️  Espejo Mongo: {fallidas} de {len(operaciones)} operaciones fallaron")
+            except PyMongoError as e:
+                self.errores += len(operaciones)
+                print(f"⚠️  Espejo Mongo: no se pudieron escribir {len(operaciones)} operaciones: {e}")
+
+    async def volcador(self):
+        """Vuelca cada INTERVALO_MONGO segundos o apenas se juntan LOTE_MONGO operaciones"""
+        while True:
+            try:
+                await asyncio.wait_for(self._lleno.wait(), timeout=INTERVALO_MONGO)
+            except asyncio.TimeoutError:
+                pass
+            self._lleno.clear()
+            await self.volcar()
+
+
+class CicloTienda:
+    """Pipeline verificar → cerrar → eliminar de una tienda con journal y presupuestos por fase"""
+
+    def __init__(self, clave: str, tienda: Dict[str, str], espejo: Optional[EspejoMongo] = None,
+                 presupuestos: Optional[Dict[str, float]] = None):
+        self.clave = clave
+        self.tienda = tienda
+        self.espejo = espejo
+        presupuestos = presupuestos or PRESUPUESTOS_RPM
+        self.limitadores = {fase: LimitadorTasa(rpm) for fase, rpm in presupuestos.items()}
+        self.colas = {fase: asyncio.Queue() for fase in WORKERS}
+        self.cierres: Dict[str, int] = {}
+        self.conteos = {"verificados": 0, "cerrados": 0, "eliminados": 0, "ya_eliminados": 0, "fallidos": 0}
+        self.journal: Optional[JournalItems] = None
+        self.cliente: Optional[ClienteMLAsync] = None
+        self._en_vuelo = asyncio.Semaphore(EN_VUELO)
+        self._en_curso: set = set()
+        self._vacio = asyncio.Event()
+
+    # --- estado de cada item ---
+
+    def _terminar(self, item_id: str):
+        if item_id not in self._en_curso:
+            return
+        self._en_curso.discard(item_id)
+        self.cierres.pop(item_id, None)
+        self._en_vuelo.release()
+        if not self._en_curso:
+            self._vacio.set()
+
+    def _fallo(self, item_id: str, fase: str, codigo: Optional[int], detalle: str):
+        if item_id not in self._en_curso:
+            return
+        self.conteos["fallidos"] += 1
+        try:
+            self.journal.registrar(item_id, "FAIL", codigo, detalle, fase=fase)
+        except OSError as e:
+            print(f"⚠️  [{self.clave}] No se pudo escribir el journal para {item_id}: {e}")
+        finally:
+            self._terminar(item_id)
+
+    @staticmethod
+    def _mensaje(cuerpo: Any) -> str:
+        return cuerpo.get("message", str(cuerpo)) if isinstance(cuerpo, dict) else str(cuerpo)
+
+    @staticmethod
+    def _excepcion(error: Exception) -> str:
+        return f"{type(error).__name__}: {error}"
+
+    # --- fases ---
+
+    async def _verificar_lote(self, lote: List[str]):
+        try:
+            status, respuesta = await self.cliente.get(
+                f"{API_URL}/items", params={"ids": ",".join(lote), "attributes": "id,status,sub_status"},
+                limitador=self.limitadores["verificar"])
+        except Exception as e:
+            status, respuesta = None, self._excepcion(e)
+        if status != 200 or not isinstance(respuesta, list):
+            for item_id in lote:
+                self._fallo(item_id, "verificar", status, self._mensaje(respuesta))
+            return
+
+        for item_id, code, body in decodificar_multiget(lote, respuesta):
+            try:
+                self._clasificar(item_id, code, body)
+            except Exception as e:
+                self._fallo(item_id, "verificar", code, self._excepcion(e))
+
+    def _clasificar(self, item_id: str, code: Optional[int], body: Dict[str, Any]):
+        """Siguiente fase de un item según su entrada de multiget"""
+        self.conteos["verificados"] += 1
+        if code == 404 or "deleted" in (body.get("sub_status") or []):
+            self.conteos["ya_eliminados"] += 1
+            self.journal.registrar(item_id, "OMITIDO", code, "ya no existe en ML", fase="verificar")
+            if self.espejo:
+                self.espejo.eliminado(item_id)
+            self._terminar(item_id)
+        elif code != 200:
+            self._fallo(item_id, "verificar", code, self._mensaje(body))
+        elif body.get("status") == "closed":
+            self.journal.registrar(item_id, "OK", code, "closed", fase="verificar")
+            self.colas["eliminar"].put_nowait(item_id)
+        elif self.cierres.get(item_id, 0) < MAX_CIERRES:
+            self.colas["cerrar"].put_nowait(item_id)
+        else:
+            self._fallo(item_id, "verificar", code, f"sigue {body.get('status')} tras cerrar")
+
+    async def _verificador(self):
+        loop = asyncio.get_running_loop()
+        cola = self.colas["verificar"]
+        while True:
+            lote = [await cola.get()]
+            limite = loop.time() + ESPERA_LOTE
+            while len(lote) < LOTE_MULTIGET:
+                restante = limite - loop.time()
+                if restante <= 0:
+                    break
+                try:
+                    lote.append(await asyncio.wait_for(cola.get(), timeout=restante))
+                except asyncio.TimeoutError:
+                    break
+            await self._verificar_lote(lote)
+
+    async def _cerrar(self, item_id: str):
+        status, cuerpo = await self.cliente.put(f"{API_URL}/items/{item_id}", json={"status": "closed"},
+                                                limitador=self.limitadores["cerrar"])
+        if status is not None and status < 400:
+            self.conteos["cerrados"] += 1
+            self.cierres[item_id] = self.cierres.get(item_id, 0) + 1
+            self.journal.registrar(item_id, "OK", status, fase="cerrar")
+            if self.espejo:
+                self.espejo.cerrado(item_id)
+            self.colas["verificar"].put_nowait(item_id)
+        else:
+            self._fallo(item_id, "cerrar", status, self._mensaje(cuerpo))
+
+    async def _eliminar(self, item_id: str):
+        status, cuerpo = await self.cliente.put(f"{API_URL}/items/{item_id}", json={"deleted": "true"},
+                                                limitador=self.limitadores["eliminar"])
+        if status is not None and status < 400:
+            self.conteos["eliminados"] += 1
+            self.journal.registrar(item_id, "OK", status, fase="eliminar")
+            if self.espejo:
+                self.espejo.eliminado(item_id)
+            self._terminar(item_id)
+        else:
+            self._fallo(item_id, "eliminar", status, self._mensaje(cuerpo))
+
+    async def _trabajador(self, fase: str, accion):
+        """Consume la cola de una fase; una excepción en un item lo deja como FAIL y el worker sigue"""
+        cola = self.colas[fase]
+        while True:
+            item_id = await cola.get()
+            try:
+                await accion(item_id)
+            except Exception as e:
+                self._fallo(item_id, fase, None, self._excepcion(e))
+
+    async def _progreso(self, total: int):
+        while True:
+            await asyncio.sleep(INTERVALO_PROGRESO)
+            c = self.conteos
+            terminados = c["eliminados"] + c["ya_eliminados"] + c["fallidos"]
+            print(f"⏳ [{self.clave}] {terminados}/{total} | cerrados {c['cerrados']} "
+                  f"eliminados {c['eliminados']} ya eliminados {c['ya_eliminados']} fallidos {c['fallidos']}")
+
+    async def ejecutar(self, ids: List[str]) -> Dict[str, Any]:
+        os.makedirs(OUTPUT_DIR, exist_ok=True)
+        journal_path = ruta_journal(self.clave)
+        terminados = terminados_en_journal(journal_path)
+        pendientes = [item_id for item_id in ids if item_id not in terminados]
+        print(f"[{self.clave}] {len(ids)} candidatos, {len(ids) - len(pendientes)} ya terminados "
+              f"en corridas anteriores, {len(pendientes)} por procesar")
+        resumen = {"tienda": self.clave, "candidatos": len(ids), "previos": len(ids) - len(pendientes)}
+        if not pendientes:
+            return {**resumen, **self.conteos}
+
+        start = time.time()
+        self.journal = JournalItems(journal_path, extras=["fase"])
+        async with ClienteMLAsync(self.tienda, nombre=self.clave,
+                                  limitador=self.limitadores["verificar"]) as cliente:
+            self.cliente = cliente
+            tareas = [asyncio.create_task(self._verificador()) for _ in range(WORKERS["verificar"])]
+            tareas += [asyncio.create_task(self._trabajador("cerrar", self._cerrar)) for _ in range(WORKERS["cerrar"])]
+            tareas += [asyncio.create_task(self._trabajador("eliminar", self._eliminar))
+                       for _ in range(WORKERS["eliminar"])]
+            tareas.append(asyncio.create_task(self._progreso(len(pendientes))))
+            try:
+                for item_id in pendientes:
+                    await self._en_vuelo.acquire()
+                    self._en_curso.add(item_id)
+                    self._vacio.clear()
+                    self.colas["verificar"].put_nowait(item_id)
+                await self._vacio.wait()
+            finally:
+                for tarea in tareas:
+                    tarea.cancel()
+                await asyncio.gather(*tareas, return_exceptions=True)
+                self.journal.cerrar()
+                if self.espejo:
+                    await self.espejo.volcar()
+
+        duracion = time.time() - start
+        print(f"✅ [{self.clave}] {self.conteos['eliminados']} eliminados, {self.conteos['ya_eliminados']} ya "
+              f"eliminados, {self.conteos['fallidos']} fallidos en {duracion:.1f}s")
+        return {**resumen, **self.conteos, "duracion": duracion}
+
+
+async def ejecutar_ciclo(candidatos: Dict[str, List[str]], coleccion=None,
+                         presupuestos: Optional[Dict[str, float]] = None) -> List[Dict[str, Any]]:
+    """Todas las tiendas a la vez; cada una con sus propios presupuestos por fase"""
+    espejo = EspejoMongo(coleccion) if coleccion is not None else None
+    ciclos = [CicloTienda(clave, TIENDAS_ML[clave], espejo, presupuestos) for clave in candidatos]
+    volcador = asyncio.create_task(espejo.volcador()) if espejo else None
+    try:
+        resultados = await asyncio.gather(*(ciclo.ejecutar(candidatos[ciclo.clave]) for ciclo in ciclos))
+    finally:
+        if volcador:
+            volcador.cancel()
+            await asyncio.gather(volcador, return_exceptions=True)
+            await espejo.volcar()
+    if espejo and espejo.errores:
+        print(f"⚠️  {espejo.errores} cambios no llegaron al espejo Mongo; se corrigen con la próxima sincronización")
+    return resultados
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Cerrar, verificar y eliminar publicaciones candidatas')
+    parser.add_argument('--archivo', default=ARCHIVO_CANDIDATOS,
+                        help=f'Excel con una hoja por tienda (default: {ARCHIVO_CANDIDATOS})')
+    parser.add_argument('--tiendas', nargs='+', default=list(TIENDAS_ML.keys()), choices=list(TIENDAS_ML.keys()))
+    parser.add_argument('--rpm-verificar', type=float, default=PRESUPUESTOS_RPM["verificar"])
+    parser.add_argument('--rpm-cerrar', type=float, default=PRESUPUESTOS_RPM["cerrar"])
+    parser.add_argument('--rpm-eliminar', type=float, default=PRESUPUESTOS_RPM["eliminar"])
+    parser.add_argument('--sin-mongo', action='store_true', help='No actualizar el espejo Mongo `items`')
+    args = parser.parse_args()
+
+    try:
+        candidatos = leer_candidatos(args.archivo, args.tiendas)
+    except (OSError, ValueError) as e:
+        print(f"❌ Error leyendo {args.archivo}: {e}")
+        return
+    if not candidatos:
+        print(f"❌ {args.archivo} no tiene hojas para {', '.join(args.tiendas)}")
+        return
+
+    presupuestos = {"verificar": args.rpm_verificar, "cerrar": args.rpm_cerrar, "eliminar": args.rpm_eliminar}
+    print("🎯 CICLO DE ELIMINACIÓN MERCADOLIBRE")
+    print("=" * 50)
+    for clave, ids in candidatos.items():
+        print(f"   {clave}: {len(ids)} candidatos")
+    print(f"   Presupuesto rpm: {presupuestos}")
+    print(f"⏰ Inicio: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
+    print("=" * 50)
+
+    client = None
+    coleccion = None
+    if args.sin_mongo:
+        print("ℹ️  Espejo Mongo deshabilitado (--sin-mongo)")
+    elif not MONGO_URI:
+        print("⚠️  MONGO_URI no está configurado: el espejo no se actualiza")
+    else:
+        from pymongo import MongoClient
+        client = MongoClient(MONGO_URI, serverSelectionTimeoutMS=5000)
+        coleccion = client[MONGO_DB][MONGO_COLECCION]
+
+    try:
+        resultados = asyncio.run(ejecutar_ciclo(candidatos, coleccion, presupuestos))
+    finally:
+        if client:
+            client.close()
+
+    print("\nRESUMEN CICLO DE ELIMINACIÓN")
+    print("==========================")
+    for r in resultados:
+        print(f"{r['tienda']}: {r['eliminados']} eliminados, {r['ya_eliminados']} ya eliminados, "
+              f"{r['fallidos']} fallidos, {r['previos']} terminados antes (de {r['candidatos']})")
+    print("==========================")
+    print(f"Journals en {OUTPUT_DIR}; los fallidos se reintentan en la próxima corrida")
+
+
+if __name__ == "__main__":
+    main()
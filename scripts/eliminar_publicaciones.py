@@ -1,11 +1,13 @@
 import os
 import asyncio
-import aiohttp
+import argparse
 import pandas as pd
 import logging
 from dotenv import load_dotenv
-from datetime import datetime
-from tqdm.asyncio import tqdm_asyncio
+from tqdm import tqdm
+
+from ml_comun import (API_URL, RATE_RPM_DEFAULT, ClienteMLAsync, JournalItems, decodificar_multiget,
+                      obtener_limitador)
 
 load_dotenv()
 
@@ -20,70 +22,178 @@ TIENDA = {
     "nombre_tienda": "CO"
 }
 
-RATE_LIMIT = 20
-BATCH_SIZE = 19
-SLEEP_BETWEEN_BATCHES = 1.0
+EXCEL_PATH = "../Data/Eliminar/Eliminar_CO.xlsx"
+RATE_RPM = RATE_RPM_DEFAULT   # tasa inicial; el limitador adaptativo la baja con los 429 y la recupera
+MAX_CONC = 16                 # workers enviando PUT
+TAMANO_COLA = MAX_CONC * 4    # IDs en vuelo como máximo (memoria plana)
+LOTE_MULTIGET = 20            # IDs por consulta de estado en el pre-filtro
+ESTADO_YA_CERRADO = "YA_CERRADO"
 
 nombre_tienda = TIENDA["nombre_tienda"]
 LOG_FILENAME = f"../logs/{nombre_tienda}_eliminados.log"
-logging.basicConfig(
-    filename=LOG_FILENAME,
-    level=logging.INFO,
-    format="%(asctime)s - %(levelname)s - %(message)s"
-)
-
-semaforo = asyncio.Semaphore(RATE_LIMIT)
-
-async def cerrar_item(session, item_id, token, tienda):
-    headers = {
-        "Authorization": f"Bearer {token}",
-        "Content-Type": "application/json",
-        "Accept": "application/json"
-    }
-    url = f"https://api.mercadolibre.com/items/{item_id}"
-    
-    async with semaforo:
-        for intento in range(5):
-            try:
-                async with session.put(url, headers=headers, json={"status": "closed"}) as response:
-                    text = await response.text()
-                    if response.status == 429:
-                        await asyncio.sleep(2 ** intento)
-                        continue
-                    elif response.status >= 400:
-                        logging.error(f"[CLOSE ❌] {item_id} - {tienda['nombre_tienda']} → {text}")
-                    else:
-                        logging.info(f"[CLOSE ✅] {item_id} - {tienda['nombre_tienda']}")
+JOURNAL_PATH = f"../logs/{nombre_tienda}_eliminados.csv"
+
+
+def configurar_logging():
+    os.makedirs(os.path.dirname(LOG_FILENAME), exist_ok=True)
+    logging.basicConfig(
+        filename=LOG_FILENAME,
+        level=logging.INFO,
+        format="%(asctime)s - %(levelname)s - %(message)s"
+    )
+
+
+def esta_cerrado(code, body):
+    """Cerrada o eliminada según una entrada de multiget (404 = ya no existe)"""
+    if code == 404:
+        return True
+    if code != 200:
+        return False
+    return body.get("status") == "closed" or "deleted" in (body.get("sub_status") or [])
+
+
+async def cerrados_segun_api(cliente, ids, concurrencia=MAX_CONC):
+    """
+    IDs ya cerrados/eliminados consultando multiget en lotes concurrentes (solo id y status).
+    Devuelve (cerrados, lotes_fallidos): los IDs de un lote fallido quedan sin verificar y se intentan cerrar.
+    """
+    cerrados = set()
+    lotes_fallidos = 0
+    lotes = iter(range(0, len(ids), LOTE_MULTIGET))
+    pbar = tqdm(total=len(ids), desc="🔎 Consultando estados", unit="it", dynamic_ncols=True)
+
+    async def worker():
+        nonlocal lotes_fallidos
+        for inicio in lotes:
+            lote = ids[inicio:inicio + LOTE_MULTIGET]
+            status, respuesta = await cliente.get(f"{API_URL}/items", params={
+                "ids": ",".join(lote), "attributes": "id,status,sub_status"})
+            if status == 200 and isinstance(respuesta, list):
+                for item_id, code, body in decodificar_multiget(lote, respuesta):
+                    if esta_cerrado(code, body):
+                        cerrados.add(item_id)
+            else:
+                lotes_fallidos += 1
+                logging.warning(f"[MULTIGET ❌] lote de {len(lote)} IDs sin verificar desde {lote[0]} → [{status}]")
+            pbar.update(len(lote))
+
+    try:
+        await asyncio.gather(*(worker() for _ in range(concurrencia)))
+    finally:
+        pbar.close()
+    return cerrados, lotes_fallidos
+
+
+def cerrados_segun_snapshot(fuente, ids, tienda):
+    """IDs cerrados según el espejo Mongo `items` o un export Parquet (sin gastar cuota)"""
+    from snapshot_catalogo import cargar_snapshot, describir_edad
+
+    snapshot, fecha = cargar_snapshot(fuente, ids, origen=tienda["nombre_tienda"])
+    print(f"🗄️  Snapshot ({fuente}): {len(snapshot)} items, antigüedad {describir_edad(fecha)}")
+    return {item_id for item_id, status, sub_status in snapshot[["id", "status", "sub_status"]].itertuples(index=False)
+            if esta_cerrado(200, {"status": status, "sub_status": sub_status})}
+
+
+async def cerrar_item(cliente, item_id):
+    url = f"{API_URL}/items/{item_id}"
+    return await cliente.put(url, json={"status": "closed"})
+
+
+async def procesar_items(ids, tienda, rpm=RATE_RPM, concurrencia=MAX_CONC, verificar="api"):
+    """
+    Cierra las publicaciones con una cola acotada y un número fijo de workers.
+    El ritmo lo fija el limitador adaptativo de la tienda; cada resultado va al journal.
+    `verificar`: 'api' (multiget), 'mongo' o ruta .parquet para saltar las ya cerradas; None no filtra.
+    """
+    conteos = {"ok": 0, "fallidos": 0, "ya_cerrados": 0, "lotes_sin_verificar": 0}
+    limitador = obtener_limitador(tienda["nombre_tienda"], rpm, adaptativo=True)
+    journal = JournalItems(JOURNAL_PATH, extras=["accion"])
+
+    async with ClienteMLAsync(tienda, rpm=rpm, limitador=limitador) as cliente:
+        if verificar:
+            if verificar == "api":
+                cerrados, conteos["lotes_sin_verificar"] = await cerrados_segun_api(cliente, ids, concurrencia)
+            else:
+                cerrados = cerrados_segun_snapshot(verificar, ids, tienda)
+            for item_id in cerrados:
+                journal.registrar(item_id, ESTADO_YA_CERRADO, accion="close")
+            ids = [item_id for item_id in ids if item_id not in cerrados]
+            conteos["ya_cerrados"] = len(cerrados)
+            print(f"⏭️  {len(cerrados)} ya cerradas o eliminadas; quedan {len(ids)} por cerrar")
+
+        cola = asyncio.Queue(maxsize=TAMANO_COLA)
+        pbar = tqdm(total=len(ids), desc=f"🔧 Cerrando {len(ids)} ítems", unit="it", dynamic_ncols=True)
+
+        async def productor():
+            for item_id in ids:
+                await cola.put(item_id)
+            for _ in range(concurrencia):
+                await cola.put(None)
+
+        async def worker():
+            while True:
+                item_id = await cola.get()
+                if item_id is None:
                     return
-            except Exception as e:
-                logging.error(f"[ERROR ❌] {item_id} - {tienda['nombre_tienda']} → {str(e)}")
-                await asyncio.sleep(2 ** intento)
+                status, cuerpo = await cerrar_item(cliente, item_id)
+                if status is not None and status < 400:
+                    conteos["ok"] += 1
+                    journal.registrar(item_id, "OK", status, accion="close")
+                    logging.info(f"[CLOSE ✅] {item_id} - {tienda['nombre_tienda']}")
+                else:
+                    conteos["fallidos"] += 1
+                    mensaje = cuerpo.get("message", str(cuerpo)) if isinstance(cuerpo, dict) else str(cuerpo)
+                    journal.registrar(item_id, "FAIL", status, mensaje, accion="close")
+                    logging.error(f"[CLOSE ❌] {item_id} - {tienda['nombre_tienda']} → [{status}] {mensaje}")
+                pbar.update(1)
+                if pbar.n % 500 == 0:
+                    pbar.set_postfix_str(f"OK:{conteos['ok']} FAIL:{conteos['fallidos']} "
+                                         f"429:{cliente.conteos['429']} rpm:{limitador.rpm_actual:.0f}",
+                                         refresh=False)
 
-async def procesar_items(ids, tienda):
-    token = tienda["access_token"]
-    timeout = aiohttp.ClientTimeout(total=60)
-    connector = aiohttp.TCPConnector(limit=RATE_LIMIT)
+        try:
+            await asyncio.gather(productor(), *(worker() for _ in range(concurrencia)))
+        finally:
+            journal.cerrar()
+            pbar.close()
+        conteos["http"] = dict(cliente.conteos)
+    return conteos
+
+
+def leer_ids(ruta):
+    df = pd.read_excel(ruta, dtype=str)
+    if "ID" not in df.columns:
+        raise ValueError("El archivo Excel debe contener la columna 'ID'")
+    ids = df["ID"].dropna().astype(str).str.strip()
+    ids = ids.where(ids.str.startswith("MLM"), "MLM" + ids)
+    return ids.drop_duplicates().tolist()
 
-    async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
-        tasks = [cerrar_item(session, item_id, token, tienda) for item_id in ids]
-        await tqdm_asyncio.gather(*tasks, desc=f"🔧 Cerrando {len(ids)} ítems")
 
 def main():
+    parser = argparse.ArgumentParser(description='Cierra las publicaciones listadas en el Excel de eliminación')
+    parser.add_argument('--archivo', default=EXCEL_PATH, help=f'Excel con columna ID (default: {EXCEL_PATH})')
+    parser.add_argument('--rpm', type=float, default=RATE_RPM, help=f'Tasa inicial en requests/min (default: {RATE_RPM})')
+    parser.add_argument('--concurrencia', type=int, default=MAX_CONC)
+    parser.add_argument('--verificar', default='api',
+                        help="Pre-filtro de ya cerradas: 'api' (multiget), 'mongo', ruta .parquet o 'no' (default: api)")
+    args = parser.parse_args()
+
     try:
-        df = pd.read_excel("../Data/Eliminar/Eliminar_CO.xlsx", dtype=str)
+        ids = leer_ids(args.archivo)
     except Exception as e:
         print(f"❌ Error leyendo el archivo Excel: {e}")
         return
 
-    if "ID" not in df.columns:
-        print("❌ El archivo Excel debe contener la columna 'ID'")
-        return
-
-    ids = df["ID"].dropna().astype(str)
-    ids = ids.apply(lambda x: x if x.startswith("MLM") else f"MLM{x}").tolist()
+    configurar_logging()
+    verificar = None if args.verificar == "no" else args.verificar
+    conteos = asyncio.run(procesar_items(ids, TIENDA, args.rpm, args.concurrencia, verificar))
+    print(f"✅ Proceso finalizado: {conteos['ok']} cerrados, {conteos['fallidos']} fallidos, "
+          f"{conteos['ya_cerrados']} ya estaban cerrados "
+          f"(429: {conteos['http'].get('429', 0)}, 401: {conteos['http'].get('401', 0)})")
+    if conteos["lotes_sin_verificar"]:
+        print(f"⚠️  {conteos['lotes_sin_verificar']} lotes de multiget fallaron: sus IDs se enviaron sin verificar")
+    print(f"📄 Journal: {JOURNAL_PATH} | Log: {LOG_FILENAME}")
 
-    asyncio.run(procesar_items(ids, TIENDA))
-    print(f"✅ Proceso finalizado. Revisa el log en {LOG_FILENAME}")
 
 if __name__ == "__main__":
     main()
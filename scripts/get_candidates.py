@@ -1,10 +1,15 @@
 import os
+import csv
+import sys
+import json
 import time
+import argparse
+import threading
 import requests
-import pandas as pd
-from multiprocessing import Pool
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
-import backoff
+
+from ml_comun import API_URL, ClienteML, EscritorParquet
 
 load_dotenv()
 
@@ -12,6 +17,11 @@ PROMO_TYPE = "DEAL"
 OUTPUT_DIR = os.path.join("Output", "Started")
 os.makedirs(OUTPUT_DIR, exist_ok=True)
 
+# Un cursor concurrente por estado de participación
+ESTADOS_PROMO = ["candidate", "started", "pending"]
+LIMIT_PAGINA = 100
+FILAS_POR_GRUPO_PROMO = 20000
+
 TIENDAS = {
     code: {
         "access_token": os.getenv(f"{code}_ACCESS_TOKEN"),
@@ -25,6 +35,15 @@ TIENDAS = {
     for code in ["CO", "DS", "TE", "TS", "CA"]
 }
 
+# Columnas fijas del export; el resto de claves del item queda como JSON en `extra`
+CAMPOS_TEXTO_PROMO = ["id", "status", "offer_id", "start_date", "end_date"]
+CAMPOS_DECIMAL_PROMO = [
+    "price", "original_price", "min_discounted_price", "max_discounted_price",
+    "suggested_discounted_price", "top_deal_price",
+]
+COLUMNAS_PROMO = CAMPOS_TEXTO_PROMO + CAMPOS_DECIMAL_PROMO + ["cursor", "extra"]
+
+
 def renovar_token(store):
     url = "https://api.mercadolibre.com/oauth/token"
     payload = {
@@ -45,109 +64,184 @@ def renovar_token(store):
         print(f"[{store['name']}] ERROR al renovar token: {e}")
         return False
 
-@backoff.on_exception(backoff.expo, requests.exceptions.RequestException, max_time=60, jitter=backoff.full_jitter)
-def fetch_page(session, url, params):
-    resp = session.get(url, params=params, timeout=10)
-    if resp.status_code >= 500:
-        resp.raise_for_status()
-    return resp.json()
-
-def procesar_tienda(item):
-    code, store = item
-    print(f"[{code}] Iniciando...")
-
-    base_url = f"https://api.mercadolibre.com/seller-promotions/promotions/{store['promotion_id']}/items"
-    session = requests.Session()
-    session.headers.update({"Authorization": f"Bearer {store['access_token']}", "version": "v2"})
-
-    params = {
-        "promotion_type": PROMO_TYPE,
-        # "status": "candidate",
-        # "status": "started",
-        "limit": 100,
-        "app_version": "v2"
-    }
-
-    search_after = None
-    all_items = []
-    max_items = None  # se determinará con la primera llamada
-
-    # Primera llamada para obtener total y comenzar iteración
-    try:
-        data = fetch_page(session, base_url, params)
-    except Exception as e:
-        print(f"[{code}] ERROR en la primera llamada: {e}")
-        return code, 0
-
-    total_items = data.get("paging", {}).get("total")
-    if not total_items:
-        print(f"[{code}] No se encontró información de total_items.")
-        return code, 0
-
-    max_items = total_items
-    print(f"[{code}] Total registrado por API: {max_items}")
-
-    items = data.get("results", [])
-    all_items.extend(items)
-    print(f"[{code}] Obtenidos {len(items)} items (total {len(all_items)})")
-    search_after = data.get("paging", {}).get("searchAfter")
-
-    # Iterar hasta alcanzar el total
-    while search_after and len(all_items) < max_items:
-        params["search_after"] = search_after
-
-        try:
-            data = fetch_page(session, base_url, params)
-        except requests.HTTPError as e:
-            if e.response.status_code == 401:
-                print(f"[{code}] Token expirado. Intentando renovar...")
-                if renovar_token(store):
-                    session.headers["Authorization"] = f"Bearer {store['access_token']}"
-                    continue
-                else:
-                    break
-            print(f"[{code}] ERROR HTTP: {e}")
-            break
-        except Exception as e:
-            print(f"[{code}] ERROR de conexión: {e}")
-            break
 
+def crear_cliente(code, store):
+    """Cliente compartido por todos los cursores de la tienda (mismo token y limitador)"""
+    return ClienteML(store, renovar_token, nombre=code)
+
+
+def paginas_promocion(cliente, promotion_id, promo_type=PROMO_TYPE, status=None, limit=LIMIT_PAGINA):
+    """
+    Genera las páginas de items de una promoción (paginación por search_after).
+    Con `status` recorre solo ese estado de participación.
+    Lanza requests.HTTPError si la API responde con error tras los reintentos del cliente.
+    """
+    url = f"{API_URL}/seller-promotions/promotions/{promotion_id}/items"
+    params = {"promotion_type": promo_type, "limit": limit, "app_version": "v2"}
+    if status:
+        params["status"] = status
+
+    leidos = 0
+    while True:
+        resp = cliente.get(url, params=params, headers={"version": "v2"})
+        if resp.status_code != 200:
+            raise requests.HTTPError(f"HTTP {resp.status_code}: {resp.text[:200]}", response=resp)
+        data = resp.json()
         items = data.get("results", [])
         if not items:
             break
-        all_items.extend(items)
-        print(f"[{code}] Obtenidos {len(items)} items (total {len(all_items)} / {max_items})")
-
-        # Verifica si se alcanzó el límite total
-        if len(all_items) >= max_items:
-            print(f"[{code}] Se alcanzó el límite máximo de items: {max_items}")
-            break
+        yield items
+        leidos += len(items)
 
-        search_after = data.get("paging", {}).get("searchAfter")
-        if not search_after:
+        paging = data.get("paging", {})
+        total = paging.get("total")
+        search_after = paging.get("searchAfter")
+        if not search_after or (total and leidos >= total):
             break
+        params["search_after"] = search_after
 
-        time.sleep(0.1)
-
-    df = pd.DataFrame(all_items)
-    output_path = os.path.join(OUTPUT_DIR, f"{code}.csv")
-    df.to_csv(output_path, index=False, encoding="utf-8")
-    print(f"[{code}] Guardado {len(all_items)} items en {output_path}")
-    return code, len(all_items)
 
-if __name__ == "__main__":
+def esquema_promo():
+    import pyarrow as pa
+
+    campos = [pa.field(c, pa.string()) for c in CAMPOS_TEXTO_PROMO]
+    campos += [pa.field(c, pa.float64()) for c in CAMPOS_DECIMAL_PROMO]
+    campos += [pa.field("cursor", pa.string()), pa.field("extra", pa.string())]
+    return pa.schema(campos)
+
+
+def fila_promo(item, cursor):
+    """Item de la promoción → fila plana con columnas fijas"""
+    fila = {c: item.get(c) for c in CAMPOS_TEXTO_PROMO}
+    for c in CAMPOS_DECIMAL_PROMO:
+        valor = item.get(c)
+        fila[c] = float(valor) if isinstance(valor, (int, float)) else None
+    fila["cursor"] = cursor
+    resto = {k: v for k, v in item.items() if k not in fila}
+    fila["extra"] = json.dumps(resto, ensure_ascii=False) if resto else None
+    return fila
+
+
+class EscritorPromo:
+    """
+    Escritura incremental compartida por los cursores de una tienda (Parquet o CSV).
+    Escribe a <ruta>.tmp; cerrar(confirmar=True) lo mueve a `ruta` y con False lo descarta,
+    así un export a medias nunca reemplaza al anterior.
+    """
+
+    def __init__(self, ruta, formato="parquet"):
+        self.ruta = ruta
+        self.temporal = ruta + ".tmp"
+        self.formato = formato
+        self.filas = 0
+        self._lock = threading.Lock()
+        if formato == "parquet":
+            self._parquet = EscritorParquet(self.temporal, esquema_promo(), FILAS_POR_GRUPO_PROMO)
+        else:
+            self._archivo = open(self.temporal, "w", newline="", encoding="utf-8")
+            self._csv = csv.DictWriter(self._archivo, fieldnames=COLUMNAS_PROMO)
+            self._csv.writeheader()
+
+    def escribir_pagina(self, items, cursor):
+        filas = [fila_promo(item, cursor) for item in items]
+        with self._lock:
+            if self.formato == "parquet":
+                for fila in filas:
+                    self._parquet.escribir(fila)
+            else:
+                self._csv.writerows(filas)
+            self.filas += len(filas)
+
+    def cerrar(self, confirmar=True):
+        with self._lock:
+            if self.formato == "parquet":
+                self._parquet.cerrar()
+            else:
+                self._archivo.close()
+            if confirmar:
+                os.replace(self.temporal, self.ruta)
+            else:
+                os.remove(self.temporal)
+
+
+def procesar_tienda(item, promo_type=PROMO_TYPE, estados=None, formato="parquet"):
+    """
+    Recorre los estados de la promoción de una tienda con un cursor concurrente por estado.
+    Devuelve (code, filas, fallidos) con fallidos = {estado: error}; si algún cursor falló
+    el export anterior de la tienda queda intacto.
+    """
+    code, store = item
+    estados = estados or ESTADOS_PROMO
+    print(f"[{code}] Iniciando ({', '.join(estados)})...")
 
-    for code, store in TIENDAS.items():
-        renovar_token(store)
-        time.sleep(1)
+    cliente = crear_cliente(code, store)
+    output_path = os.path.join(OUTPUT_DIR, f"{code}.{formato}")
+    escritor = EscritorPromo(output_path, formato)
 
+    def recorrer(estado):
+        obtenidos = 0
+        try:
+            for pagina in paginas_promocion(cliente, store["promotion_id"], promo_type, estado):
+                escritor.escribir_pagina(pagina, estado)
+                obtenidos += len(pagina)
+                print(f"[{code}:{estado}] Obtenidos {len(pagina)} items (total {obtenidos})")
+        except requests.RequestException as e:
+            print(f"[{code}:{estado}] ERROR: {e}")
+            return estado, obtenidos, str(e)
+        return estado, obtenidos, None
+
+    resultados = []
+    try:
+        with ThreadPoolExecutor(max_workers=len(estados)) as executor:
+            resultados = list(executor.map(recorrer, estados))
+    finally:
+        fallidos = {estado: error for estado, _, error in resultados if error}
+        escritor.cerrar(confirmar=len(resultados) == len(estados) and not fallidos)
+
+    detalle = ", ".join(f"{estado}: {obtenidos}" for estado, obtenidos, _ in resultados)
+    if fallidos:
+        print(f"[{code}] ❌ Export incompleto (cursores fallidos: {', '.join(fallidos)}): se conserva el "
+              f"{output_path} anterior ({detalle})")
+    else:
+        print(f"[{code}] Guardado {escritor.filas} items en {output_path} ({detalle})")
+    return code, escritor.filas, fallidos
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Export de items de la promoción por tienda')
+    parser.add_argument('--tiendas', nargs='+', default=list(TIENDAS.keys()), choices=list(TIENDAS.keys()))
+    parser.add_argument('--tipo', default=PROMO_TYPE, help=f'promotion_type (default: {PROMO_TYPE})')
+    parser.add_argument('--estados', nargs='+', default=ESTADOS_PROMO,
+                        help='Estados a recorrer, un cursor concurrente por estado')
+    parser.add_argument('--formato', default='parquet', choices=['parquet', 'csv'])
+    args = parser.parse_args()
+
+    for code in args.tiendas:
+        renovar_token(TIENDAS[code])
+
+    # Hilos (no procesos): cada tienda comparte su dict de token con todos sus cursores
     start = time.time()
-    with Pool(len(TIENDAS)) as pool:
-        results = pool.map(procesar_tienda, TIENDAS.items())
+    with ThreadPoolExecutor(max_workers=len(args.tiendas)) as executor:
+        results = list(executor.map(
+            lambda code: procesar_tienda((code, TIENDAS[code]), args.tipo, args.estados, args.formato),
+            args.tiendas))
 
-    total = sum(count for _, count in results)
+    total = sum(count for _, count, fallidos in results if not fallidos)
     print("\n=== RESUMEN ===")
-    for code, count in results:
-        print(f"{code}: {count} items")
+    for code, count, fallidos in results:
+        if fallidos:
+            cursores = "; ".join(f"{estado}: {error}" for estado, error in fallidos.items())
+            print(f"{code}: ❌ INCOMPLETO, export anterior conservado ({count} items leídos; {cursores})")
+        else:
+            print(f"{code}: {count} items")
     print(f"Total items: {total}")
     print(f"Duración total: {time.time() - start:.2f} segundos")
+
+    tiendas_fallidas = [code for code, _, fallidos in results if fallidos]
+    if tiendas_fallidas:
+        print(f"Tiendas con cursores fallidos: {', '.join(tiendas_fallidas)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,12 @@
 import requests
-import time
 import csv
 import os
 from dotenv import load_dotenv
 from tqdm import tqdm
 
+from get_publicaciones_ml import ExportadorTienda, PARTICIONES_STATUS
+from ml_comun import ConjuntoIds
+
 load_dotenv()
 
 TIENDA_DS = {
@@ -17,65 +19,25 @@ TIENDA_DS = {
 }
 
 
-def renovar_token(tienda):
-    url = "https://api.mercadolibre.com/oauth/token"
-    payload = {
-        "grant_type": "refresh_token",
-        "client_id": tienda["client_id"],
-        "client_secret": tienda["client_secret"],
-        "refresh_token": tienda["refresh_token"]
-    }
-    try:
-        resp = requests.post(url, data=payload)
-        resp.raise_for_status()
-        data = resp.json()
-        tienda["access_token"] = data["access_token"]
-        tienda["refresh_token"] = data["refresh_token"]
-        print("🔑 Token renovado con éxito.")
-        return True
-    except requests.RequestException as e:
-        print(f"❌ Error renovando token: {e}")
-        return False
-
-
 def obtener_ids_scan(user_id, token, tienda):
-    url = f"https://api.mercadolibre.com/users/{user_id}/items/search"
-    headers = {"Authorization": f"Bearer {token}"}
-    params = {"search_type": "scan", "limit": 100}
-    ids = []
+    """IDs de la tienda con un cursor scan por status en paralelo (ver get_publicaciones_ml)"""
+    tienda["user_id"] = user_id
+    tienda["access_token"] = token
+    exportador = ExportadorTienda(tienda)
+    ids = ConjuntoIds()
 
+    print(f"🔍 Obteniendo IDs con SCAN ({len(PARTICIONES_STATUS)} cursores en paralelo)...")
     try:
-        print("🔍 Obteniendo IDs con SCAN...")
-        resp = requests.get(url, headers=headers, params=params)
-        if resp.status_code == 401:
-            print("⚠️ Token expirado, intentando renovar...")
-            if renovar_token(tienda):
-                return obtener_ids_scan(user_id, tienda["access_token"], tienda)
-            return []
-
-        resp.raise_for_status()
-        data = resp.json()
-        ids.extend(data.get("results", []))
-        scroll = data.get("scroll_id")
-
-        with tqdm(total=data.get("paging", {}).get("total", 0), desc="Cargando publicaciones", unit="pub") as pbar:
-            pbar.update(len(data.get("results", [])))
-            while scroll:
-                time.sleep(0.05)
-                params["scroll_id"] = scroll
-                resp = requests.get(url, headers=headers, params=params)
-                resp.raise_for_status()
-                data = resp.json()
-                results = data.get("results", [])
-                if not results:
-                    break
-                ids.extend(results)
-                pbar.update(len(results))
-                scroll = data.get("scroll_id")
-
-    except requests.RequestException as e:
-        print(f"❌ Error obteniendo IDs: {e}")
-
+        total = exportador.total_publicaciones()
+    except requests.RequestException:
+        total = 0
+    with tqdm(total=total, desc="Cargando publicaciones", unit="pub") as pbar:
+        for pagina in exportador.paginas_particionadas():
+            ids.agregar(pagina)
+            pbar.update(len(pagina))
+
+    if exportador.error_scan:
+        print(f"❌ Error obteniendo IDs: {exportador.error_scan}")
     return ids
 
 
@@ -84,8 +46,7 @@ def filtrar_publicaciones(ids, token):
     filtradas = []
 
     print("📦 Filtrando publicaciones que contienen 'Cardic'...")
-    for i in tqdm(range(0, len(ids), 20), desc="Filtrando lotes", unit="lote"):
-        batch = ids[i:i+20]
+    for batch in tqdm(ids.lotes(20), total=(len(ids) + 19) // 20, desc="Filtrando lotes", unit="lote"):
         url = "https://api.mercadolibre.com/items"
         params = {"ids": ",".join(batch)}
 
@@ -3,12 +3,83 @@ import time
 import pandas as pd
 import os
 import csv
+import itertools
+import json
+import queue
+import shutil
+import threading
 from multiprocessing import Pool
 from dotenv import load_dotenv
 
+from ml_comun import (RATE_RPM_DEFAULT, FILAS_POR_GRUPO, obtener_limitador, crear_sesion,
+                      leer_retry_after, decodificar_multiget, fusionar_paginas, EscritorParquet,
+                      ConjuntoIds)
+
 load_dotenv()
 
 # === CONFIGURACIÓN ===
+MULTIGET_WORKERS = 8   # multiget simultáneos por tienda (el ritmo lo marca el limitador)
+MAX_REINTENTOS = 5
+PARTICIONES_STATUS = ["active", "paused", "closed", "under_review"]  # un cursor scan por status
+PARTICION_SIN_FILTRO = "sin_filtro"  # scan de respaldo sin status (inactive, payment_required, ...)
+CHECKPOINT_CADA = 50   # páginas de scan entre checkpoints
+SCROLL_TTL = 280       # segundos; ML invalida el scroll_id a los 5 minutos sin uso
+VOLCAR_CADA = 1000     # filas exportadas entre flush del archivo y marca en el checkpoint
+GRUPOS_POR_PARTE = 4   # row groups por archivo parcial del export Parquet reanudable
+
+# Columnas estables del export (mismo orden en CSV y Parquet)
+CAMPOS_TEXTO = ["id", "title", "status", "sub_status", "currency_id", "seller_custom_field",
+                "category_id", "listing_type_id", "condition", "permalink", "thumbnail",
+                "catalog_product_id", "date_created", "last_updated"]
+CAMPOS_DECIMAL = ["price", "original_price", "base_price", "health"]
+CAMPOS_ENTERO = ["available_quantity", "sold_quantity", "initial_quantity"]
+ATRIBUTOS_CLAVE = {"SELLER_SKU": "seller_sku", "BRAND": "brand", "PART_NUMBER": "part_number"}
+CAMPOS_ANIDADOS = ["attributes", "pictures", "variations"]  # se guardan como JSON
+COLUMNAS_EXPORT = (CAMPOS_TEXTO + CAMPOS_DECIMAL + CAMPOS_ENTERO + ["catalog_listing"]
+                   + list(ATRIBUTOS_CLAVE.values()) + CAMPOS_ANIDADOS)
+
+
+def esquema_export():
+    """Esquema pyarrow fijo del export (no depende del primer registro)"""
+    import pyarrow as pa
+
+    campos = [pa.field(c, pa.string()) for c in CAMPOS_TEXTO]
+    campos += [pa.field(c, pa.float64()) for c in CAMPOS_DECIMAL]
+    campos += [pa.field(c, pa.int64()) for c in CAMPOS_ENTERO]
+    campos += [pa.field("catalog_listing", pa.bool_())]
+    campos += [pa.field(c, pa.string()) for c in ATRIBUTOS_CLAVE.values()]
+    campos += [pa.field(c, pa.string()) for c in CAMPOS_ANIDADOS]
+    return pa.schema(campos)
+
+
+def _convertir(valor, tipo):
+    if valor is None:
+        return None
+    try:
+        return tipo(valor)
+    except (TypeError, ValueError):
+        return None
+
+
+def aplanar_publicacion(pub):
+    """Publicación de multiget → fila plana con las columnas de COLUMNAS_EXPORT"""
+    fila = {c: _convertir(pub.get(c), str) for c in CAMPOS_TEXTO}
+    fila.update({c: _convertir(pub.get(c), float) for c in CAMPOS_DECIMAL})
+    fila.update({c: _convertir(pub.get(c), int) for c in CAMPOS_ENTERO})
+    catalogo = pub.get("catalog_listing")
+    fila["catalog_listing"] = bool(catalogo) if catalogo is not None else None
+
+    atributos = pub.get("attributes") or []
+    for columna in ATRIBUTOS_CLAVE.values():
+        fila[columna] = None
+    for attr in atributos:
+        columna = ATRIBUTOS_CLAVE.get(attr.get("id"))
+        if columna and fila[columna] is None:
+            fila[columna] = attr.get("value_name")
+    for campo in CAMPOS_ANIDADOS:
+        valor = pub.get(campo)
+        fila[campo] = json.dumps(valor, ensure_ascii=False) if valor is not None else None
+    return fila
 
 TIENDAS_ML = {
     "CO": {
@@ -82,98 +153,592 @@ def renovar_token(tienda, max_intentos=3, espera_inicial=1):
 
 
 def obtener_ids_scan(user_id, token, tienda, intento_renovado=False):
+    """
+    Todos los IDs de la tienda (modo scan) como ConjuntoIds compacto.
+    Se mantiene para usos puntuales; el export usa el pipeline.
+    """
     if not intento_renovado:
         print(f"Obteniendo IDs de publicaciones para {tienda['nombre_tienda']}...")
+    ids = ConjuntoIds()
+    for pagina in ExportadorTienda(tienda).paginas_particionadas():
+        ids.agregar(pagina)
+    return ids
 
-    url = f"https://api.mercadolibre.com/users/{user_id}/items/search"
-    headers = {"Authorization": f"Bearer {token}"}
-    params = {"search_type": "scan", "limit": 100}
-    ids = []
 
-    try:
-        resp = requests.get(url, headers=headers, params=params)
-        if resp.status_code == 401 and not intento_renovado:
-            print(f"Token expirado: {tienda['nombre_tienda']} → intentando renovar")
-            if renovar_token(tienda):
-                return obtener_ids_scan(user_id, tienda["access_token"], tienda, True)
-            else:
-                return []
+class CheckpointScan:
+    """
+    Estado reanudable del export de una tienda, en <nombre>.checkpoint/:
+      - estado.json: por partición scroll_id, páginas leídas, hora de la última página y si terminó
+      - descubiertos.txt: IDs ya entregados por el scan (uno por línea, append)
+      - exportados.txt: IDs ya escritos en el archivo de salida (append tras cada flush)
+    Al reanudar: las particiones terminadas se saltan, los scroll vigentes se continúan,
+    los vencidos se reinician omitiendo lo ya descubierto, y los descubiertos sin exportar
+    se vuelven a pedir.
+    """
+    def __init__(self, nombre, intervalo=CHECKPOINT_CADA):
+        self.dir = f"{nombre}.checkpoint"
+        self.ruta_estado = os.path.join(self.dir, "estado.json")
+        self.intervalo = intervalo
+        self._lock = threading.Lock()
+        self._paginas_sin_guardar = 0
+        self.existe = os.path.exists(self.ruta_estado)
+
+        self.estado = {"particiones": {}}
+        self.descubiertos = ConjuntoIds()
+        self.exportados = ConjuntoIds()
+        if self.existe:
+            with open(self.ruta_estado, encoding="utf-8") as f:
+                self.estado = json.load(f)
+            self.descubiertos = self._leer_ids("descubiertos.txt")
+            self.exportados = self._leer_ids("exportados.txt")
+
+        os.makedirs(self.dir, exist_ok=True)
+        self._f_descubiertos = open(os.path.join(self.dir, "descubiertos.txt"), "a", encoding="utf-8")
+        self._f_exportados = open(os.path.join(self.dir, "exportados.txt"), "a", encoding="utf-8")
+
+    def _leer_ids(self, archivo):
+        ruta = os.path.join(self.dir, archivo)
+        if not os.path.exists(ruta):
+            return ConjuntoIds()
+        return ConjuntoIds.leer_archivo(ruta)
+
+    def pendientes(self):
+        """Descubiertos en corridas anteriores que nunca llegaron al archivo de salida"""
+        return list(self.descubiertos - self.exportados)
+
+    def particion_terminada(self, particion):
+        return self.estado["particiones"].get(particion, {}).get("terminado", False)
+
+    def scroll_vigente(self, particion):
+        """scroll_id guardado si todavía no venció (None si hay que reiniciar la partición)"""
+        estado = self.estado["particiones"].get(particion)
+        if not estado or estado.get("terminado") or not estado.get("scroll_id"):
+            return None
+        if time.time() - estado.get("actualizado", 0) > SCROLL_TTL:
+            return None
+        return estado["scroll_id"]
+
+    def registrar_pagina(self, particion, ids, scroll_id):
+        with self._lock:
+            self._f_descubiertos.write("".join(f"{item_id}\n" for item_id in ids))
+            estado = self.estado["particiones"].setdefault(particion, {"paginas": 0})
+            estado.update(scroll_id=scroll_id, actualizado=time.time(), terminado=False,
+                          paginas=estado.get("paginas", 0) + 1)
+            self._paginas_sin_guardar += 1
+            if self._paginas_sin_guardar >= self.intervalo:
+                self._guardar()
 
-        resp.raise_for_status()
-        data = resp.json()
-        scroll = data.get("scroll_id")
-        ids.extend(data.get("results", []))
+    def terminar_particion(self, particion):
+        with self._lock:
+            estado = self.estado["particiones"].setdefault(particion, {"paginas": 0})
+            estado.update(scroll_id=None, terminado=True, actualizado=time.time())
+            self._guardar()
 
-        while scroll:
-            time.sleep(0.05)
-            params["scroll_id"] = scroll
-            resp = requests.get(url, headers=headers, params=params)
+    def reiniciar_particion(self, particion):
+        with self._lock:
+            self.estado["particiones"][particion] = {"paginas": 0}
+
+    def registrar_exportados(self, ids):
+        """Llamar después de hacer flush del archivo de salida con esas filas"""
+        with self._lock:
+            self._f_exportados.write("".join(f"{item_id}\n" for item_id in ids))
+            self._f_exportados.flush()
+
+    def guardar(self):
+        with self._lock:
+            self._guardar()
+
+    def _guardar(self):
+        # Primero los IDs, luego el estado: el scroll guardado nunca va por delante de lo escrito
+        self._f_descubiertos.flush()
+        temporal = self.ruta_estado + ".tmp"
+        with open(temporal, "w", encoding="utf-8") as f:
+            json.dump(self.estado, f)
+        os.replace(temporal, self.ruta_estado)
+        self._paginas_sin_guardar = 0
+
+    def cerrar(self):
+        self.guardar()
+        self._f_descubiertos.close()
+        self._f_exportados.close()
+
+    def limpiar(self):
+        """Export completo: el checkpoint ya no hace falta"""
+        self._f_descubiertos.close()
+        self._f_exportados.close()
+        shutil.rmtree(self.dir, ignore_errors=True)
+
+
+class ExportadorTienda:
+    """
+    Export de una tienda en pipeline:
+      - un hilo recorre el scan y encola lotes de 20 IDs en una cola acotada
+      - varios hilos consumen los lotes con multiget bajo el limitador de la tienda
+      - los lotes fallidos se reintentan (429 con Retry-After, 401 con renovación, 5xx/red con backoff)
+    El tiempo total queda marcado por la cuota de multiget y no por scan + latencia serial.
+    """
+    URL_ITEMS = "https://api.mercadolibre.com/items"
+
+    def __init__(self, tienda, rpm=RATE_RPM_DEFAULT, workers=MULTIGET_WORKERS, batch_size=20,
+                 checkpoint=None):
+        self.tienda = tienda
+        self.checkpoint = checkpoint
+        self.limitador = obtener_limitador(tienda["nombre_tienda"], rpm)
+        self.session = crear_sesion(pool=workers + 2)
+        self.workers = workers
+        self.batch_size = batch_size
+        self._token_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self.ids_encontrados = 0  # IDs leídos del scan (incluye repetidos entre particiones)
+        self.ids_unicos = 0
+        self.total_reportado = None  # paging.total de la tienda al iniciar el scan particionado
+        self.lotes_fallidos = 0
+        self.items_fallidos = 0
+        self.error_scan = None
+
+    def _renovar_si_vigente(self, token_usado):
+        """Renueva una sola vez aunque varios hilos reciban 401 con el mismo token"""
+        with self._token_lock:
+            if self.tienda["access_token"] != token_usado:
+                return True
+            return renovar_token(self.tienda)
+
+    def _get(self, url, params, max_reintentos=MAX_REINTENTOS):
+        """GET autenticado con limitador, renovación de token y reintentos; devuelve el JSON"""
+        ultimo_error = None
+        for intento in range(max_reintentos + 1):
+            token_usado = self.tienda["access_token"]
+            headers = {"Authorization": f"Bearer {token_usado}"}
+            self.limitador.adquirir()
+            try:
+                resp = self.session.get(url, headers=headers, params=params, timeout=30)
+            except requests.RequestException as e:
+                ultimo_error = e
+                time.sleep(min(30, 2 ** intento))
+                continue
+
+            if resp.status_code == 401:
+                print(f"Token expirado: {self.tienda['nombre_tienda']} → intentando renovar")
+                if not self._renovar_si_vigente(token_usado):
+                    raise requests.HTTPError(f"401 sin renovación de token para {self.tienda['nombre_tienda']}")
+                continue
+            if resp.status_code == 429:
+                self.limitador.penalizar(leer_retry_after(resp, default=min(30, 2 ** intento)))
+                continue
+            if resp.status_code >= 500:
+                ultimo_error = requests.HTTPError(f"HTTP {resp.status_code}")
+                time.sleep(min(30, 2 ** intento))
+                continue
             resp.raise_for_status()
-            data = resp.json()
-            results = data.get("results", [])
-            if not results:
-                break
-            ids.extend(results)
-            scroll = data.get("scroll_id")
+            return resp.json()
+        raise requests.RequestException(f"Reintentos agotados: {ultimo_error}")
 
-    except requests.RequestException as e:
-        print(f"Error obteniendo IDs: {tienda['nombre_tienda']} → {e}")
+    def total_publicaciones(self, filtros=None):
+        """paging.total de la búsqueda (un solo request, sin scan)"""
+        url = f"https://api.mercadolibre.com/users/{self.tienda['user_id']}/items/search"
+        data = self._get(url, {"limit": 1, **(filtros or {})})
+        return data.get("paging", {}).get("total", 0)
 
-    return ids
+    def _primera_pagina(self, url, params, particion):
+        """Primera página del cursor: continúa el scroll del checkpoint si sigue vigente"""
+        scroll = self.checkpoint.scroll_vigente(particion) if self.checkpoint and particion else None
+        if scroll:
+            try:
+                data = self._get(url, {**params, "scroll_id": scroll})
+            except requests.HTTPError as e:
+                print(f"{self.tienda['nombre_tienda']} [{particion}]: scroll vencido ({e}), reiniciando partición")
+            else:
+                # Un scroll vencido también puede volver 200 sin resultados: no se da la partición por terminada
+                if data.get("results"):
+                    print(f"{self.tienda['nombre_tienda']} [{particion}]: scroll reanudado desde checkpoint")
+                    return data, scroll
+                print(f"{self.tienda['nombre_tienda']} [{particion}]: scroll sin resultados, reiniciando partición")
+        if self.checkpoint and particion:
+            self.checkpoint.reiniciar_particion(particion)
+        return self._get(url, params), None
+
+    def paginas_scan(self, filtros=None, particion=None):
+        """
+        Generador de páginas de IDs del scan (search_type=scan), opcionalmente filtrado.
+        Con checkpoint y `particion` se registra cada página y se reanuda el cursor guardado.
+        """
+        url = f"https://api.mercadolibre.com/users/{self.tienda['user_id']}/items/search"
+        params = {"search_type": "scan", "limit": 100, **(filtros or {})}
+        con_checkpoint = self.checkpoint is not None and particion is not None
+        if con_checkpoint and self.checkpoint.particion_terminada(particion):
+            return
+        try:
+            data, scroll = self._primera_pagina(url, params, particion)
+            if scroll:
+                params["scroll_id"] = scroll
+            while True:
+                results = data.get("results", [])
+                if not results:
+                    break
+                with self._stats_lock:
+                    self.ids_encontrados += len(results)
+                if con_checkpoint:
+                    self.checkpoint.registrar_pagina(particion, results, data.get("scroll_id"))
+                yield results
+                scroll = data.get("scroll_id")
+                if not scroll:
+                    break
+                params["scroll_id"] = scroll
+                data = self._get(url, params)
+            if con_checkpoint:
+                self.checkpoint.terminar_particion(particion)
+        except requests.RequestException as e:
+            self.error_scan = e
+            print(f"Error obteniendo IDs: {self.tienda['nombre_tienda']} {filtros or ''} → {e}")
 
+    def _fusionar(self, fabricas, conteos, vistos):
+        """fusionar_paginas que deja en `error_scan` la excepción de cualquier partición antes de relanzarla"""
+        try:
+            yield from fusionar_paginas(fabricas, conteos, vistos=vistos)
+        except Exception as e:
+            self.error_scan = e
+            print(f"Error en el scan de {self.tienda['nombre_tienda']}: {type(e).__name__}: {e}")
+            raise
 
-def obtener_detalles_multiples_gen(ids, token, batch_size=20):
-    headers = {"Authorization": f"Bearer {token}"}
-    for i in range(0, len(ids), batch_size):
-        batch = ids[i:i + batch_size]
-        url = "https://api.mercadolibre.com/items"
-        params = {"ids": ",".join(batch)}
+    def paginas_particionadas(self, particiones=None):
+        """
+        Un cursor scan por status corriendo en paralelo; las páginas se mezclan
+        sin duplicados. Si la suma no cubre el total de la tienda (publicaciones con
+        un status fuera de las particiones) se recorre además un scan sin filtro que
+        solo emite los IDs faltantes. Si aun así no se llega al total, `error_scan`
+        marca el scan como incompleto.
+        """
+        particiones = particiones or PARTICIONES_STATUS
         try:
-            resp = requests.get(url, headers=headers, params=params)
-            resp.raise_for_status()
-            resultados = resp.json()
-            for entry in resultados:
-                if entry.get("code") == 200:
-                    yield entry["body"]
-        except requests.RequestException:
-            continue
+            total = self.total_publicaciones()
+            self.total_reportado = total
+            error_total = None
+        except requests.RequestException as e:
+            total, error_total = None, e
+        conteos = {}
+        previos = set()
+        if self.checkpoint:
+            # Lo descubierto en corridas anteriores no se repite; lo no exportado se vuelve a pedir
+            previos = self.checkpoint.descubiertos
+            pendientes = self.checkpoint.pendientes()
+            if pendientes:
+                print(f"{self.tienda['nombre_tienda']}: reanudando {len(pendientes)} IDs pendientes del checkpoint")
+            for i in range(0, len(pendientes), 100):
+                yield pendientes[i:i + 100]
+        fabricas = {status: (lambda status=status: self.paginas_scan({"status": status}, particion=status))
+                    for status in particiones}
+        emitidos = ConjuntoIds()
+        for pagina in self._fusionar(fabricas, conteos, previos):
+            emitidos.agregar(pagina)
+            self.ids_unicos += len(pagina)
+            yield pagina
 
+        unicos = self.ids_unicos + len(previos)
+        if self.error_scan is None and (total is None or unicos < total):
+            faltan = f"{total - unicos} publicaciones" if total is not None else "total desconocido"
+            print(f"{self.tienda['nombre_tienda']}: {faltan} fuera de las particiones {particiones} "
+                  f"→ scan sin filtro de status")
+            vistos = emitidos.union(previos) if previos else emitidos
+            respaldo = {PARTICION_SIN_FILTRO: lambda: self.paginas_scan(particion=PARTICION_SIN_FILTRO)}
+            for pagina in self._fusionar(respaldo, conteos, vistos):
+                self.ids_unicos += len(pagina)
+                yield pagina
+            unicos = self.ids_unicos + len(previos)
 
-def exportar_csv_incremental(data_gen, nombre):
+        detalle = ", ".join(f"{nombre}={cantidad}" for nombre, cantidad in conteos.items())
+        print(f"Scan {self.tienda['nombre_tienda']}: {unicos} IDs únicos ({detalle})")
+        if self.error_scan is None:
+            if total is None:
+                self.error_scan = error_total
+            elif unicos < total:
+                self.error_scan = RuntimeError(f"el scan cubrió {unicos} de {total} publicaciones")
+            if self.error_scan is not None:
+                print(f"Scan incompleto {self.tienda['nombre_tienda']}: {self.error_scan}")
+
+    def obtener_lote(self, batch):
+        """Multiget de un lote; devuelve los bodies con code 200 (None si el lote falló)"""
+        try:
+            resultados = self._get(self.URL_ITEMS, {"ids": ",".join(batch)})
+        except (requests.RequestException, ValueError) as e:
+            with self._stats_lock:
+                self.lotes_fallidos += 1
+                self.items_fallidos += len(batch)
+            print(f"Lote fallido en {self.tienda['nombre_tienda']} ({len(batch)} IDs): {e}")
+            return None
+        cuerpos = []
+        for item_id, code, body in decodificar_multiget(batch, resultados):
+            if code == 200:
+                cuerpos.append(body)
+            else:
+                with self._stats_lock:
+                    self.items_fallidos += 1
+        return cuerpos
+
+    def _productor(self, lotes, paginas):
+        """Parte las páginas del scan en lotes de multiget (cola acotada = contrapresión)"""
+        pendiente = []
+        try:
+            for pagina in paginas:
+                pendiente.extend(pagina)
+                while len(pendiente) >= self.batch_size:
+                    lotes.put(pendiente[:self.batch_size])
+                    pendiente = pendiente[self.batch_size:]
+            if pendiente:
+                lotes.put(pendiente)
+        finally:
+            for _ in range(self.workers):
+                lotes.put(None)
+
+    def _consumidor(self, lotes, salida):
+        try:
+            while True:
+                batch = lotes.get()
+                if batch is None:
+                    break
+                cuerpos = self.obtener_lote(batch)
+                if cuerpos:
+                    salida.put(cuerpos)
+        finally:
+            salida.put(None)
+
+    def detalles(self, paginas=None):
+        """Generador de publicaciones (bodies) a medida que llegan los multiget"""
+        paginas = paginas if paginas is not None else self.paginas_particionadas()
+        lotes = queue.Queue(maxsize=self.workers * 4)
+        salida = queue.Queue(maxsize=self.workers * 4)
+        hilos = [threading.Thread(target=self._productor, args=(lotes, paginas), daemon=True)]
+        hilos += [threading.Thread(target=self._consumidor, args=(lotes, salida), daemon=True)
+                  for _ in range(self.workers)]
+        for hilo in hilos:
+            hilo.start()
+
+        activos = self.workers
+        while activos:
+            cuerpos = salida.get()
+            if cuerpos is None:
+                activos -= 1
+                continue
+            yield from cuerpos
+        for hilo in hilos:
+            hilo.join()
+
+
+def obtener_detalles_multiples_gen(ids, token, batch_size=20, tienda=None):
+    """Detalles de una lista de IDs ya conocida (misma maquinaria concurrente del export)"""
+    tienda = tienda or {"access_token": token, "nombre_tienda": "multiget"}
+    exportador = ExportadorTienda(tienda, batch_size=batch_size)
+    paginas = (ids[i:i + 100] for i in range(0, len(ids), 100))
+    yield from exportador.detalles(paginas)
+
+
+def exportar_csv_incremental(data_gen, nombre, append=False, al_volcar=None, volcar_cada=VOLCAR_CADA,
+                             completo=None):
+    """
+    Escribe los registros a <nombre>.csv.partial a medida que llegan, con las columnas fijas
+    de COLUMNAS_EXPORT (los objetos anidados van como JSON).
+    append=True continúa el .partial existente con su mismo encabezado (reanudación).
+    al_volcar(ids) se llama tras cada flush con los IDs que ya quedaron en disco.
+    `completo()` se evalúa al agotar data_gen: solo si devuelve True el .partial reemplaza
+    a <nombre>.csv; si no, el CSV anterior queda intacto y el .partial espera la reanudación.
+    """
     nombre_archivo = f"{nombre}.csv"
+    parcial = nombre_archivo + ".partial"
+    completo = completo or (lambda: True)
+    continuar = append and os.path.exists(parcial) and os.path.getsize(parcial) > 0
+
     primer_registro = next(data_gen, None)
-    if not primer_registro:
+    if not primer_registro and not continuar:
         print(f"No hay datos para {nombre}")
         return
 
-    with open(nombre_archivo, mode="w", newline='', encoding="utf-8") as file:
-        writer = csv.DictWriter(file, fieldnames=list(primer_registro.keys()))
-        writer.writeheader()
-        writer.writerow(primer_registro)
-        for registro in data_gen:
-            writer.writerow(registro)
+    if continuar:
+        with open(parcial, newline='', encoding="utf-8") as file:
+            fieldnames = next(csv.reader(file))
+    else:
+        fieldnames = COLUMNAS_EXPORT
+
+    with open(parcial, mode="a" if continuar else "w", newline='', encoding="utf-8") as file:
+        writer = csv.DictWriter(file, fieldnames=fieldnames, extrasaction="ignore")
+        if not continuar:
+            writer.writeheader()
+        escritos = []
+        registros = itertools.chain([primer_registro], data_gen) if primer_registro else ()
+        for registro in registros:
+            writer.writerow(aplanar_publicacion(registro))
+            escritos.append(registro.get("id"))
+            if len(escritos) >= volcar_cada:
+                file.flush()
+                if al_volcar:
+                    al_volcar(escritos)
+                escritos = []
+        file.flush()
+        if al_volcar and escritos:
+            al_volcar(escritos)
+
+    if not completo():
+        print(f"Export incompleto: se conserva el {nombre_archivo} anterior (parcial en {parcial})")
+        return
+    os.replace(parcial, nombre_archivo)
+    print(f"{'Continuado' if continuar else 'Exportado'} {nombre_archivo}")
+
+
+def _partes_validas(directorio):
+    """Partes Parquet completas; las que quedaron sin footer (corte a mitad) se descartan"""
+    import pyarrow.parquet as pq
+
+    partes = []
+    for archivo in sorted(os.listdir(directorio)):
+        ruta = os.path.join(directorio, archivo)
+        try:
+            pq.read_metadata(ruta)
+            partes.append(ruta)
+        except Exception:
+            os.remove(ruta)
+    return partes
+
+
+def _unir_partes(partes, nombre_archivo):
+    """Une las partes en un solo archivo, row group por row group (memoria acotada)"""
+    import pyarrow.parquet as pq
+
+    esquema = esquema_export()
+    temporal = nombre_archivo + ".tmp"
+    writer = pq.ParquetWriter(temporal, esquema, compression="zstd")
+    try:
+        for ruta in partes:
+            parte = pq.ParquetFile(ruta)
+            for i in range(parte.num_row_groups):
+                writer.write_table(parte.read_row_group(i).cast(esquema))
+    finally:
+        writer.close()
+    os.replace(temporal, nombre_archivo)
+
+
+def _exportar_parquet_directo(data_gen, nombre_archivo, checkpoint, completo, filas_por_grupo):
+    """
+    Sin partes que reanudar: un solo archivo temporal que reemplaza al final solo si el export
+    quedó completo. Si no, con checkpoint el temporal pasa a ser la primera parte (sus IDs
+    quedan exportados) y sin checkpoint se descarta; el archivo anterior no se toca.
+    """
+    temporal = nombre_archivo + ".tmp"
+    escritor = EscritorParquet(temporal, esquema_export(), filas_por_grupo)
+    exportados = ConjuntoIds() if checkpoint is not None else None
+    ids_grupo = []
+    for registro in data_gen:
+        if exportados is not None:
+            ids_grupo.append(registro.get("id"))
+        if escritor.escribir(aplanar_publicacion(registro)) and exportados is not None:
+            exportados.agregar(ids_grupo)
+            ids_grupo = []
+    escritor.cerrar()
+    if exportados is not None:
+        exportados.agregar(ids_grupo)
+
+    if completo():
+        os.replace(temporal, nombre_archivo)
+        print(f"Exportado {nombre_archivo} ({escritor.filas} filas)")
+        return
+    if checkpoint is not None and escritor.filas:
+        directorio = os.path.join(checkpoint.dir, "partes")
+        os.makedirs(directorio, exist_ok=True)
+        os.replace(temporal, os.path.join(directorio, "parte_00000.parquet"))
+        checkpoint.registrar_exportados(list(exportados))
+    else:
+        os.remove(temporal)
+    print(f"Export incompleto: se conserva el {nombre_archivo} anterior ({escritor.filas} filas pendientes de unir)")
+
 
-    print(f"Exportado {nombre_archivo}")
+def exportar_parquet_incremental(data_gen, nombre, checkpoint=None, completo=None,
+                                 filas_por_grupo=FILAS_POR_GRUPO, grupos_por_parte=GRUPOS_POR_PARTE):
+    """
+    Escribe los registros a <nombre>.parquet con esquema fijo, un row group cada
+    `filas_por_grupo` items y compresión zstd.
+    `completo()` se evalúa al agotar data_gen: si devuelve False el <nombre>.parquet anterior
+    queda intacto (los lectores nunca ven un catálogo parcial).
+    Sin partes previas se escribe directo a un solo archivo; al reanudar un checkpoint con
+    partes, cada parte cerrada marca sus IDs como exportados y las partes se unen al final.
+    """
+    nombre_archivo = f"{nombre}.parquet"
+    completo = completo or (lambda: True)
+    directorio = os.path.join(checkpoint.dir, "partes") if checkpoint is not None else None
+    partes = _partes_validas(directorio) if directorio and os.path.isdir(directorio) else []
+    if not partes:
+        _exportar_parquet_directo(data_gen, nombre_archivo, checkpoint, completo, filas_por_grupo)
+        return
+
+    siguiente = len(partes)
+    filas_por_parte = filas_por_grupo * grupos_por_parte
+
+    escritor = None
+    ids_parte = []
+    for registro in data_gen:
+        if escritor is None:
+            ruta = os.path.join(directorio, f"parte_{siguiente:05d}.parquet")
+            escritor = EscritorParquet(ruta, esquema_export(), filas_por_grupo)
+        escritor.escribir(aplanar_publicacion(registro))
+        ids_parte.append(registro.get("id"))
+        if len(ids_parte) >= filas_por_parte:
+            escritor.cerrar()
+            checkpoint.registrar_exportados(ids_parte)
+            partes.append(escritor.ruta)
+            escritor, ids_parte, siguiente = None, [], siguiente + 1
+    if escritor is not None:
+        escritor.cerrar()
+        checkpoint.registrar_exportados(ids_parte)
+        partes.append(escritor.ruta)
+
+    if not completo():
+        print(f"Export incompleto: se conserva el {nombre_archivo} anterior ({len(partes)} partes en {directorio})")
+        return
+    _unir_partes(partes, nombre_archivo)
+    print(f"Exportado {nombre_archivo} ({len(partes)} partes)")
 
 
 def procesar_tienda(args):
-    clave, tienda = args
+    clave, tienda, formato = (*args, "parquet") if len(args) == 2 else args
     start = time.time()
 
-    ids = obtener_ids_scan(tienda["user_id"], tienda["access_token"], tienda)
-    detalles_gen = obtener_detalles_multiples_gen(ids, tienda["access_token"])
-    exportar_csv_incremental(detalles_gen, tienda["nombre_tienda"])
+    checkpoint = CheckpointScan(tienda["nombre_tienda"])
+    if checkpoint.existe:
+        print(f"{tienda['nombre_tienda']}: checkpoint encontrado ({len(checkpoint.exportados)} IDs ya exportados)")
+    exportador = ExportadorTienda(tienda, checkpoint=checkpoint)
+
+    def completo():
+        return exportador.error_scan is None and exportador.lotes_fallidos == 0
+
+    if formato == "csv":
+        exportar_csv_incremental(exportador.detalles(), tienda["nombre_tienda"], append=checkpoint.existe,
+                                 al_volcar=checkpoint.registrar_exportados, completo=completo)
+    else:
+        exportar_parquet_incremental(exportador.detalles(), tienda["nombre_tienda"], checkpoint=checkpoint,
+                                     completo=completo)
+    if exportador.lotes_fallidos or exportador.items_fallidos:
+        print(f"{tienda['nombre_tienda']}: {exportador.lotes_fallidos} lotes y "
+              f"{exportador.items_fallidos} items sin detalle tras reintentos")
+
+    if completo():
+        checkpoint.limpiar()
+    else:
+        checkpoint.cerrar()
+        print(f"{tienda['nombre_tienda']}: export incompleto, vuelve a ejecutar para reanudar desde {checkpoint.dir}")
 
     end = time.time()
-    return clave, len(ids), end - start
+    return clave, exportador.ids_unicos + len(checkpoint.descubiertos), end - start
 
 
 def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Exportar publicaciones de todas las tiendas de MercadoLibre')
+    parser.add_argument('--formato', default='parquet', choices=['parquet', 'csv'],
+                        help='Formato del export (default: parquet con zstd)')
+    args = parser.parse_args()
+
     global_start = time.time()
-    print(f"Ejecutando con multiprocessing ({len(TIENDAS_ML)} workers)\n")
+    print(f"Ejecutando con multiprocessing ({len(TIENDAS_ML)} workers), formato {args.formato}\n")
 
     with Pool(processes=len(TIENDAS_ML)) as pool:
-        resultados = pool.map(procesar_tienda, list(TIENDAS_ML.items()))
+        resultados = pool.map(procesar_tienda, [(clave, tienda, args.formato) for clave, tienda in TIENDAS_ML.items()])
 
     global_end = time.time()
     print("\nRESUMEN FINAL")
@@ -1,36 +1,91 @@
+import os
+import json
+import argparse
 import pandas as pd
-import re
+
+from ml_comun import ConjuntoIds, JournalItems
 
 # Rutas de archivo
 EXCEL_PATH = "../Data/Eliminar/Eliminar_CO.xlsx"
-LOG_PATH = "../logs/CO_eliminados.log"
+JOURNAL_PATH = "../logs/CO_eliminados.csv"
+
+# Estados del journal que sacan un ID del archivo de pendientes (FAIL se reintenta)
+ESTADOS_TERMINADOS = {"OK", "YA_CERRADO"}
 
-# 1. Leer archivo Excel
-df = pd.read_excel(EXCEL_PATH)
 
-# 2. Leer el log y extraer los IDs eliminados
-with open(LOG_PATH, "r") as f:
-    lines = f.readlines()
+def ruta_offset(journal_path):
+    return journal_path + ".offset"
 
-# Extraer solo el número del ID (sin "MLM")
-eliminados = set()
-for line in lines:
-    match = re.search(r"MLM(\d+)", line)
-    if match:
-        eliminados.add(match.group(1))  # solo el número
 
-# 3. Filtrar el DataFrame eliminando los IDs encontrados
-def id_sin_mlm(valor):
+def leer_offset(journal_path):
     try:
-        return str(valor).replace("MLM", "").strip()
-    except:
-        return ""
+        with open(ruta_offset(journal_path), encoding="utf-8") as f:
+            return int(json.load(f).get("offset", 0))
+    except (OSError, ValueError):
+        return 0
+
+
+def guardar_offset(journal_path, offset):
+    tmp = ruta_offset(journal_path) + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump({"offset": offset}, f)
+    os.replace(tmp, ruta_offset(journal_path))
+
+
+def terminados_desde(journal_path, offset):
+    """IDs cerrados/eliminados en las entradas del journal posteriores a `offset`"""
+    filas, nuevo_offset = JournalItems.leer_desde(journal_path, offset)
+    terminados = ConjuntoIds(f["id"] for f in filas if f.get("estado") in ESTADOS_TERMINADOS)
+    return terminados, nuevo_offset, len(filas)
+
+
+def limpiar(excel_path=EXCEL_PATH, journal_path=JOURNAL_PATH, salida=None, desde_inicio=False):
+    """
+    Quita del archivo de pendientes los IDs terminados según las entradas nuevas del journal.
+    El offset solo avanza después de sobrescribir el archivo, así un corte no pierde entradas;
+    con `salida` distinta el archivo original no cambia y el offset tampoco.
+    """
+    offset = 0 if desde_inicio else leer_offset(journal_path)
+    terminados, nuevo_offset, nuevas = terminados_desde(journal_path, offset)
+    print(f"📖 {nuevas} entradas nuevas en el journal ({len(terminados)} IDs terminados)")
+
+    salida = salida or excel_path
+    avanzar = os.path.abspath(salida) == os.path.abspath(excel_path)
+    if not terminados:
+        if avanzar:
+            guardar_offset(journal_path, nuevo_offset)
+        print("✅ No hay IDs nuevos para quitar del archivo.")
+        return 0
+
+    df = pd.read_excel(excel_path, dtype={"ID": str})
+    ids = df["ID"].astype("string").str.strip().fillna("")
+    ids = ids.where(ids.str.startswith("MLM"), "MLM" + ids)
+    pendientes = df[~terminados.contiene(ids.tolist())]
+
+    tmp = salida + ".tmp.xlsx"
+    pendientes.to_excel(tmp, index=False)
+    os.replace(tmp, salida)
+    if avanzar:
+        guardar_offset(journal_path, nuevo_offset)
+
+    quitadas = len(df) - len(pendientes)
+    print(f"✅ Se eliminaron {quitadas} filas del archivo ({len(pendientes)} pendientes en {salida}).")
+    return quitadas
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Quita del Excel de eliminación los IDs ya cerrados según el journal')
+    parser.add_argument('--archivo', default=EXCEL_PATH, help=f'Excel de pendientes (default: {EXCEL_PATH})')
+    parser.add_argument('--journal', default=JOURNAL_PATH, help=f'Journal de cierres (default: {JOURNAL_PATH})')
+    parser.add_argument('--salida', help='Escribir los pendientes en otro archivo en lugar de sobrescribir')
+    parser.add_argument('--desde-inicio', action='store_true', help='Ignorar el offset guardado y leer todo el journal')
+    args = parser.parse_args()
 
-df["ID_sin_MLM"] = df["ID"].apply(id_sin_mlm)
-df_filtrado = df[~df["ID_sin_MLM"].isin(eliminados)]
+    if not os.path.exists(args.journal):
+        print(f"❌ No existe el journal {args.journal}")
+        return
+    limpiar(args.archivo, args.journal, args.salida, args.desde_inicio)
 
-# 4. Eliminar columna auxiliar y sobrescribir el Excel
-df_filtrado.drop(columns=["ID_sin_MLM"], inplace=True)
-df_filtrado.to_excel(EXCEL_PATH, index=False)
 
-print(f"✅ Se eliminaron {len(df) - len(df_filtrado)} filas del archivo.")
+if __name__ == "__main__":
+    main()
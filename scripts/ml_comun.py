@@ -0,0 +1,802 @@
+#!/usr/bin/env python3
+"""
+Utilidades compartidas para los scripts que hablan con la API de MercadoLibre
+- LimitadorTasa: token bucket por tienda, usable desde hilos y desde asyncio
+- LimitadorAdaptativo: token bucket que baja la tasa con los 429 y la recupera sin ellos
+- crear_sesion: sesión HTTP con pool de conexiones reutilizables
+- ClienteML: sesión + limitador + renovación de token compartida entre hilos
+- ClienteMLAsync: lo mismo sobre aiohttp para pipelines asyncio
+- ResultadoItem / ReporteStream: resultados compactos y reportes escritos en streaming
+- JournalItems: journal CSV append-only con una línea por item (para reanudar)
+- decodificar_multiget: lectura de respuestas GET /items?ids=... alineadas por posición
+- fusionar_paginas: varios cursores scan en paralelo mezclados en un solo flujo sin duplicados
+- EscritorParquet: escritura columnar por row groups con esquema fijo (zstd)
+- ConjuntoIds: conjunto compacto de IDs de item (prefijo de sitio + vector int64 ordenado)
+"""
+
+import os
+import csv
+import json
+import time
+import queue
+import random
+import shutil
+import asyncio
+import tempfile
+import threading
+import weakref
+from collections import Counter
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# === CONFIGURACIÓN ===
+RATE_RPM_DEFAULT = 900  # mismo límite sostenido que set_sku_ml
+API_URL = "https://api.mercadolibre.com"
+
+
+# =========== Rate Limiter (Token Bucket por tienda) ===========
+
+class LimitadorTasa:
+    """
+    Token bucket thread-safe:
+      - rate = rpm / 60 tokens/seg, capacity = ráfaga permitida
+      - adquirir() bloquea el hilo; adquirir_async() cede el event loop
+      - penalizar(segundos) congela a todos los consumidores (Retry-After)
+    """
+    def __init__(self, rpm: float = RATE_RPM_DEFAULT, capacidad: Optional[float] = None):
+        self.rate = rpm / 60.0
+        self.capacidad = capacidad if capacidad is not None else max(1.0, self.rate)
+        self.tokens = self.capacidad
+        self.ultimo = time.monotonic()
+        self.bloqueado_hasta = 0.0
+        self._lock = threading.Lock()
+
+    def _reservar(self) -> float:
+        """Intenta tomar un token; devuelve 0 si lo obtuvo o los segundos a esperar"""
+        with self._lock:
+            ahora = time.monotonic()
+            if ahora < self.bloqueado_hasta:
+                return self.bloqueado_hasta - ahora
+            transcurrido = ahora - self.ultimo
+            if transcurrido > 0:
+                self.tokens = min(self.capacidad, self.tokens + transcurrido * self.rate)
+                self.ultimo = ahora
+            if self.tokens >= 1.0:
+                self.tokens -= 1.0
+                return 0.0
+            return (1.0 - self.tokens) / self.rate if self.rate > 0 else 0.5
+
+    def adquirir(self):
+        while True:
+            espera = self._reservar()
+            if espera <= 0:
+                return
+            time.sleep(min(0.5, max(0.005, espera)))
+
+    async def adquirir_async(self):
+        while True:
+            espera = self._reservar()
+            if espera <= 0:
+                return
+            await asyncio.sleep(min(0.5, max(0.005, espera)))
+
+    def penalizar(self, segundos: float):
+        """Pausa global tras un 429 (respeta Retry-After)"""
+        with self._lock:
+            self.bloqueado_hasta = max(self.bloqueado_hasta, time.monotonic() + max(0.0, segundos))
+            self.tokens = 0.0
+
+
+class LimitadorAdaptativo(LimitadorTasa):
+    """
+    Token bucket que ajusta su tasa según los 429:
+      - penalizar(): además de la pausa por Retry-After baja la tasa (x factor_baja, hasta rpm_minimo);
+        los 429 que llegan durante la misma pausa no vuelven a bajarla
+      - cada `enfriamiento` segundos sin 429 la tasa sube (x factor_sube) hasta el rpm inicial
+    """
+    def __init__(self, rpm: float = RATE_RPM_DEFAULT, rpm_minimo: Optional[float] = None,
+                 enfriamiento: float = 30.0, factor_baja: float = 0.7, factor_sube: float = 1.1):
+        super().__init__(rpm)
+        self.rate_maximo = self.rate
+        self.rate_minimo = (rpm_minimo if rpm_minimo is not None else rpm / 10) / 60.0
+        self.enfriamiento = enfriamiento
+        self.factor_baja = factor_baja
+        self.factor_sube = factor_sube
+        self._ultimo_ajuste = time.monotonic()
+
+    @property
+    def rpm_actual(self) -> float:
+        return self.rate * 60.0
+
+    def _reservar(self) -> float:
+        with self._lock:
+            ahora = time.monotonic()
+            if self.rate < self.rate_maximo and ahora - self._ultimo_ajuste >= self.enfriamiento:
+                self.rate = min(self.rate_maximo, self.rate * self.factor_sube)
+                self._ultimo_ajuste = ahora
+        return super()._reservar()
+
+    def penalizar(self, segundos: float):
+        with self._lock:
+            ahora = time.monotonic()
+            if ahora >= self.bloqueado_hasta:
+                self.rate = max(self.rate_minimo, self.rate * self.factor_baja)
+            self._ultimo_ajuste = ahora
+        super().penalizar(segundos)
+
+
+_limitadores: Dict[str, LimitadorTasa] = {}
+_limitadores_lock = threading.Lock()
+
+
+def obtener_limitador(nombre_tienda: str, rpm: float = RATE_RPM_DEFAULT,
+                      adaptativo: bool = False) -> LimitadorTasa:
+    """Devuelve el limitador compartido de la tienda (uno por proceso; el primero define el tipo)"""
+    with _limitadores_lock:
+        if nombre_tienda not in _limitadores:
+            _limitadores[nombre_tienda] = LimitadorAdaptativo(rpm) if adaptativo else LimitadorTasa(rpm)
+        return _limitadores[nombre_tienda]
+
+
+def leer_retry_after(resp, default: float = 1.0) -> float:
+    """Segundos indicados por el header Retry-After (o default)"""
+    valor = resp.headers.get("Retry-After")
+    try:
+        return float(valor) if valor is not None else default
+    except ValueError:
+        return default
+
+
+# =========== HTTP Session ===========
+
+def crear_sesion(pool: int = 32) -> requests.Session:
+    """Sesión HTTP con keep-alive y pool de conexiones (reintenta solo errores 5xx)"""
+    s = requests.Session()
+    retry = Retry(
+        total=3,
+        backoff_factor=0.3,
+        status_forcelist=[500, 502, 503, 504],
+        allowed_methods=frozenset(["GET", "PUT", "HEAD"]),
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(pool_connections=pool, pool_maxsize=pool, max_retries=retry)
+    s.mount("https://", adapter)
+    s.mount("http://", adapter)
+    s.headers.update({"Accept": "application/json", "Connection": "keep-alive"})
+    return s
+
+
+class ClienteML:
+    """
+    Cliente síncrono para usar desde varios hilos de una misma tienda:
+      - todos los requests pasan por el limitador de la tienda
+      - 401: renueva el token una sola vez aunque varios hilos lo detecten (estado compartido
+        en el dict de la tienda) y reintenta
+      - 429: pausa global según Retry-After; 5xx / errores de red: backoff exponencial
+    `renovar(tienda) -> bool` es la función de renovación del script que lo usa.
+    Devuelve la última respuesta; el llamador decide qué hacer con códigos no exitosos.
+    """
+    def __init__(self, tienda: Dict[str, Any], renovar: Callable[[Dict[str, Any]], bool],
+                 nombre: Optional[str] = None, rpm: float = RATE_RPM_DEFAULT, pool: int = 16,
+                 max_reintentos: int = 5):
+        self.tienda = tienda
+        self.renovar = renovar
+        self.nombre = nombre or tienda.get("nombre_tienda") or tienda.get("name")
+        self.limitador = obtener_limitador(self.nombre, rpm)
+        self.session = crear_sesion(pool)
+        self.max_reintentos = max_reintentos
+        self._token_lock = threading.Lock()
+
+    def _renovar_si_vigente(self, token_usado: str) -> bool:
+        with self._token_lock:
+            if self.tienda["access_token"] != token_usado:
+                return True
+            return self.renovar(self.tienda)
+
+    def solicitar(self, metodo: str, url: str, headers: Optional[Dict[str, str]] = None,
+                  timeout: float = 30, **kwargs) -> requests.Response:
+        for intento in range(self.max_reintentos + 1):
+            ultimo = intento == self.max_reintentos
+            token_usado = self.tienda["access_token"]
+            encabezados = {"Authorization": f"Bearer {token_usado}", **(headers or {})}
+            self.limitador.adquirir()
+            try:
+                resp = self.session.request(metodo, url, headers=encabezados, timeout=timeout, **kwargs)
+            except requests.RequestException:
+                if ultimo:
+                    raise
+                time.sleep(min(30, 2 ** intento))
+                continue
+            if resp.status_code == 401 and not ultimo and self._renovar_si_vigente(token_usado):
+                continue
+            if resp.status_code == 429 and not ultimo:
+                self.limitador.penalizar(leer_retry_after(resp, default=min(30, 2 ** intento)))
+                continue
+            if resp.status_code >= 500 and not ultimo:
+                time.sleep(min(30, 2 ** intento))
+                continue
+            return resp
+        return resp
+
+    def get(self, url: str, **kwargs) -> requests.Response:
+        return self.solicitar("GET", url, **kwargs)
+
+
+_locks_token_async: "weakref.WeakKeyDictionary" = weakref.WeakKeyDictionary()
+
+
+def lock_token_async(nombre_tienda: str) -> asyncio.Lock:
+    """
+    Lock de renovación de token compartido por todos los clientes async de la tienda en el loop
+    actual: el refresh_token es de un solo uso y dos clientes no deben gastarlo a la vez
+    """
+    locks = _locks_token_async.setdefault(asyncio.get_running_loop(), {})
+    return locks.setdefault(nombre_tienda, asyncio.Lock())
+
+
+class ClienteMLAsync:
+    """
+    Equivalente asyncio de ClienteML sobre aiohttp (usar con `async with`):
+      - una sesión con pool de conexiones por tienda; cada request toma un token del limitador
+      - 401: renueva el token (oauth refresh_token) una sola vez entre todas las corrutinas,
+        también entre clientes de la misma tienda (el lock de renovación es por tienda)
+      - 429: pausa global según Retry-After; 5xx / errores de red: backoff exponencial con jitter
+    `solicitar` devuelve (status, cuerpo); status None si se agotaron los reintentos por red.
+    Con `limitador=` un request puede consumir otro presupuesto (p. ej. uno por fase).
+    """
+    def __init__(self, tienda: Dict[str, Any], nombre: Optional[str] = None,
+                 rpm: float = RATE_RPM_DEFAULT, conexiones: int = 64, max_reintentos: int = 6,
+                 limitador: Optional[LimitadorTasa] = None):
+        self.tienda = tienda
+        self.nombre = nombre or tienda.get("nombre_tienda") or tienda.get("name")
+        self.limitador = limitador or obtener_limitador(self.nombre, rpm)
+        self.conexiones = conexiones
+        self.max_reintentos = max_reintentos
+        self.conteos: Counter = Counter()
+        self.session = None
+
+    async def __aenter__(self) -> "ClienteMLAsync":
+        import ssl
+        import aiohttp
+
+        try:
+            import certifi
+            ssl_ctx = ssl.create_default_context(cafile=certifi.where())
+        except ImportError:
+            ssl_ctx = ssl.create_default_context()
+        connector = aiohttp.TCPConnector(limit=self.conexiones, ttl_dns_cache=300, ssl=ssl_ctx)
+        self.session = aiohttp.ClientSession(
+            connector=connector,
+            timeout=aiohttp.ClientTimeout(total=25, connect=10, sock_read=20),
+            headers={"Accept": "application/json", "Connection": "keep-alive"},
+            trust_env=True,
+        )
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.session.close()
+
+    async def renovar(self, token_usado: Optional[str] = None) -> bool:
+        """Refresh del token; si otra corrutina ya lo renovó no vuelve a llamar a oauth"""
+        import aiohttp
+
+        async with lock_token_async(self.nombre):
+            if token_usado is not None and self.tienda["access_token"] != token_usado:
+                return True
+            payload = {
+                "grant_type": "refresh_token",
+                "client_id": self.tienda["client_id"],
+                "client_secret": self.tienda["client_secret"],
+                "refresh_token": self.tienda["refresh_token"],
+            }
+            try:
+                async with self.session.post(f"{API_URL}/oauth/token", data=payload) as r:
+                    if r.status != 200:
+                        return False
+                    data = await r.json()
+            except (aiohttp.ClientError, asyncio.TimeoutError):
+                return False
+            self.tienda["access_token"] = data.get("access_token", self.tienda["access_token"])
+            if data.get("refresh_token"):
+                self.tienda["refresh_token"] = data["refresh_token"]
+            self.conteos["renovaciones"] += 1
+            return True
+
+    async def solicitar(self, metodo: str, url: str, headers: Optional[Dict[str, str]] = None,
+                        limitador: Optional[LimitadorTasa] = None, **kwargs) -> Tuple[Optional[int], Any]:
+        import aiohttp
+
+        limitador = limitador or self.limitador
+
+        cuerpo: Any = None
+        for intento in range(self.max_reintentos + 1):
+            ultimo = intento == self.max_reintentos
+            espera = min(8.0, 0.25 * 2 ** intento) + random.uniform(0, 0.2)
+            token_usado = self.tienda["access_token"]
+            encabezados = {"Authorization": f"Bearer {token_usado}", **(headers or {})}
+            await limitador.adquirir_async()
+            try:
+                async with self.session.request(metodo, url, headers=encabezados, **kwargs) as resp:
+                    status = resp.status
+                    texto = await resp.text()
+                    retry_after = leer_retry_after(resp, default=espera)
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                self.conteos["red"] += 1
+                if ultimo:
+                    return None, {"message": f"{type(e).__name__}: {e}"}
+                await asyncio.sleep(espera)
+                continue
+
+            try:
+                cuerpo = json.loads(texto) if texto else {}
+            except ValueError:
+                cuerpo = {"message": texto[:500]}
+
+            if status == 401:
+                self.conteos["401"] += 1
+                if not ultimo and await self.renovar(token_usado):
+                    continue
+            elif status == 429:
+                self.conteos["429"] += 1
+                if not ultimo:
+                    limitador.penalizar(retry_after)
+                    continue
+            elif status >= 500:
+                self.conteos["5xx"] += 1
+                if not ultimo:
+                    await asyncio.sleep(espera)
+                    continue
+            return status, cuerpo
+        return None, cuerpo
+
+    async def get(self, url: str, **kwargs) -> Tuple[Optional[int], Any]:
+        return await self.solicitar("GET", url, **kwargs)
+
+    async def post(self, url: str, **kwargs) -> Tuple[Optional[int], Any]:
+        return await self.solicitar("POST", url, **kwargs)
+
+    async def put(self, url: str, **kwargs) -> Tuple[Optional[int], Any]:
+        return await self.solicitar("PUT", url, **kwargs)
+
+
+# =========== Codec de respuestas multiget ===========
+
+def decodificar_multiget(ids: List[str], respuesta: List[Dict[str, Any]]) -> List[Tuple[str, Optional[int], Dict[str, Any]]]:
+    """
+    Decodifica la respuesta de GET /items?ids=ID1,ID2,...
+    Devuelve [(id, code, body)] en el mismo orden que `ids`: las entradas con error
+    no traen el id en el body, así que se asocian por posición (sin búsquedas O(n)).
+    IDs sin entrada en la respuesta se devuelven con code None.
+    """
+    salida = []
+    for pos, item_id in enumerate(ids):
+        entry = respuesta[pos] if pos < len(respuesta) else None
+        if not isinstance(entry, dict):
+            salida.append((item_id, None, {"message": "Sin respuesta para el ID"}))
+            continue
+        body = entry.get("body") or {}
+        salida.append((item_id, entry.get("code"), body))
+    return salida
+
+
+def error_multiget(item_id: str, code: Optional[int], body: Dict[str, Any]) -> Dict[str, Any]:
+    """Registro de error con el formato que usan los validadores ({'id', 'error'})"""
+    return {"id": item_id, "error": f"Code {code}: {body.get('message', 'Unknown error')}"}
+
+
+# =========== Scans particionados ===========
+
+def fusionar_paginas(particiones: Dict[str, Callable[[], Iterable[List[str]]]],
+                     conteos: Optional[Dict[str, int]] = None,
+                     max_paginas_en_cola: int = 64,
+                     vistos: Optional[set] = None) -> Iterator[List[str]]:
+    """
+    Corre un cursor por partición (p.ej. un scan por status) en su propio hilo y
+    mezcla sus páginas en un único flujo de IDs nuevos (deduplicados).
+    `conteos` (opcional) recibe los IDs leídos por partición.
+    `vistos` (opcional) siembra los IDs que no deben volver a emitirse (reanudaciones).
+    Los IDs ya emitidos se guardan en un ConjuntoIds (~8 bytes por ID).
+    Si un cursor lanza una excepción, los demás terminan y la primera se relanza al final.
+    """
+    cola: "queue.Queue" = queue.Queue(maxsize=max_paginas_en_cola)
+    conteos = conteos if conteos is not None else {}
+    fin = object()
+    errores: List[BaseException] = []
+
+    def _correr(nombre: str, fabrica: Callable[[], Iterable[List[str]]]):
+        try:
+            for pagina in fabrica():
+                cola.put((nombre, pagina))
+        except Exception as e:
+            errores.append(e)
+        finally:
+            cola.put((nombre, fin))
+
+    hilos = [threading.Thread(target=_correr, args=(nombre, fabrica), daemon=True)
+             for nombre, fabrica in particiones.items()]
+    for hilo in hilos:
+        hilo.start()
+
+    previos = vistos if vistos else None
+    emitidos = ConjuntoIds()
+    activos = len(hilos)
+    while activos:
+        nombre, pagina = cola.get()
+        if pagina is fin:
+            activos -= 1
+            continue
+        conteos[nombre] = conteos.get(nombre, 0) + len(pagina)
+        nuevos = [item_id for item_id in dict.fromkeys(pagina)
+                  if item_id not in emitidos and (previos is None or item_id not in previos)]
+        emitidos.agregar(nuevos)
+        if nuevos:
+            yield nuevos
+    for hilo in hilos:
+        hilo.join()
+    if errores:
+        raise errores[0]
+
+
+# =========== Conjunto compacto de IDs ===========
+
+def _separar_ids(ids) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    "MLM3704500812" → ("MLM", 3704500812) de forma vectorizada.
+    Devuelve (prefijos, numeros, validos); los IDs que no encajan (sin prefijo de 3 letras,
+    con ceros a la izquierda o demasiado largos) quedan con validos=False.
+    """
+    import pandas as pd
+
+    texto = pd.Series(ids, dtype="string").str.strip()
+    prefijos = texto.str[:3]
+    digitos = texto.str[3:]
+    validos = (prefijos.str.isalpha() & digitos.str.isdigit() & (digitos.str.len() <= 18)
+               & ~digitos.str.startswith("0")).fillna(False).to_numpy(dtype=bool)
+    numeros = np.zeros(len(texto), dtype=np.int64)
+    if validos.any():
+        numeros[validos] = digitos[validos].astype("int64").to_numpy()
+    return prefijos.fillna("").to_numpy(dtype=object), numeros, validos
+
+
+class ConjuntoIds:
+    """
+    Conjunto de IDs de item con ~8 bytes por ID: un vector int64 ordenado y sin
+    repetidos por prefijo de sitio (MLM, MCO, ...).
+      - pertenencia O(log n) con searchsorted (`in` o `contiene` vectorizado)
+      - unión / intersección / diferencia con las operaciones de conjuntos de NumPy
+      - `agregar` acumula en un buffer pequeño que se fusiona cada UMBRAL_BUFFER IDs
+    IDs con formato inesperado se guardan aparte en un set normal.
+    """
+    UMBRAL_BUFFER = 65536
+
+    def __init__(self, ids: Optional[Iterable[str]] = None):
+        self._por_sitio: Dict[str, np.ndarray] = {}
+        self._otros: set = set()
+        self._buffer: set = set()
+        if ids is not None:
+            self._fusionar(ids)
+
+    @classmethod
+    def leer_archivo(cls, ruta: str) -> "ConjuntoIds":
+        """Un ID por línea (formato de los archivos de items procesados)"""
+        with open(ruta, encoding="utf-8") as f:
+            return cls(linea.strip() for linea in f if linea.strip())
+
+    def _fusionar(self, ids: Iterable[str]):
+        ids = ids if isinstance(ids, (list, tuple, np.ndarray)) else list(ids)
+        if len(ids) == 0:
+            return
+        prefijos, numeros, validos = _separar_ids(ids)
+        for prefijo in np.unique(prefijos[validos]):
+            nuevos = numeros[validos & (prefijos == prefijo)]
+            actual = self._por_sitio.get(prefijo)
+            self._por_sitio[prefijo] = np.union1d(actual, nuevos) if actual is not None else np.unique(nuevos)
+        if not validos.all():
+            self._otros.update(str(i).strip() for i, ok in zip(ids, validos) if not ok)
+
+    def _consolidar(self):
+        if self._buffer:
+            buffer, self._buffer = self._buffer, set()
+            self._fusionar(list(buffer))
+
+    def agregar(self, ids: Iterable[str]):
+        """Agrega IDs (se fusionan al vector ordenado por bloques)"""
+        self._buffer.update(ids)
+        if len(self._buffer) >= self.UMBRAL_BUFFER:
+            self._consolidar()
+
+    def __contains__(self, item_id) -> bool:
+        item_id = str(item_id).strip()
+        if item_id in self._buffer or item_id in self._otros:
+            return True
+        vector = self._por_sitio.get(item_id[:3])
+        digitos = item_id[3:]
+        if vector is None or not digitos.isdigit() or digitos.startswith("0"):
+            return False
+        numero = int(digitos)
+        pos = np.searchsorted(vector, numero)
+        return bool(pos < len(vector) and vector[pos] == numero)
+
+    def contiene(self, ids) -> np.ndarray:
+        """Máscara booleana de pertenencia para una columna/lista de IDs (p.ej. df['ID'])"""
+        self._consolidar()
+        prefijos, numeros, validos = _separar_ids(ids)
+        mascara = np.zeros(len(numeros), dtype=bool)
+        for prefijo, vector in self._por_sitio.items():
+            filas = validos & (prefijos == prefijo)
+            if filas.any() and len(vector):
+                pos = np.minimum(np.searchsorted(vector, numeros[filas]), len(vector) - 1)
+                mascara[filas] = vector[pos] == numeros[filas]
+        if self._otros and not validos.all():
+            texto = [str(i).strip() for i in np.asarray(ids, dtype=object)[~validos]]
+            mascara[~validos] = [t in self._otros for t in texto]
+        return mascara
+
+    def __len__(self) -> int:
+        self._consolidar()
+        return sum(len(v) for v in self._por_sitio.values()) + len(self._otros)
+
+    def __bool__(self) -> bool:
+        return len(self) > 0
+
+    def __iter__(self) -> Iterator[str]:
+        self._consolidar()
+        for prefijo, vector in self._por_sitio.items():
+            for numero in vector:
+                yield f"{prefijo}{numero}"
+        yield from self._otros
+
+    def lotes(self, tamano: int) -> Iterator[List[str]]:
+        """IDs en listas de `tamano` (para multiget) sin materializar todo como strings"""
+        lote: List[str] = []
+        for item_id in self:
+            lote.append(item_id)
+            if len(lote) >= tamano:
+                yield lote
+                lote = []
+        if lote:
+            yield lote
+
+    def _operar(self, otro, operacion, operacion_otros) -> "ConjuntoIds":
+        """`operacion` sobre los vectores por sitio y `operacion_otros` sobre los IDs irregulares"""
+        self._consolidar()
+        otro = otro if isinstance(otro, ConjuntoIds) else ConjuntoIds(otro)
+        otro._consolidar()
+        resultado = ConjuntoIds()
+        for prefijo in set(self._por_sitio) | set(otro._por_sitio):
+            a = self._por_sitio.get(prefijo, np.empty(0, dtype=np.int64))
+            b = otro._por_sitio.get(prefijo, np.empty(0, dtype=np.int64))
+            vector = operacion(a, b)
+            if len(vector):
+                resultado._por_sitio[prefijo] = vector
+        resultado._otros = operacion_otros(self._otros, otro._otros)
+        return resultado
+
+    def union(self, otro) -> "ConjuntoIds":
+        return self._operar(otro, np.union1d, set.union)
+
+    def interseccion(self, otro) -> "ConjuntoIds":
+        return self._operar(otro, lambda a, b: np.intersect1d(a, b, assume_unique=True), set.intersection)
+
+    def diferencia(self, otro) -> "ConjuntoIds":
+        return self._operar(otro, lambda a, b: np.setdiff1d(a, b, assume_unique=True), set.difference)
+
+    __or__ = union
+    __and__ = interseccion
+    __sub__ = diferencia
+
+    @property
+    def nbytes(self) -> int:
+        return sum(v.nbytes for v in self._por_sitio.values())
+
+
+# =========== Export columnar (Parquet) ===========
+
+FILAS_POR_GRUPO = 50000
+
+
+class EscritorParquet:
+    """
+    Escribe filas (dicts) a Parquet con un esquema fijo de pyarrow:
+    se acumulan en memoria y se vuelcan como row group cada `filas_por_grupo`.
+    Claves fuera del esquema se ignoran; las que faltan quedan nulas.
+    """
+    def __init__(self, ruta: str, esquema, filas_por_grupo: int = FILAS_POR_GRUPO,
+                 compresion: str = "zstd"):
+        import pyarrow.parquet as pq
+
+        self.ruta = ruta
+        self.esquema = esquema
+        self.filas_por_grupo = filas_por_grupo
+        self._columnas: Dict[str, List[Any]] = {nombre: [] for nombre in esquema.names}
+        self._pendientes = 0
+        self.filas = 0
+        self._writer = pq.ParquetWriter(ruta, esquema, compression=compresion)
+
+    def escribir(self, fila: Dict[str, Any]) -> bool:
+        """Agrega una fila; devuelve True si se volcó un row group"""
+        for nombre, valores in self._columnas.items():
+            valores.append(fila.get(nombre))
+        self._pendientes += 1
+        if self._pendientes >= self.filas_por_grupo:
+            self.volcar()
+            return True
+        return False
+
+    def volcar(self):
+        import pyarrow as pa
+
+        if not self._pendientes:
+            return
+        tabla = pa.Table.from_pydict(self._columnas, schema=self.esquema)
+        self._writer.write_table(tabla, row_group_size=self.filas_por_grupo)
+        self.filas += self._pendientes
+        self._columnas = {nombre: [] for nombre in self.esquema.names}
+        self._pendientes = 0
+
+    def cerrar(self):
+        self.volcar()
+        self._writer.close()
+
+
+# =========== Resultados compactos y reportes en streaming ===========
+
+class ResultadoItem:
+    """
+    Resultado mínimo por item (sin cuerpos de respuesta ni filas originales).
+    `estado` guarda, si la respuesta lo trae, solo los campos escritos tal como quedaron en ML.
+    """
+    __slots__ = ("id", "exitoso", "codigo_respuesta", "error", "estado")
+
+    def __init__(self, id: str, exitoso: bool, codigo_respuesta: Optional[int] = None,
+                 error: Optional[str] = None, estado: Optional[Dict[str, Any]] = None):
+        self.id = id
+        self.exitoso = exitoso
+        self.codigo_respuesta = codigo_respuesta
+        self.error = error
+        self.estado = estado
+
+    # Acceso tipo dict para el código que trataba los resultados como diccionarios
+    def __getitem__(self, clave: str) -> Any:
+        if clave not in self.__slots__:
+            raise KeyError(clave)
+        return getattr(self, clave)
+
+    def __contains__(self, clave: str) -> bool:
+        return clave in self.__slots__
+
+    def get(self, clave: str, default: Any = None) -> Any:
+        return getattr(self, clave) if clave in self.__slots__ else default
+
+
+def tipo_de_error(error: Optional[str]) -> str:
+    """Agrupa un mensaje de error por su prefijo (antes de ':')"""
+    error = error or "Error desconocido"
+    return error.split(':')[0] if ':' in error else error
+
+
+class ReporteStream:
+    """
+    Reporte de texto armado sin concatenar strings:
+      - el detalle se escribe a un archivo temporal a medida que llegan resultados
+      - al cerrar se escribe encabezado + errores más comunes y se copia el detalle
+    La memoria queda acotada por el número de tipos de error, no de items.
+    """
+    def __init__(self, archivo_salida: Optional[str] = None):
+        self.archivo_salida = archivo_salida
+        self.errores_por_tipo: Counter = Counter()
+        self._detalle = tempfile.TemporaryFile(mode="w+", encoding="utf-8")
+        self._lock = threading.Lock()
+
+    def registrar_error(self, error: Optional[str]):
+        with self._lock:
+            self.errores_por_tipo[tipo_de_error(error)] += 1
+
+    def sumar_errores(self, conteos: Dict[str, int]):
+        """Suma conteos ya agregados por tipo (validaciones vectorizadas)"""
+        with self._lock:
+            for tipo_error, cantidad in conteos.items():
+                if cantidad:
+                    self.errores_por_tipo[tipo_error] += int(cantidad)
+
+    def escribir_detalle(self, texto: str):
+        with self._lock:
+            self._detalle.write(texto)
+
+    def cerrar(self, encabezado: str, titulo_detalle: str) -> str:
+        """Escribe el reporte final; devuelve el encabezado (o el reporte completo si no hay archivo)"""
+        partes = [encabezado]
+        for tipo_error, cantidad in self.errores_por_tipo.most_common():
+            partes.append(f"{tipo_error}: {cantidad} ocurrencias\n")
+        partes.append(titulo_detalle)
+        resumen = "".join(partes)
+
+        self._detalle.seek(0)
+        if self.archivo_salida:
+            print(f"💾 Guardando reporte en: {self.archivo_salida}")
+            with open(self.archivo_salida, 'w', encoding='utf-8') as f:
+                f.write(resumen)
+                shutil.copyfileobj(self._detalle, f)
+            print(f"✅ Reporte guardado exitosamente")
+            self._detalle.close()
+            return resumen
+
+        completo = resumen + self._detalle.read()
+        self._detalle.close()
+        return completo
+
+
+# =========== Journal por item ===========
+
+class JournalItems:
+    """
+    Journal CSV append-only: una línea por item procesado (ts, id, estado, codigo, detalle + extras).
+    Cada línea se escribe con flush, así un corte deja registrado todo lo que ya se envió
+    y la siguiente corrida puede saltar esos items con `leer_ultimo_estado`.
+    El detalle se guarda en una sola línea para poder leer el journal por offsets (`leer_desde`).
+    """
+    COLUMNAS_BASE = ["ts", "id", "estado", "codigo", "detalle"]
+
+    def __init__(self, ruta: str, extras: Iterable[str] = ()):
+        self.ruta = ruta
+        self.columnas = self.COLUMNAS_BASE + list(extras)
+        nuevo = not os.path.exists(ruta) or os.path.getsize(ruta) == 0
+        if not nuevo:
+            # Un journal existente conserva su encabezado (columnas nuevas se ignoran)
+            with open(ruta, newline="", encoding="utf-8") as f:
+                self.columnas = next(csv.reader(f), self.columnas)
+        self._archivo = open(ruta, "a", newline="", encoding="utf-8")
+        self._writer = csv.DictWriter(self._archivo, fieldnames=self.columnas, extrasaction="ignore")
+        if nuevo:
+            self._writer.writeheader()
+            self._archivo.flush()
+        self._lock = threading.Lock()
+
+    def registrar(self, item_id: str, estado: str, codigo: Optional[int] = None,
+                  detalle: str = "", **extras):
+        fila = {"ts": datetime.now().isoformat(timespec="seconds"), "id": item_id, "estado": estado,
+                "codigo": "" if codigo is None else codigo, "detalle": " ".join((detalle or "").split())[:300], **extras}
+        with self._lock:
+            self._writer.writerow(fila)
+            self._archivo.flush()
+
+    def cerrar(self):
+        with self._lock:
+            self._archivo.close()
+
+    @staticmethod
+    def leer_ultimo_estado(ruta: str) -> Dict[str, Dict[str, str]]:
+        """Última línea registrada por id (vacío si el journal no existe)"""
+        ultimo: Dict[str, Dict[str, str]] = {}
+        if not os.path.exists(ruta):
+            return ultimo
+        with open(ruta, newline="", encoding="utf-8") as f:
+            for fila in csv.DictReader(f):
+                if fila.get("id"):
+                    ultimo[fila["id"]] = fila
+        return ultimo
+
+    @staticmethod
+    def leer_desde(ruta: str, offset: int = 0) -> Tuple[List[Dict[str, str]], int]:
+        """
+        Filas agregadas desde `offset` (bytes) y el nuevo offset.
+        Solo consume líneas completas; si el archivo es más corto que el offset
+        (journal reemplazado) vuelve a leer desde el inicio.
+        """
+        if not os.path.exists(ruta):
+            return [], 0
+        with open(ruta, "rb") as f:
+            encabezado = f.readline()
+            if offset > os.path.getsize(ruta) or offset < len(encabezado):
+                offset = len(encabezado)
+            f.seek(offset)
+            datos = f.read()
+        fin = datos.rfind(b"\n") + 1
+        columnas = next(csv.reader([encabezado.decode("utf-8")]), [])
+        lineas = datos[:fin].decode("utf-8").splitlines()
+        return list(csv.DictReader(lineas, fieldnames=columnas)), offset + fin
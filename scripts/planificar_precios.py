@@ -0,0 +1,194 @@
+#!/usr/bin/env python3
+"""
+Planificador offline de cambios de precio
+Cruza el archivo de precios (columnas: ID, Precio) con el snapshot local del catálogo
+(Mongo `items` o Parquet) y clasifica cada fila en: sin_cambio, aumento, baja, faltante, pausado
+Genera un archivo de trabajo pre-filtrado para que set_sku_ml solo toque items que cambian
+"""
+
+import os
+from datetime import datetime
+from typing import Any, Dict, Optional
+
+import numpy as np
+import pandas as pd
+
+from snapshot_catalogo import cargar_snapshot, describir_edad
+
+# === CONFIGURACIÓN ===
+OUTPUT_DIR = os.path.join("Output", "Plan_Precios")
+TOLERANCIA_PRECIO = 0.01  # misma tolerancia que set_sku_ml (centavos)
+
+CATEGORIAS = ["sin_cambio", "aumento", "baja", "faltante", "pausado"]
+
+
+def leer_archivo_precios(ruta_archivo: str) -> Optional[pd.DataFrame]:
+    """Lee el archivo de precios y normaliza ID/Precio de forma vectorizada"""
+    print(f"   📖 Leyendo archivo: {ruta_archivo}")
+    try:
+        if ruta_archivo.endswith(".xlsx"):
+            df = pd.read_excel(ruta_archivo, dtype={"ID": str})
+        else:
+            df = pd.read_csv(ruta_archivo, dtype={"ID": str})
+    except Exception as e:
+        print(f"   ❌ Error leyendo archivo: {e}")
+        return None
+
+    columnas_faltantes = [c for c in ["ID", "Precio"] if c not in df.columns]
+    if columnas_faltantes:
+        print(f"   ❌ Columnas faltantes en el archivo: {columnas_faltantes}")
+        return None
+
+    ids = df["ID"].astype("string").str.strip()
+    precios = pd.to_numeric(
+        df["Precio"].astype("string").str.strip().str.replace(",", "", regex=False),
+        errors="coerce",
+    )
+    # Mismo criterio de ID válido que set_sku_ml (_valid_item_id)
+    validos = (ids.notna() & (ids.str.len() >= 8) & ids.str[:3].str.isalpha() & precios.notna())
+    validos = validos.fillna(False).astype(bool)
+
+    entrada = pd.DataFrame({"ID": ids[validos], "Precio": precios[validos]})
+    # Último precio prevalece por ID
+    entrada = entrada.drop_duplicates(subset=["ID"], keep="last").reset_index(drop=True)
+
+    descartadas = len(df) - int(validos.sum())
+    print(f"   ✅ {len(entrada)} IDs únicos válidos ({descartadas} filas descartadas)")
+    return entrada
+
+
+def clasificar_cambios(entrada: pd.DataFrame, snapshot: pd.DataFrame,
+                       tolerancia: float = TOLERANCIA_PRECIO) -> pd.DataFrame:
+    """Une entrada y snapshot por ID y asigna una categoría por fila (vectorizado)"""
+    plan = entrada.merge(
+        snapshot[["id", "price", "status"]].rename(columns={"id": "ID", "price": "precio_actual"}),
+        on="ID",
+        how="left",
+    )
+    diferencia = plan["Precio"].to_numpy() - plan["precio_actual"].to_numpy(dtype=float)
+
+    faltante = plan["precio_actual"].isna().to_numpy()
+    pausado = (plan["status"] == "paused").fillna(False).to_numpy()
+    sin_cambio = np.abs(diferencia) <= tolerancia
+    aumento = diferencia > tolerancia
+
+    plan["categoria"] = np.select(
+        [faltante, pausado, sin_cambio, aumento],
+        ["faltante", "pausado", "sin_cambio", "aumento"],
+        default="baja",
+    )
+    plan["difiere"] = ~faltante & ~sin_cambio
+    plan["diferencia"] = diferencia
+    return plan
+
+
+def construir_archivo_trabajo(plan: pd.DataFrame, incluir_faltantes: bool = True,
+                              incluir_pausados: bool = True) -> pd.DataFrame:
+    """Filtra el plan a las filas que realmente deben enviarse a la API"""
+    mascara = plan["categoria"].isin(["aumento", "baja"])
+    if incluir_pausados:
+        mascara |= (plan["categoria"] == "pausado") & plan["difiere"]
+    if incluir_faltantes:
+        mascara |= plan["categoria"] == "faltante"
+    return plan.loc[mascara, ["ID", "Precio"]].reset_index(drop=True)
+
+
+def procesar_plan(archivo: str, tienda: str = "CO", fuente: str = "mongo",
+                  incluir_faltantes: bool = True, incluir_pausados: bool = True,
+                  archivo_salida: Optional[str] = None) -> Optional[Dict[str, Any]]:
+    """Ejecuta el plan completo: lectura, snapshot, clasificación y archivo de trabajo"""
+    print(f"🚀 Iniciando planificación de precios para tienda: {tienda}")
+    print("=" * 60)
+
+    print("📁 Paso 1/4: Leyendo archivo de precios...")
+    entrada = leer_archivo_precios(archivo)
+    if entrada is None:
+        return None
+
+    print("\n🗄️  Paso 2/4: Cargando snapshot del catálogo...")
+    snapshot, fecha_snapshot = cargar_snapshot(fuente, entrada["ID"].tolist(), origen=tienda)
+    print(f"✅ Antigüedad del snapshot: {describir_edad(fecha_snapshot)}")
+
+    print("\n📊 Paso 3/4: Clasificando cambios...")
+    plan = clasificar_cambios(entrada, snapshot)
+    conteos = plan["categoria"].value_counts().reindex(CATEGORIAS, fill_value=0).to_dict()
+
+    print("\n💾 Paso 4/4: Generando archivo de trabajo...")
+    trabajo = construir_archivo_trabajo(plan, incluir_faltantes, incluir_pausados)
+    os.makedirs(OUTPUT_DIR, exist_ok=True)
+    archivo_salida = archivo_salida or os.path.join(OUTPUT_DIR, f"{tienda}_trabajo.xlsx")
+    if archivo_salida.endswith(".xlsx"):
+        trabajo.to_excel(archivo_salida, index=False)
+    else:
+        trabajo.to_csv(archivo_salida, index=False, encoding="utf-8")
+    print(f"✅ Archivo de trabajo guardado: {archivo_salida} ({len(trabajo)} filas)")
+    print("=" * 60)
+
+    return {
+        "tienda": tienda,
+        "total_items": len(plan),
+        "conteos": {k: int(v) for k, v in conteos.items()},
+        "items_a_enviar": len(trabajo),
+        "archivo_trabajo": archivo_salida,
+        "fecha_snapshot": fecha_snapshot,
+    }
+
+
+def main():
+    """Función principal"""
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Planificar cambios de precio contra el snapshot local del catálogo')
+    parser.add_argument('archivo', help='Archivo Excel/CSV con columnas ID y Precio')
+    parser.add_argument('--tienda', default='CO', choices=["CO", "DS", "TE", "TS", "CA"],
+                        help='Tienda a planear (default: CO)')
+    parser.add_argument('--snapshot', default='mongo',
+                        help="Fuente del snapshot: 'mongo' o ruta a un archivo .parquet (default: mongo)")
+    parser.add_argument('--salida', help='Archivo de trabajo pre-filtrado (.xlsx o .csv)')
+    parser.add_argument('--excluir-faltantes', action='store_true',
+                        help='No incluir IDs ausentes del snapshot en el archivo de trabajo')
+    parser.add_argument('--excluir-pausados', action='store_true',
+                        help='No incluir publicaciones pausadas en el archivo de trabajo')
+
+    args = parser.parse_args()
+
+    print("🎯 PLANIFICADOR DE PRECIOS MERCADOLIBRE")
+    print("=" * 50)
+    print(f"📁 Archivo: {args.archivo}")
+    print(f"🏪 Tienda: {args.tienda}")
+    print(f"🗄️  Snapshot: {args.snapshot}")
+    print(f"⏰ Inicio: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
+    print("=" * 50)
+
+    if not os.path.exists(args.archivo):
+        print(f"❌ Error: El archivo {args.archivo} no existe")
+        return
+
+    resultado = procesar_plan(
+        args.archivo,
+        tienda=args.tienda,
+        fuente=args.snapshot,
+        incluir_faltantes=not args.excluir_faltantes,
+        incluir_pausados=not args.excluir_pausados,
+        archivo_salida=args.salida,
+    )
+    if not resultado:
+        print("❌ Error en la planificación")
+        return
+
+    total = resultado["total_items"] or 1
+    print("\n" + "=" * 60)
+    print("📊 RESUMEN DEL PLAN")
+    print("=" * 60)
+    print(f"📈 Total items: {resultado['total_items']}")
+    for categoria in CATEGORIAS:
+        cantidad = resultado["conteos"][categoria]
+        print(f"   {categoria:<12} {cantidad:>8} ({cantidad / total * 100:.1f}%)")
+    print(f"🚀 Items a enviar: {resultado['items_a_enviar']}")
+    print(f"📄 Archivo de trabajo: {resultado['archivo_trabajo']}")
+    print(f"   Úsalo como INPUT_FILE en set_sku_ml.py")
+    print("=" * 60)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,262 @@
+#!/usr/bin/env python3
+"""
+Motor de reglas para precios de oferta (DEAL)
+Calcula PrecioOferta para catálogos completos con aritmética de columnas (NumPy):
+- descuento % sobre el precio base (original_price si existe, si no price)
+- piso de margen mínimo sobre el costo
+- redondeo a terminación .99 (configurable: paso y terminación)
+- restricciones de ML: descuento mínimo/máximo y el rango min/max_discounted_price por item
+Entradas: archivo de costos (ID, Costo[, SKU]), reglas (prefijo_sku, descuento_pct, margen_minimo_pct),
+snapshot del catálogo y opcionalmente el export de candidatos de get_candidates
+Salida: archivo PublicacionID/PrecioOferta listo para aplicar_promocion (o aplicado directo con --aplicar)
+"""
+
+import os
+import time
+from datetime import datetime
+from typing import Any, Dict, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from snapshot_catalogo import cargar_snapshot, describir_edad
+
+# === CONFIGURACIÓN ===
+OUTPUT_DIR = os.path.join("Output", "Precios_Oferta")
+DESCUENTO_MINIMO_ML = 5.0    # % mínimo que ML exige para que la oferta sea válida
+DESCUENTO_MAXIMO_ML = 80.0   # % máximo aceptado cuando el item no trae su propio rango
+PASO_REDONDEO = 1.0          # los precios terminan en k * paso + terminación
+TERMINACION = 0.99           # para COP sin decimales usar p. ej. paso 1000 y terminación 900
+
+COLUMNAS_REGLAS = ["prefijo_sku", "descuento_pct", "margen_minimo_pct"]
+MOTIVOS = ["ok", "inactivo", "sin_precio", "sin_regla", "sin_costo", "margen_insuficiente", "fuera_de_rango"]
+
+
+def _leer_tabla(ruta: str, **kwargs) -> pd.DataFrame:
+    if ruta.endswith(".parquet"):
+        return pd.read_parquet(ruta, **kwargs)
+    if ruta.endswith(".xlsx"):
+        return pd.read_excel(ruta, **kwargs)
+    return pd.read_csv(ruta, **kwargs)
+
+
+def leer_reglas(ruta: str) -> pd.DataFrame:
+    """Reglas por prefijo de SKU; prefijo vacío = regla por defecto. Gana el prefijo más largo"""
+    reglas = _leer_tabla(ruta, dtype={"prefijo_sku": str})
+    reglas.columns = [c.strip().lower() for c in reglas.columns]
+    faltantes = [c for c in ["descuento_pct"] if c not in reglas.columns]
+    if faltantes:
+        raise ValueError(f"Columnas faltantes en el archivo de reglas: {faltantes}")
+    for col in COLUMNAS_REGLAS:
+        if col not in reglas.columns:
+            reglas[col] = np.nan
+    reglas["prefijo_sku"] = reglas["prefijo_sku"].fillna("").astype(str).str.strip().str.upper()
+    reglas["descuento_pct"] = pd.to_numeric(reglas["descuento_pct"], errors="coerce")
+    reglas["margen_minimo_pct"] = pd.to_numeric(reglas["margen_minimo_pct"], errors="coerce")
+    invalidas = reglas["descuento_pct"].isna() | (reglas["descuento_pct"] < 0) | (reglas["descuento_pct"] >= 100)
+    if invalidas.any():
+        raise ValueError(f"descuento_pct inválido en las filas {(reglas.index[invalidas] + 2).tolist()}")
+    reglas = reglas.drop_duplicates(subset=["prefijo_sku"], keep="last")
+    orden = reglas["prefijo_sku"].str.len().sort_values(kind="stable").index
+    return reglas.loc[orden, COLUMNAS_REGLAS].reset_index(drop=True)
+
+
+def asignar_reglas(skus: pd.Series, reglas: pd.DataFrame) -> np.ndarray:
+    """Índice de regla por fila (-1 sin regla); una máscara vectorizada por regla"""
+    skus = skus.fillna("").astype(str).str.upper()
+    asignada = np.full(len(skus), -1, dtype=np.int64)
+    for i, prefijo in enumerate(reglas["prefijo_sku"]):  # ordenadas por largo: el más largo pisa
+        mascara = skus.str.startswith(prefijo).to_numpy() if prefijo else np.ones(len(skus), dtype=bool)
+        asignada[mascara] = i
+    return asignada
+
+
+def redondear_abajo(precios: np.ndarray, paso: float = PASO_REDONDEO,
+                    terminacion: float = TERMINACION) -> np.ndarray:
+    """Mayor valor k * paso + terminación que no supera el precio"""
+    return np.floor((precios - terminacion) / paso + 1e-9) * paso + terminacion
+
+
+def redondear_arriba(precios: np.ndarray, paso: float = PASO_REDONDEO,
+                     terminacion: float = TERMINACION) -> np.ndarray:
+    """Menor valor k * paso + terminación que no queda por debajo del precio"""
+    return np.ceil((precios - terminacion) / paso - 1e-9) * paso + terminacion
+
+
+def calcular_precios(catalogo: pd.DataFrame, reglas: pd.DataFrame, paso: float = PASO_REDONDEO,
+                     terminacion: float = TERMINACION) -> pd.DataFrame:
+    """
+    catalogo: id, sku, status, precio_base, costo y opcionalmente min/max_discounted_price.
+    Devuelve el catálogo con deal_price, descuento_real y motivo ('ok' o por qué se excluye).
+    """
+    n = len(catalogo)
+    base = pd.to_numeric(catalogo["precio_base"], errors="coerce").to_numpy(dtype=float)
+    costo = pd.to_numeric(catalogo["costo"], errors="coerce").to_numpy(dtype=float)
+    rango_min = pd.to_numeric(catalogo.get("min_discounted_price", pd.Series(np.nan, index=catalogo.index)),
+                              errors="coerce").to_numpy(dtype=float)
+    rango_max = pd.to_numeric(catalogo.get("max_discounted_price", pd.Series(np.nan, index=catalogo.index)),
+                              errors="coerce").to_numpy(dtype=float)
+
+    regla = asignar_reglas(catalogo["sku"], reglas)
+    con_regla = regla >= 0
+    descuento = np.where(con_regla, reglas["descuento_pct"].to_numpy(dtype=float)[regla], np.nan)
+    margen = np.where(con_regla, reglas["margen_minimo_pct"].to_numpy(dtype=float)[regla], np.nan)
+
+    # Límites que acepta ML: el rango propio del item si viene, si no los descuentos globales
+    superior = np.fmin(base * (1 - DESCUENTO_MINIMO_ML / 100), rango_max)
+    inferior = np.fmax(base * (1 - DESCUENTO_MAXIMO_ML / 100), rango_min)
+
+    exige_margen = ~np.isnan(margen)
+    piso = np.where(exige_margen, costo * (1 + np.nan_to_num(margen) / 100), 0.0)
+    minimo = np.fmax(piso, inferior)
+
+    objetivo = np.clip(base * (1 - descuento / 100), minimo, superior)
+    deal = redondear_abajo(objetivo, paso, terminacion)
+    deal = np.where(deal < minimo, redondear_arriba(minimo, paso, terminacion), deal)
+    deal = np.round(deal, 2)
+
+    activo = (catalogo["status"].fillna("active").astype(str).str.lower() == "active").to_numpy()
+    sin_precio = np.isnan(base) | (base <= 0)
+    sin_costo = exige_margen & (np.isnan(costo) | (costo <= 0))
+    margen_insuficiente = piso > superior
+    fuera_de_rango = (deal > superior + 1e-9) | (deal < inferior - 1e-9) | (deal <= 0)
+
+    motivo = np.select(
+        [~activo, sin_precio, ~con_regla, sin_costo, margen_insuficiente, fuera_de_rango],
+        MOTIVOS[1:],
+        default="ok",
+    )
+    valido = motivo == "ok"
+    resultado = catalogo.copy()
+    resultado["regla"] = np.where(con_regla, reglas["prefijo_sku"].to_numpy(dtype=object)[regla], None)
+    resultado["deal_price"] = np.where(valido, deal, np.nan)
+    with np.errstate(divide="ignore", invalid="ignore"):  # base 0/NaN ya quedó como sin_precio
+        resultado["descuento_real"] = np.where(valido, np.round((1 - deal / base) * 100, 2), np.nan)
+    resultado["motivo"] = motivo
+    return resultado
+
+
+def cargar_catalogo(costos: str, fuente: str = "mongo", tienda: str = "CO",
+                    candidatos: Optional[str] = None) -> Tuple[pd.DataFrame, Optional[datetime]]:
+    """Cruza costos + snapshot (+ rango por item del export de candidatos) en un solo frame"""
+    print(f"   📖 Leyendo costos: {costos}")
+    df_costos = _leer_tabla(costos, dtype={"ID": str, "SKU": str})
+    if "ID" not in df_costos.columns or "Costo" not in df_costos.columns:
+        raise ValueError("El archivo de costos debe tener columnas ID y Costo")
+    df_costos = pd.DataFrame({
+        "id": df_costos["ID"].astype(str).str.strip(),
+        "costo": pd.to_numeric(df_costos["Costo"].astype(str).str.replace(",", "", regex=False), errors="coerce"),
+        "sku_archivo": df_costos["SKU"].astype("string").str.strip() if "SKU" in df_costos.columns else pd.NA,
+    }).drop_duplicates(subset=["id"], keep="last")
+
+    rango = None
+    if candidatos:
+        print(f"   📖 Leyendo candidatos: {candidatos}")
+        rango = _leer_tabla(candidatos)
+        rango = rango[rango["status"].astype(str) == "candidate"] if "status" in rango.columns else rango
+        columnas = [c for c in ["id", "original_price", "min_discounted_price", "max_discounted_price"]
+                    if c in rango.columns]
+        rango = rango[columnas].drop_duplicates(subset=["id"], keep="last")
+        df_costos = df_costos[df_costos["id"].isin(rango["id"])]
+
+    snapshot, fecha = cargar_snapshot(fuente, df_costos["id"].tolist(), origen=tienda)
+    catalogo = df_costos.merge(snapshot, on="id", how="left")
+    if rango is not None:
+        catalogo = catalogo.merge(rango, on="id", how="left")
+    precio_base = catalogo["price"]
+    if "original_price" in catalogo.columns:
+        precio_base = pd.to_numeric(catalogo["original_price"], errors="coerce").fillna(precio_base)
+    catalogo["precio_base"] = precio_base
+    catalogo["sku"] = catalogo["sku_archivo"].fillna(catalogo["seller_custom_field"])
+    return catalogo.drop(columns=["sku_archivo"]), fecha
+
+
+def procesar_precios(costos: str, reglas_path: str, tienda: str = "CO", fuente: str = "mongo",
+                     candidatos: Optional[str] = None, paso: float = PASO_REDONDEO,
+                     terminacion: float = TERMINACION,
+                     archivo_salida: Optional[str] = None) -> Optional[Dict[str, Any]]:
+    """Ejecuta el cálculo completo y guarda el archivo para aplicar_promocion"""
+    print(f"🚀 Calculando precios de oferta para tienda: {tienda}")
+    print("=" * 60)
+
+    print("📁 Paso 1/3: Leyendo reglas y catálogo...")
+    try:
+        reglas = leer_reglas(reglas_path)
+        catalogo, fecha_snapshot = cargar_catalogo(costos, fuente, tienda, candidatos)
+    except (OSError, ValueError) as e:
+        print(f"❌ Error leyendo entradas: {e}")
+        return None
+    print(f"✅ {len(reglas)} reglas, {len(catalogo)} items; snapshot: {describir_edad(fecha_snapshot)}")
+
+    print("\n🧮 Paso 2/3: Aplicando reglas...")
+    start = time.time()
+    resultado = calcular_precios(catalogo, reglas, paso, terminacion)
+    print(f"✅ Calculado en {time.time() - start:.3f}s")
+    conteos = resultado["motivo"].value_counts().reindex(MOTIVOS, fill_value=0)
+
+    print("\n💾 Paso 3/3: Guardando archivos...")
+    os.makedirs(OUTPUT_DIR, exist_ok=True)
+    archivo_salida = archivo_salida or os.path.join(OUTPUT_DIR, f"{tienda}.csv")
+    validos = resultado[resultado["motivo"] == "ok"]
+    salida = pd.DataFrame({"PublicacionID": validos["id"], "PrecioOferta": validos["deal_price"]})
+    salida.to_csv(archivo_salida, index=False, encoding="utf-8")
+    archivo_detalle = os.path.splitext(archivo_salida)[0] + "_detalle.csv"
+    resultado.to_csv(archivo_detalle, index=False, encoding="utf-8")
+    print(f"✅ Archivo para aplicar_promocion: {archivo_salida} ({len(salida)} filas)")
+    print(f"✅ Detalle con motivos: {archivo_detalle}")
+    print("=" * 60)
+
+    return {
+        "tienda": tienda,
+        "total_items": len(resultado),
+        "conteos": {k: int(v) for k, v in conteos.items()},
+        "archivo": archivo_salida,
+        "items": list(zip(salida["PublicacionID"].tolist(), salida["PrecioOferta"].astype(float).tolist())),
+    }
+
+
+def main():
+    """Función principal"""
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Calcula precios de oferta con reglas y los deja listos para aplicar')
+    parser.add_argument('costos', help='CSV/Excel/Parquet con columnas ID, Costo (y opcional SKU)')
+    parser.add_argument('reglas', help='CSV/Excel con columnas prefijo_sku, descuento_pct, margen_minimo_pct')
+    parser.add_argument('--tienda', default='CO', choices=["CO", "DS", "TE", "TS", "CA"])
+    parser.add_argument('--snapshot', default='mongo',
+                        help="Fuente del snapshot: 'mongo' o ruta a un archivo .parquet (default: mongo)")
+    parser.add_argument('--candidatos', help='Export de get_candidates (.parquet/.csv) con el rango por item')
+    parser.add_argument('--paso', type=float, default=PASO_REDONDEO, help=f'Paso de redondeo (default: {PASO_REDONDEO})')
+    parser.add_argument('--terminacion', type=float, default=TERMINACION,
+                        help=f'Terminación del precio (default: {TERMINACION})')
+    parser.add_argument('--salida', help='Archivo de salida (default: Output/Precios_Oferta/<tienda>.csv)')
+    parser.add_argument('--aplicar', action='store_true', help='Aplicar la promoción al terminar')
+    parser.add_argument('--promocion', help='ID de la promoción para --aplicar (default: <TIENDA>_PROMOTION_ID)')
+    args = parser.parse_args()
+
+    resultado = procesar_precios(args.costos, args.reglas, args.tienda, args.snapshot, args.candidatos,
+                                 args.paso, args.terminacion, args.salida)
+    if not resultado:
+        return
+
+    total = resultado["total_items"] or 1
+    print("\n📊 RESUMEN")
+    for motivo in MOTIVOS:
+        cantidad = resultado["conteos"][motivo]
+        print(f"   {motivo:<20} {cantidad:>8} ({cantidad / total * 100:.1f}%)")
+
+    if args.aplicar and resultado["items"]:
+        import asyncio
+        from aplicar_promocion import TIENDAS, aplicar_promocion, configurar_logging
+
+        configurar_logging(args.tienda)
+        resumen = asyncio.run(aplicar_promocion(args.tienda, TIENDAS[args.tienda], resultado["items"],
+                                                args.promocion))
+        print(f"\n🚀 Promoción aplicada: {resumen['ok']} OK, {resumen['fallidos']} fallidos, "
+              f"{resumen['ya_aplicados']} sin cambio")
+    else:
+        print(f"\n📄 Usa {resultado['archivo']} con aplicar_promocion.py --archivo o en un manifiesto de campaña")
+
+
+if __name__ == "__main__":
+    main()
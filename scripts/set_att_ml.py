@@ -15,6 +15,8 @@ from urllib3.util.retry import Retry
 from tqdm import tqdm
 from dotenv import load_dotenv
 
+from ml_comun import ConjuntoIds
+
 # ---------------- Config & Logging (archivo + consola selectiva) ----------------
 TIENDA = "TE"
 LOG_FILE = f"marcas_{TIENDA}.log"
@@ -514,16 +516,12 @@ def jitter():
     return (random.random() - 0.5) * 2 * JITTER_MAX  # [-JITTER_MAX, +JITTER_MAX]
 
 # ---------------- Gestión de items procesados ----------------
-def load_processed_items() -> set:
-    """Carga los items ya procesados exitosamente desde el archivo"""
-    processed_items = set()
+def load_processed_items() -> ConjuntoIds:
+    """Carga los items ya procesados exitosamente desde el archivo (conjunto compacto de IDs)"""
+    processed_items = ConjuntoIds()
     try:
         if os.path.exists(PROCESSED_ITEMS_FILE):
-            with open(PROCESSED_ITEMS_FILE, 'r', encoding='utf-8') as f:
-                for line in f:
-                    item_id = line.strip()
-                    if item_id:
-                        processed_items.add(item_id)
+            processed_items = ConjuntoIds.leer_archivo(PROCESSED_ITEMS_FILE)
             log_file_only("INFO", f"📋 Cargados {len(processed_items)} items ya procesados exitosamente")
     except Exception as e:
         log_file_only("WARNING", f"⚠️ Error cargando items procesados: {e}")
@@ -539,7 +537,7 @@ def save_processed_items_batch(processed_items: list):
     except Exception as e:
         log_file_only("ERROR", f"❌ Error guardando items procesados: {e}")
 
-def remove_processed_items_from_excel(processed_items: set, excel_path: str) -> bool:
+def remove_processed_items_from_excel(processed_items: ConjuntoIds, excel_path: str) -> bool:
     """Elimina los items procesados del archivo Excel y guarda una copia de respaldo"""
     try:
         # Leer el Excel actual
@@ -547,7 +545,7 @@ def remove_processed_items_from_excel(processed_items: set, excel_path: str) ->
         original_count = len(df)
         
         # Filtrar items no procesados
-        df_filtered = df[~df['ID'].isin(processed_items)]
+        df_filtered = df[~processed_items.contiene(df['ID'])]
         remaining_count = len(df_filtered)
         removed_count = original_count - remaining_count
         
@@ -818,7 +816,7 @@ def main():
         
         # Filtrar items ya procesados
         if processed_items:
-            df = df[~df['ID'].isin(processed_items)]
+            df = df[~processed_items.contiene(df['ID'])]
             filtered_count = len(df)
             skipped_count = original_count - filtered_count
             log_console_and_file("INFO", f"⏭️ Saltando {skipped_count} items ya procesados exitosamente")
@@ -940,7 +938,7 @@ def main():
         if ok_count > 0:
             log_console_and_file("INFO", "🔄 Actualizando archivo Excel...")
             # Crear set con items procesados en esta ejecución
-            current_session_processed = set(successful_items)
+            current_session_processed = ConjuntoIds(successful_items)
             
             # Agregar items procesados en esta sesión a la lista total
             all_processed_items = processed_items.union(current_session_processed)
@@ -2,6 +2,7 @@ import os
 import time
 import logging
 import threading
+import queue
 import tempfile
 from datetime import datetime
 
@@ -11,6 +12,8 @@ from requests.adapters import HTTPAdapter
 from urllib3.util.retry import Retry
 from dotenv import load_dotenv
 
+from ml_comun import ConjuntoIds, obtener_limitador
+
 # 🔽 IMPORTS PARA MANEJO DE URLs
 from urllib.parse import urlparse, urljoin
 import json
@@ -57,17 +60,22 @@ def log_file_only(level, message):
     elif level == "ERROR":
         logger.error(message)
 
-# Función para log en consola y archivo
+# Función para log en consola y archivo (con lock: los workers del pipeline comparten el handler)
+_console_lock = threading.Lock()
+
 def log_console_and_file(level, message):
     """Log que va tanto a consola como a archivo"""
-    logger.addHandler(console_handler)
-    if level == "INFO":
-        logger.info(message)
-    elif level == "WARNING":
-        logger.warning(message)
-    elif level == "ERROR":
-        logger.error(message)
-    logger.removeHandler(console_handler)
+    with _console_lock:
+        logger.addHandler(console_handler)
+        try:
+            if level == "INFO":
+                logger.info(message)
+            elif level == "WARNING":
+                logger.warning(message)
+            elif level == "ERROR":
+                logger.error(message)
+        finally:
+            logger.removeHandler(console_handler)
 
 load_dotenv()
 
@@ -77,8 +85,19 @@ REFRESH_TOKEN = os.getenv(f"{TIENDA}_REFRESH_TOKEN", "").strip()
 CLIENT_ID = os.getenv(f"{TIENDA}_CLIENT_ID", "").strip()
 CLIENT_SECRET = os.getenv(f"{TIENDA}_CLIENT_SECRET", "").strip()
 
-# Parámetros de procesamiento
-MAX_WORKERS = 5  # Reducido porque subir imágenes es más pesado
+# Parámetros de procesamiento (pipeline validar → descargar → subir → adjuntar)
+# Cada etapa tiene sus propios workers y su propio límite de tasa:
+#   - validar/descargar: servidor de origen de la imagen (un limitador por host)
+#   - subir: endpoint /pictures de ML
+#   - adjuntar: PUT /items de ML
+WORKERS_VALIDAR = 16
+WORKERS_DESCARGAR = 16
+WORKERS_SUBIR = 8
+WORKERS_ADJUNTAR = 4
+TAMANO_COLA = 64        # tareas en espera entre etapas (acota memoria y archivos temporales)
+RPM_ORIGEN = 1200       # por host de origen (HEAD + GET comparten el límite)
+RPM_PICTURES = 600      # subidas a /pictures
+RPM_ITEMS = 300         # PUT de items
 TIMEOUT_DOWNLOAD = 30  # Timeout para descargar imágenes
 TIMEOUT_UPLOAD = 60  # Timeout para subir imágenes
 TIMEOUT_UPDATE = 30  # Timeout para actualizar item
@@ -167,6 +186,17 @@ class TokenManager:
                 log_file_only("ERROR", f"❌ Refresh token falló: {e}")
                 return False
 
+    def refresh_if_current(self, token_usado: str) -> bool:
+        """Refresca solo si nadie lo hizo ya desde que se usó `token_usado` (un refresh por ráfaga de 401)"""
+        with self._lock:
+            if self._access_token != token_usado:
+                return True
+            try:
+                return self._refresh_locked()
+            except Exception as e:
+                log_file_only("ERROR", f"❌ Refresh token falló: {e}")
+                return False
+
     def _refresh_locked(self) -> bool:
         """Lógica interna de refresh (asume lock tomado)"""
         payload = {
@@ -225,8 +255,8 @@ def get_session() -> requests.Session:
                 raise_on_status=False
             )
             adapter = HTTPAdapter(
-                pool_connections=MAX_WORKERS,
-                pool_maxsize=MAX_WORKERS * 2,
+                pool_connections=16,
+                pool_maxsize=WORKERS_VALIDAR + WORKERS_DESCARGAR + WORKERS_SUBIR + WORKERS_ADJUNTAR,
                 max_retries=retry,
             )
             s.mount("https://", adapter)
@@ -247,16 +277,12 @@ def get_session() -> requests.Session:
 
 # ==================== FUNCIONES DE PROCESAMIENTO ====================
 
-def load_processed_items() -> set:
-    """Carga los items ya procesados exitosamente"""
-    processed_items = set()
+def load_processed_items() -> ConjuntoIds:
+    """Carga los items ya procesados exitosamente (conjunto compacto de IDs)"""
+    processed_items = ConjuntoIds()
     try:
         if os.path.exists(PROCESSED_ITEMS_FILE):
-            with open(PROCESSED_ITEMS_FILE, 'r', encoding='utf-8') as f:
-                for line in f:
-                    item_id = line.strip()
-                    if item_id:
-                        processed_items.add(item_id)
+            processed_items = ConjuntoIds.leer_archivo(PROCESSED_ITEMS_FILE)
             log_file_only("INFO", f"📋 Cargados {len(processed_items)} items ya procesados")
     except Exception as e:
         log_file_only("WARNING", f"⚠️ Error cargando items procesados: {e}")
@@ -467,7 +493,7 @@ def upload_image_to_ml(image_path: str, item_id: str, image_num: int) -> tuple[b
         elif resp.status_code == 401:
             # Token expirado, intentar refresh
             log_console_and_file("WARNING", f"🔐 [{item_id}] Imagen {image_num}: Token expirado (401), refrescando...")
-            if token_manager.refresh_blocking():
+            if token_manager.refresh_if_current(headers["Authorization"].removeprefix("Bearer ")):
                 log_console_and_file("INFO", f"🔄 [{item_id}] Imagen {image_num}: Token refrescado, reintentando...")
                 # Reintentar con nuevo token
                 return upload_image_to_ml(image_path, item_id, image_num)
@@ -531,7 +557,7 @@ def update_item_pictures(item_id: str, picture_ids: list) -> tuple[bool, str]:
         elif resp.status_code == 401:
             # Token expirado, intentar refresh
             log_console_and_file("WARNING", f"🔐 [{item_id}] Token expirado (401) al actualizar, refrescando...")
-            if token_manager.refresh_blocking():
+            if token_manager.refresh_if_current(headers["Authorization"].removeprefix("Bearer ")):
                 log_console_and_file("INFO", f"🔄 [{item_id}] Token refrescado, reintentando actualización...")
                 # Reintentar con nuevo token
                 return update_item_pictures(item_id, picture_ids)
@@ -561,185 +587,219 @@ def update_item_pictures(item_id: str, picture_ids: list) -> tuple[bool, str]:
         log_file_only("ERROR", f"   └─ Stack trace: {str(e)}")
         return False, error_msg
 
-def process_item(row: pd.Series, item_num: int, total_items: int) -> dict:
+def collect_image_urls(values) -> list:
+    """URLs http(s) de las columnas Imagen* en su orden original (descarta vacías / NaN)"""
+    image_urls = []
+    for url in values:
+        if url and url not in ['', 'nan', 'None', 'NaN', 'null'] and not pd.isna(url):
+            u = str(url).strip()
+            if u and (u.startswith("http://") or u.startswith("https://")):
+                image_urls.append(u)
+    return image_urls
+
+def origin_limiter(url: str):
+    """Limitador compartido por todas las peticiones al mismo host de origen"""
+    return obtener_limitador(f"origen:{urlparse(url).netloc}", RPM_ORIGEN)
+
+def validate_url(url: str, item_id: str, image_num: int) -> bool:
     """
-    Procesa un item completo: valida URLs, descarga imágenes, sube a ML y actualiza item
-    Retorna: dict con estado del procesamiento y estadísticas
+    Valida que la URL sea accesible (HEAD; si el servidor no lo permite, GET de los primeros 1024 bytes)
+    Retorna: True si respondió 200/206
     """
-    item_id = str(row['ID']).strip()
-    
-    log_console_and_file("INFO", f"\n{'='*70}")
-    log_console_and_file("INFO", f"🎯 PROCESANDO ITEM {item_num}/{total_items}: {item_id}")
-    log_console_and_file("INFO", f"{'='*70}")
-    
-    # Recolectar URLs de imágenes (columnas que empiezan con "Imagen")
-    image_urls = []
-    for col in row.index:
-        if col.startswith('Imagen'):
-            url = row[col]
-            # Validar que la URL no sea vacía, NaN, o valores inválidos
-            if url and url not in ['', 'nan', 'None', 'NaN', 'null'] and not pd.isna(url):
-                u = str(url).strip()
-                if u and (u.startswith("http://") or u.startswith("https://")):
-                    image_urls.append((col, u))
-    
-    if not image_urls:
-        error_msg = "No hay URLs de imágenes válidas en el CSV"
-        log_console_and_file("WARNING", f"🟡 [{item_id}] {error_msg}, se omite")
-        return {
-            "success": False,
-            "item_id": item_id,
-            "error": error_msg,
-            "omitted": True,
-            "images_found": 0,
-            "images_uploaded": 0,
-            "images_failed": 0
-        }
-    
-    log_console_and_file("INFO", f"📸 [{item_id}] Total de imágenes encontradas: {len(image_urls)}")
-    log_file_only("INFO", f"   └─ Columnas con imágenes: {[col for col, _ in image_urls]}")
-    
-    # PASO 1: Validar URLs de imágenes (accesibilidad)
-    log_console_and_file("INFO", f"\n📋 [{item_id}] Paso 1: Validando accesibilidad de {len(image_urls)} URLs...")
-    log_console_and_file("INFO", f"📋 [{item_id}] Formato: Imagen # - Link - Status Code - Content Type")
-    validated_urls = []
-    for idx, (col_name, url) in enumerate(image_urls, start=1):
-        try:
-            # Intentar HEAD request primero (más rápido)
-            resp = requests.head(url, timeout=10, allow_redirects=True)
+    try:
+        session = get_session()
+        resp = session.head(url, timeout=10, allow_redirects=True)
+        content_type = resp.headers.get('Content-Type', 'N/A')
+
+        if resp.status_code == 405:
+            log_file_only("INFO", f"      └─ HEAD no permitido (405), intentando GET con rango...")
+            resp = session.get(url, headers={'Range': 'bytes=0-1023'}, timeout=10, allow_redirects=True, stream=True)
             content_type = resp.headers.get('Content-Type', 'N/A')
-            
-            # Si HEAD da 405 (Method Not Allowed), intentar GET con rango limitado
-            if resp.status_code == 405:
-                log_file_only("INFO", f"      └─ HEAD no permitido (405), intentando GET con rango...")
-                # GET request con rango de solo los primeros 1024 bytes para verificar
-                headers = {'Range': 'bytes=0-1023'}
-                resp = requests.get(url, headers=headers, timeout=10, allow_redirects=True, stream=True)
-                content_type = resp.headers.get('Content-Type', 'N/A')
-                resp.close()  # Cerrar inmediatamente ya que solo queremos validar
-            
-            # Log con formato solicitado
-            log_console_and_file("INFO", f"📋 [{item_id}] Imagen {idx} - {url} - {resp.status_code} - {content_type}")
-            
-            # Aceptar códigos de éxito (200, 206 para partial content)
-            if resp.status_code in (200, 206):
-                validated_urls.append((col_name, url))
-                log_file_only("INFO", f"      └─ ✅ URL válida")
-            else:
-                log_file_only("INFO", f"      └─ ⚠️ URL inaccesible")
-        except Exception as e:
-            log_console_and_file("WARNING", f"📋 [{item_id}] Imagen {idx} - {url} - ERROR - {str(e)}")
-            log_file_only("WARNING", f"      └─ ⚠️ Error validando URL: {e}")
-    
-    if not validated_urls:
-        error_msg = f"Ninguna de las {len(image_urls)} URLs es accesible"
-        log_console_and_file("WARNING", f"🟡 [{item_id}] {error_msg}, se omite")
-        return {
-            "success": False,
-            "item_id": item_id,
-            "error": error_msg,
-            "omitted": True,
-            "images_found": len(image_urls),
-            "images_uploaded": 0,
-            "images_failed": len(image_urls)
+            resp.close()
+
+        log_console_and_file("INFO", f"📋 [{item_id}] Imagen {image_num} - {url} - {resp.status_code} - {content_type}")
+        if resp.status_code in (200, 206):
+            return True
+        log_file_only("INFO", f"      └─ ⚠️ URL inaccesible")
+        return False
+    except Exception as e:
+        log_console_and_file("WARNING", f"📋 [{item_id}] Imagen {image_num} - {url} - ERROR - {str(e)}")
+        return False
+
+# ==================== PIPELINE ====================
+
+class ItemFotos:
+    """Estado de un item dentro del pipeline; cada foto conserva su posición original"""
+
+    def __init__(self, item_id: str, urls: list):
+        self.item_id = item_id
+        self.urls = urls
+        self.picture_ids = [None] * len(urls)
+        self.validas = 0
+        self.pendientes = len(urls)
+        self._lock = threading.Lock()
+
+    def terminar_foto(self, pos: int, picture_id: str = None, valida: bool = True) -> bool:
+        """Registra el resultado de una foto; True si era la última pendiente del item"""
+        with self._lock:
+            if picture_id:
+                self.picture_ids[pos] = picture_id
+            if valida:
+                self.validas += 1
+            self.pendientes -= 1
+            return self.pendientes == 0
+
+    def picture_ids_en_orden(self) -> list:
+        return [pic_id for pic_id in self.picture_ids if pic_id]
+
+
+class PipelineFotos:
+    """
+    validar → descargar → subir → adjuntar, conectadas por colas acotadas.
+    Cada etapa tiene su número de workers y su limitador; las fotos de un item se procesan
+    en paralelo y el PUT final las envía en el orden de las columnas del CSV.
+    """
+
+    def __init__(self, total_items: int):
+        self.total_items = total_items
+        self.cola_validar = queue.Queue(maxsize=TAMANO_COLA)
+        self.cola_descargar = queue.Queue(maxsize=TAMANO_COLA)
+        self.cola_subir = queue.Queue(maxsize=TAMANO_COLA)
+        self.cola_adjuntar = queue.Queue(maxsize=TAMANO_COLA)
+        self.limitador_pictures = obtener_limitador(f"{TIENDA}:pictures", RPM_PICTURES)
+        self.limitador_items = obtener_limitador(f"{TIENDA}:items", RPM_ITEMS)
+        self.stats = {
+            "items_exitosos": 0, "items_con_errores": 0, "items_omitidos": 0,
+            "imagenes_encontradas": 0, "imagenes_subidas": 0, "imagenes_fallidas": 0,
         }
-    
-    if len(validated_urls) < len(image_urls):
-        log_console_and_file("WARNING", f"⚠️ [{item_id}] Solo {len(validated_urls)}/{len(image_urls)} URLs son válidas")
-    else:
-        log_console_and_file("INFO", f"✅ [{item_id}] Todas las URLs son válidas")
-    
-    # PASO 2: Procesar cada imagen SECUENCIALMENTE
-    log_console_and_file("INFO", f"\n📥 [{item_id}] Paso 2: Descargando y subiendo {len(validated_urls)} imágenes...")
-    picture_ids = []
-    temp_files = []
-    images_failed = 0
-    
-    for idx, (col_name, url) in enumerate(validated_urls, start=1):
-        log_console_and_file("INFO", f"\n--- [{item_id}] Imagen {idx}/{len(validated_urls)} ---")
-        
-        # Descargar imagen
-        success, temp_path, error = download_image(url, item_id, idx)
-        if not success:
-            images_failed += 1
-            log_console_and_file("WARNING", f"⚠️ [{item_id}] Imagen {idx} no descargada: {error}")
-            log_console_and_file("WARNING", f"⏭️ [{item_id}] Continuando con siguiente imagen...")
-            continue
-        
-        temp_files.append(temp_path)
-        
-        # Subir a ML
-        success, picture_id, error = upload_image_to_ml(temp_path, item_id, idx)
-        if not success:
-            images_failed += 1
-            log_console_and_file("WARNING", f"⚠️ [{item_id}] Imagen {idx} no subida a ML: {error}")
-            log_console_and_file("WARNING", f"⏭️ [{item_id}] Continuando con siguiente imagen...")
-            continue
-        
-        picture_ids.append(picture_id)
-        log_console_and_file("INFO", f"✅ [{item_id}] Imagen {idx}/{len(validated_urls)} procesada correctamente")
-        
-        # Pequeña pausa entre uploads para no saturar
-        if idx < len(validated_urls):
-            time.sleep(0.5)
-    
-    # Limpiar archivos temporales
-    log_file_only("INFO", f"\n🗑️ [{item_id}] Limpiando {len(temp_files)} archivos temporales...")
-    for temp_path in temp_files:
+        self.errors_list = []
+        self.inicio = time.time()
+        self._lock = threading.Lock()
+
+    # --- etapas ---
+
+    def _validar(self, item: ItemFotos, pos: int):
+        url = item.urls[pos]
+        origin_limiter(url).adquirir()
+        if validate_url(url, item.item_id, pos + 1):
+            self.cola_descargar.put((item, pos))
+        else:
+            self._terminar_foto(item, pos, valida=False)
+
+    def _descargar(self, item: ItemFotos, pos: int):
+        url = item.urls[pos]
+        origin_limiter(url).adquirir()
+        success, temp_path, error = download_image(url, item.item_id, pos + 1)
+        if success:
+            self.cola_subir.put((item, pos, temp_path))
+        else:
+            log_console_and_file("WARNING", f"⚠️ [{item.item_id}] Imagen {pos + 1} no descargada: {error}")
+            self._terminar_foto(item, pos)
+
+    def _subir(self, item: ItemFotos, pos: int, temp_path: str):
         try:
-            if os.path.exists(temp_path):
+            self.limitador_pictures.adquirir()
+            success, picture_id, error = upload_image_to_ml(temp_path, item.item_id, pos + 1)
+        finally:
+            try:
                 os.remove(temp_path)
-                log_file_only("INFO", f"   └─ Eliminado: {temp_path}")
-        except Exception as e:
-            log_file_only("WARNING", f"   └─ No se pudo eliminar {temp_path}: {e}")
-    
-    # Verificar que se subieron imágenes
-    if not picture_ids:
-        error_msg = f"No se pudo subir ninguna imagen ({len(validated_urls)} intentadas, {images_failed} fallaron)"
-        log_console_and_file("ERROR", f"❌ [{item_id}] {error_msg}")
-        return {
-            "success": False,
-            "item_id": item_id,
-            "error": error_msg,
-            "omitted": False,
-            "images_found": len(image_urls),
-            "images_uploaded": 0,
-            "images_failed": images_failed
-        }
-    
-    log_console_and_file("INFO", f"\n📊 [{item_id}] Resumen de imágenes:")
-    log_console_and_file("INFO", f"   ✅ Subidas exitosamente: {len(picture_ids)}")
-    log_console_and_file("INFO", f"   ❌ Fallidas: {images_failed}")
-    log_console_and_file("INFO", f"   📋 Total procesadas: {len(validated_urls)}")
-    
-    # PASO 3: Actualizar item con nuevas imágenes
-    log_console_and_file("INFO", f"\n🔄 [{item_id}] Paso 3: Actualizando item en MercadoLibre...")
-    success, error = update_item_pictures(item_id, picture_ids)
-    if not success:
-        error_msg = f"Error actualizando item: {error}"
-        log_console_and_file("ERROR", f"❌ [{item_id}] {error_msg}")
-        return {
-            "success": False,
-            "item_id": item_id,
-            "error": error_msg,
-            "omitted": False,
-            "images_found": len(image_urls),
-            "images_uploaded": len(picture_ids),
-            "images_failed": images_failed
-        }
-    
-    log_console_and_file("INFO", f"\n🎉 [{item_id}] ¡ITEM PROCESADO EXITOSAMENTE!")
-    log_console_and_file("INFO", f"{'='*70}\n")
-    
-    return {
-        "success": True,
-        "item_id": item_id,
-        "error": None,
-        "omitted": False,
-        "images_found": len(image_urls),
-        "images_uploaded": len(picture_ids),
-        "images_failed": images_failed
-    }
+            except OSError as e:
+                log_file_only("WARNING", f"   └─ No se pudo eliminar {temp_path}: {e}")
+        if not success:
+            log_console_and_file("WARNING", f"⚠️ [{item.item_id}] Imagen {pos + 1} no subida a ML: {error}")
+        self._terminar_foto(item, pos, picture_id if success else None)
+
+    def _adjuntar(self, item: ItemFotos):
+        self.limitador_items.adquirir()
+        success, error = update_item_pictures(item.item_id, item.picture_ids_en_orden())
+        self._registrar(item, None if success else f"Error actualizando item: {error}")
+
+    # --- coordinación ---
+
+    def _terminar_foto(self, item: ItemFotos, pos: int, picture_id: str = None, valida: bool = True):
+        """Cuando termina la última foto del item lo pasa a adjuntar (o lo registra si no hay nada que enviar)"""
+        if not item.terminar_foto(pos, picture_id, valida):
+            return
+        if item.validas == 0:
+            self._registrar(item, f"Ninguna de las {len(item.urls)} URLs es accesible", omitido=True)
+        elif not item.picture_ids_en_orden():
+            self._registrar(item, f"No se pudo subir ninguna imagen ({item.validas} intentadas)")
+        else:
+            self.cola_adjuntar.put((item,))
+
+    def _registrar(self, item: ItemFotos, error: str = None, omitido: bool = False):
+        subidas = len(item.picture_ids_en_orden())
+        with self._lock:
+            s = self.stats
+            s["imagenes_encontradas"] += len(item.urls)
+            s["imagenes_subidas"] += subidas
+            s["imagenes_fallidas"] += len(item.urls) - subidas
+            if error is None:
+                s["items_exitosos"] += 1
+                save_processed_item(item.item_id)
+                log_console_and_file("INFO", f"✅ [{item.item_id}] Item actualizado con {subidas}/{len(item.urls)} imágenes")
+            elif omitido:
+                s["items_omitidos"] += 1
+                log_console_and_file("WARNING", f"🟡 [{item.item_id}] {error}, se omite")
+            else:
+                s["items_con_errores"] += 1
+                self.errors_list.append({"ID": item.item_id, "Error": error})
+                log_console_and_file("ERROR", f"❌ [{item.item_id}] {error}")
+
+            hechos = s["items_exitosos"] + s["items_con_errores"] + s["items_omitidos"]
+            if hechos % 100 == 0 or hechos == self.total_items:
+                por_minuto = hechos / max(time.time() - self.inicio, 1e-9) * 60
+                log_console_and_file("INFO", f"📈 Progreso: {hechos}/{self.total_items} items "
+                                             f"(✅ {s['items_exitosos']} ❌ {s['items_con_errores']} 🟡 {s['items_omitidos']}) "
+                                             f"- {por_minuto:.0f} items/min")
+
+    def _worker(self, cola: queue.Queue, procesar):
+        while True:
+            tarea = cola.get()
+            if tarea is None:
+                return
+            try:
+                procesar(*tarea)
+            except Exception as e:
+                item = tarea[0]
+                log_console_and_file("ERROR", f"❌ [{item.item_id}] Excepción en {procesar.__name__}: {type(e).__name__} - {e}")
+                if len(tarea) > 1:
+                    self._terminar_foto(item, tarea[1])
+                else:
+                    self._registrar(item, f"Excepción: {type(e).__name__} - {e}")
+
+    def ejecutar(self, items):
+        """
+        items: iterable de (item_id, [urls]).
+        Al terminar de encolar cierra las etapas en orden, así cada una drena antes de cerrar la siguiente.
+        """
+        etapas = [
+            (self.cola_validar, self._validar, WORKERS_VALIDAR),
+            (self.cola_descargar, self._descargar, WORKERS_DESCARGAR),
+            (self.cola_subir, self._subir, WORKERS_SUBIR),
+            (self.cola_adjuntar, self._adjuntar, WORKERS_ADJUNTAR),
+        ]
+        hilos = []
+        for cola, procesar, n in etapas:
+            grupo = [threading.Thread(target=self._worker, args=(cola, procesar), daemon=True) for _ in range(n)]
+            for h in grupo:
+                h.start()
+            hilos.append(grupo)
+
+        for item_id, urls in items:
+            item = ItemFotos(item_id, urls)
+            if not urls:
+                self._registrar(item, "No hay URLs de imágenes válidas en el CSV", omitido=True)
+                continue
+            for pos in range(len(urls)):
+                self.cola_validar.put((item, pos))
+
+        for (cola, _, n), grupo in zip(etapas, hilos):
+            for _ in range(n):
+                cola.put(None)
+            for h in grupo:
+                h.join()
+        return self.stats
 
 # ==================== MAIN ====================
 
@@ -789,7 +849,7 @@ def main():
         processed_items = load_processed_items()
         
         # Filtrar items ya procesados
-        df = df[~df['ID'].isin(processed_items)]
+        df = df[~processed_items.contiene(df['ID'])]
         pending_items = len(df)
         
         if processed_items:
@@ -801,64 +861,25 @@ def main():
             return
         
         log_console_and_file("INFO", f"📊 Items pendientes: {pending_items}")
-        log_console_and_file("INFO", f"⚙️ Modo de procesamiento: SECUENCIAL (item por item, foto por foto)")
-        log_console_and_file("INFO", f"🔄 Modo secuencial: validación + descarga + subida de imágenes una por una")
+        log_console_and_file("INFO", f"⚙️ Modo de procesamiento: PIPELINE (validar → descargar → subir → adjuntar)")
+        log_console_and_file("INFO", f"   Workers: {WORKERS_VALIDAR}/{WORKERS_DESCARGAR}/{WORKERS_SUBIR}/{WORKERS_ADJUNTAR} | "
+                                     f"RPM: origen {RPM_ORIGEN} por host, pictures {RPM_PICTURES}, items {RPM_ITEMS}")
         log_console_and_file("INFO", "")
-        log_console_and_file("INFO", "🚀 Iniciando procesamiento secuencial...")
-        log_console_and_file("INFO", "")
-        
-        # Contadores detallados
-        items_exitosos = 0
-        items_con_errores = 0
-        items_omitidos = 0
-        total_imagenes_encontradas = 0
-        total_imagenes_subidas = 0
-        total_imagenes_fallidas = 0
-        errors_list = []
         
-        # Procesar items SECUENCIALMENTE (uno por uno)
-        for item_num, (idx, row) in enumerate(df.iterrows(), start=1):
-            log_console_and_file("INFO", f"\n{'#'*70}")
-            log_console_and_file("INFO", f"📦 ITEM {item_num}/{pending_items}")
-            log_console_and_file("INFO", f"{'#'*70}")
-            
-            # Procesar el item
-            result = process_item(row, item_num, pending_items)
-            
-            # Actualizar estadísticas
-            total_imagenes_encontradas += result["images_found"]
-            total_imagenes_subidas += result["images_uploaded"]
-            total_imagenes_fallidas += result["images_failed"]
-            
-            if result["success"]:
-                items_exitosos += 1
-                save_processed_item(result["item_id"])
-                log_console_and_file("INFO", f"\n✅ Item {item_num}/{pending_items} completado exitosamente")
-            elif result["omitted"]:
-                items_omitidos += 1
-                log_console_and_file("WARNING", f"\n🟡 Item {item_num}/{pending_items} omitido: {result['error']}")
-            else:
-                items_con_errores += 1
-                errors_list.append({"ID": result["item_id"], "Error": result["error"]})
-                log_console_and_file("ERROR", f"\n❌ Item {item_num}/{pending_items} falló: {result['error']}")
-            
-            # Mostrar progreso general
-            items_procesados = items_exitosos + items_con_errores
-            log_console_and_file("INFO", f"\n📊 Progreso General: {item_num}/{pending_items} items")
-            log_console_and_file("INFO", f"   ✅ Exitosos: {items_exitosos}")
-            log_console_and_file("INFO", f"   ❌ Con errores: {items_con_errores}")
-            log_console_and_file("INFO", f"   🟡 Omitidos: {items_omitidos}")
-            
-            # Log de progreso periódico cada 10 items
-            if item_num % 10 == 0 and item_num > 0:
-                log_console_and_file("INFO", f"\n📈 Checkpoint - Procesados {item_num}/{pending_items} items...")
-                log_console_and_file("INFO", f"   🖼️ Imágenes: {total_imagenes_subidas} subidas, {total_imagenes_fallidas} fallidas")
-                log_file_only("INFO", f"   └─ Checkpoint en item {item_num}: memoria OK")
-            
-            # Pausa breve entre items para no saturar (excepto en el último)
-            if item_num < pending_items:
-                log_file_only("INFO", "\n⏸️ Pausa breve antes del siguiente item...")
-                time.sleep(1)
+        # Fotos en el orden de las columnas Imagen*
+        image_cols = [col for col in df.columns if str(col).startswith('Imagen')]
+        items = ((str(row[0]).strip(), collect_image_urls(row[1:]))
+                 for row in df[['ID'] + image_cols].itertuples(index=False, name=None))
+        
+        pipeline = PipelineFotos(pending_items)
+        stats = pipeline.ejecutar(items)
+        errors_list = pipeline.errors_list
+        items_exitosos = stats["items_exitosos"]
+        items_con_errores = stats["items_con_errores"]
+        items_omitidos = stats["items_omitidos"]
+        total_imagenes_encontradas = stats["imagenes_encontradas"]
+        total_imagenes_subidas = stats["imagenes_subidas"]
+        total_imagenes_fallidas = stats["imagenes_fallidas"]
         
         # Resumen final detallado
         log_console_and_file("INFO", "")
@@ -873,6 +894,7 @@ def main():
         log_console_and_file("INFO", f"   ✅ Exitosos: {items_exitosos}")
         log_console_and_file("INFO", f"   ❌ Con errores: {items_con_errores}")
         log_console_and_file("INFO", f"   🟡 Omitidos: {items_omitidos}")
+        log_console_and_file("INFO", f"   ⏱️ Duración: {time.time() - pipeline.inicio:.1f}s")
         log_console_and_file("INFO", "")
         log_console_and_file("INFO", "🖼️ IMÁGENES:")
         log_console_and_file("INFO", f"   📸 Total encontradas: {total_imagenes_encontradas}")
@@ -11,6 +11,8 @@ import aiohttp
 from aiohttp.client_exceptions import ClientError
 from dotenv import load_dotenv
 
+from ml_comun import ConjuntoIds
+
 import ssl, certifi
 from tqdm import tqdm
 
@@ -280,11 +282,10 @@ async def procesar_tienda(code: str, store: Dict[str, Any]) -> Tuple[str, int]:
     out_file = os.path.join(OUTPUT_DIR, f"{code}_resultados.csv")
 
     # 3) Reanudación
-    done_ok = set()
+    done_ok = ConjuntoIds()
     if os.path.exists(out_file):
         prev = pd.read_csv(out_file)
-        ok_prev = prev[prev["status"] == "OK"]["ID"].astype(str).tolist()
-        done_ok.update(ok_prev)
+        done_ok = ConjuntoIds(prev.loc[prev["status"] == "OK", "ID"].astype(str).tolist())
 
     # 4) Multiget lectura para saltar PUT innecesarios
     #    - primero, excluir los ya OK de runs previas
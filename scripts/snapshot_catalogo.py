@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+"""
+Acceso al snapshot local del catálogo de MercadoLibre
+Lee el espejo Mongo `items` o un export Parquet y devuelve un DataFrame columnar
+con: id, price, available_quantity, seller_custom_field, status, sub_status, sold_quantity
+Sirve para planear y validar cambios sin gastar cuota de la API
+"""
+
+import os
+import re
+from datetime import datetime, timezone
+from typing import Iterable, List, Optional, Tuple
+
+import pandas as pd
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# === CONFIGURACIÓN ===
+MONGO_URI = os.getenv("MONGO_URI")
+MONGO_DB = os.getenv("MONGO_DB", "test")
+MONGO_COLECCION = "items"
+CHUNK_IN = 5000  # IDs por consulta $in
+
+COLUMNAS_SNAPSHOT = [
+    "id", "price", "available_quantity", "seller_custom_field", "status", "sub_status", "sold_quantity"
+]
+
+PROYECCION_MONGO = {
+    "_id": 1,
+    "price": 1,
+    "available_quantity": 1,
+    "seller_custom_field": 1,
+    "seller_custom_sku": 1,
+    "status": 1,
+    "sub_status": 1,
+    "sold_quantity": 1,
+    "last_updated": 1,
+}
+
+
+def _lista_sub_status(valor) -> list:
+    """sub_status como lista: en Mongo llega como lista y en el export Parquet como texto ("['deleted']")"""
+    if valor is None or valor is pd.NA or (isinstance(valor, float) and pd.isna(valor)):
+        return []
+    if isinstance(valor, str):
+        return re.findall(r"[a-z_]+", valor.lower())
+    return [str(v).strip().lower() for v in valor]
+
+
+def _normalizar_snapshot(df: pd.DataFrame) -> pd.DataFrame:
+    """Deja el snapshot con columnas y tipos estables"""
+    if "_id" in df.columns and "id" not in df.columns:
+        df = df.rename(columns={"_id": "id"})
+    # En el espejo el SKU puede venir como seller_custom_sku
+    if "seller_custom_sku" in df.columns:
+        if "seller_custom_field" in df.columns:
+            df["seller_custom_field"] = df["seller_custom_field"].fillna(df["seller_custom_sku"])
+        else:
+            df["seller_custom_field"] = df["seller_custom_sku"]
+    for col in COLUMNAS_SNAPSHOT:
+        if col not in df.columns:
+            df[col] = None
+
+    salida = pd.DataFrame({
+        "id": df["id"].astype(str).str.strip(),
+        "price": pd.to_numeric(df["price"], errors="coerce"),
+        "available_quantity": pd.to_numeric(df["available_quantity"], errors="coerce"),
+        "seller_custom_field": df["seller_custom_field"].astype("string").str.strip(),
+        "status": df["status"].astype("string").str.strip().str.lower(),
+        "sub_status": [_lista_sub_status(v) for v in df["sub_status"]],
+        "sold_quantity": pd.to_numeric(df["sold_quantity"], errors="coerce").fillna(0).astype("int64"),
+    })
+    return salida.drop_duplicates(subset=["id"], keep="last").reset_index(drop=True)
+
+
+def _fecha_maxima(serie: pd.Series) -> Optional[datetime]:
+    """Fecha más reciente de una columna last_updated (None si no hay)"""
+    fechas = pd.to_datetime(serie, errors="coerce", utc=True).dropna()
+    if fechas.empty:
+        return None
+    return fechas.max().to_pydatetime()
+
+
+def cargar_snapshot_parquet(ruta: str, ids: Optional[Iterable[str]] = None) -> Tuple[pd.DataFrame, Optional[datetime]]:
+    """Carga el snapshot desde un export Parquet (solo las columnas necesarias)"""
+    print(f"   📖 Leyendo snapshot Parquet: {ruta}")
+    disponibles = None
+    try:
+        import pyarrow.parquet as pq
+        disponibles = set(pq.read_schema(ruta).names)
+    except ImportError:
+        pass
+
+    columnas = None
+    if disponibles is not None:
+        deseadas = COLUMNAS_SNAPSHOT + ["_id", "seller_custom_sku", "last_updated"]
+        columnas = [c for c in deseadas if c in disponibles]
+    df = pd.read_parquet(ruta, columns=columnas)
+
+    fecha = _fecha_maxima(df["last_updated"]) if "last_updated" in df.columns else None
+    if fecha is None:
+        fecha = datetime.fromtimestamp(os.path.getmtime(ruta), tz=timezone.utc)
+
+    df = _normalizar_snapshot(df)
+    if ids is not None:
+        df = df[df["id"].isin(pd.Index(ids).astype(str))].reset_index(drop=True)
+    print(f"   ✅ Snapshot cargado: {len(df)} items")
+    return df, fecha
+
+
+def cargar_snapshot_mongo(ids: List[str], origen: Optional[str] = None,
+                          uri: Optional[str] = None, chunk: int = CHUNK_IN) -> Tuple[pd.DataFrame, Optional[datetime]]:
+    """Carga el snapshot desde Mongo con una consulta $in por chunk y proyección mínima"""
+    from pymongo import MongoClient
+
+    uri = uri or MONGO_URI
+    if not uri:
+        raise RuntimeError("MONGO_URI no está configurado en el entorno")
+
+    client = MongoClient(uri, serverSelectionTimeoutMS=5000)
+    try:
+        coleccion = client[MONGO_DB][MONGO_COLECCION]
+        ids = [str(i) for i in ids]
+        total_chunks = (len(ids) + chunk - 1) // chunk
+        print(f"   📡 Consultando Mongo: {len(ids)} IDs en {total_chunks} consultas")
+
+        documentos = []
+        for i in range(0, len(ids), chunk):
+            filtro = {"_id": {"$in": ids[i:i + chunk]}}
+            if origen:
+                filtro["origen"] = origen
+            documentos.extend(coleccion.find(filtro, PROYECCION_MONGO))
+    finally:
+        client.close()
+
+    if not documentos:
+        return pd.DataFrame(columns=COLUMNAS_SNAPSHOT), None
+
+    df = pd.DataFrame(documentos)
+    fecha = _fecha_maxima(df["last_updated"]) if "last_updated" in df.columns else None
+    df = _normalizar_snapshot(df)
+    print(f"   ✅ Snapshot cargado: {len(df)} items")
+    return df, fecha
+
+
+def cargar_snapshot(fuente: str, ids: List[str], origen: Optional[str] = None) -> Tuple[pd.DataFrame, Optional[datetime]]:
+    """Carga el snapshot desde 'mongo' o desde una ruta .parquet"""
+    if fuente.lower().endswith(".parquet"):
+        return cargar_snapshot_parquet(fuente, ids)
+    if fuente.lower() == "mongo":
+        return cargar_snapshot_mongo(ids, origen=origen)
+    raise ValueError(f"Fuente de snapshot no soportada: {fuente} (usa 'mongo' o un archivo .parquet)")
+
+
+def describir_edad(fecha: Optional[datetime]) -> str:
+    """Texto legible con la antigüedad del snapshot"""
+    if fecha is None:
+        return "desconocida"
+    if fecha.tzinfo is None:
+        fecha = fecha.replace(tzinfo=timezone.utc)
+    segundos = int((datetime.now(timezone.utc) - fecha).total_seconds())
+    if segundos < 3600:
+        edad = f"{segundos // 60} min"
+    elif segundos < 86400:
+        edad = f"{segundos / 3600:.1f} h"
+    else:
+        edad = f"{segundos / 86400:.1f} días"
+    return f"{edad} (actualizado {fecha.strftime('%Y-%m-%d %H:%M:%S %Z')})"
@@ -0,0 +1,228 @@
+#!/usr/bin/env python3
+"""
+Sincronización incremental del catálogo de MercadoLibre al espejo Mongo `items`
+- Recorre cada tienda con el scan particionado + multiget en pipeline (get_publicaciones_ml)
+- Calcula un hash de contenido por item y solo escribe los que cambiaron
+- Los bulk_write llevan únicamente los campos modificados (upsert para items nuevos)
+- Marca como desaparecidos los items que ya no salen en el scan (solo si cubrió el total de la tienda)
+- Guarda un watermark por tienda en la colección `sync_watermarks`
+"""
+
+import hashlib
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+from get_publicaciones_ml import TIENDAS_ML, ExportadorTienda
+from ml_comun import ConjuntoIds
+from snapshot_catalogo import MONGO_URI, MONGO_DB, MONGO_COLECCION
+
+# === CONFIGURACIÓN ===
+COLECCION_WATERMARKS = "sync_watermarks"
+LOTE_ESCRITURA = 1000  # operaciones por bulk_write
+CHUNK_IN = 5000        # IDs por consulta $in
+
+# Campos del espejo que mantiene la sincronización (los demás campos del documento no se tocan)
+CAMPOS_SYNC = [
+    "title", "status", "price", "available_quantity", "sold_quantity",
+    "seller_custom_field", "seller_custom_sku", "numero_parte",
+    "category_id", "listing_type_id", "date_created", "last_updated",
+]
+
+
+def documento_espejo(pub: Dict[str, Any]) -> Dict[str, Any]:
+    """Publicación de multiget → campos del espejo (mismos nombres que usa get_delete_items)"""
+    atributos = {a.get("id"): a.get("value_name") for a in pub.get("attributes") or []}
+    sku = pub.get("seller_custom_field") or atributos.get("SELLER_SKU")
+    return {
+        "title": pub.get("title"),
+        "status": pub.get("status"),
+        "price": pub.get("price"),
+        "available_quantity": pub.get("available_quantity"),
+        "sold_quantity": pub.get("sold_quantity"),
+        "seller_custom_field": pub.get("seller_custom_field"),
+        "seller_custom_sku": sku,
+        "numero_parte": atributos.get("PART_NUMBER"),
+        "category_id": pub.get("category_id"),
+        "listing_type_id": pub.get("listing_type_id"),
+        "date_created": pub.get("date_created"),
+        "last_updated": pub.get("last_updated"),
+    }
+
+
+def hash_contenido(documento: Dict[str, Any]) -> str:
+    """Hash estable (8 bytes) de los campos sincronizados"""
+    texto = json.dumps([documento.get(campo) for campo in CAMPOS_SYNC], ensure_ascii=False, default=str)
+    return hashlib.blake2b(texto.encode("utf-8"), digest_size=8).hexdigest()
+
+
+class SincronizadorTienda:
+    """Sincroniza una tienda: hashes en memoria, escrituras por lotes, marca de desaparecidos"""
+
+    def __init__(self, clave: str, tienda: Dict[str, str], db, dry_run: bool = False):
+        self.clave = clave
+        self.tienda = tienda
+        self.coleccion = db[MONGO_COLECCION]
+        self.watermarks = db[COLECCION_WATERMARKS]
+        self.dry_run = dry_run
+        self.hashes: Dict[str, Optional[str]] = {}
+        self.desaparecidos_previos = set()
+        self.vistos = ConjuntoIds()
+        self.pendientes: List[Dict[str, Any]] = []  # (_id, documento, hash) a escribir
+        self.conteos = {"vistos": 0, "sin_cambio": 0, "cambiados": 0, "nuevos": 0,
+                        "reaparecidos": 0, "desaparecidos": 0}
+
+    def cargar_hashes(self):
+        """Hash guardado por item de la tienda (proyección mínima)"""
+        cursor = self.coleccion.find({"origen": self.clave},
+                                     {"_id": 1, "sync_hash": 1, "sync_desaparecido": 1})
+        for doc in cursor.batch_size(CHUNK_IN):
+            self.hashes[doc["_id"]] = doc.get("sync_hash")
+            if doc.get("sync_desaparecido"):
+                self.desaparecidos_previos.add(doc["_id"])
+        print(f"[{self.clave}] {len(self.hashes)} items en el espejo "
+              f"({len(self.desaparecidos_previos)} marcados como desaparecidos)")
+
+    def procesar(self, pub: Dict[str, Any]):
+        item_id = pub.get("id")
+        if not item_id or item_id in self.vistos:
+            return
+        self.vistos.agregar([item_id])
+        self.conteos["vistos"] += 1
+
+        documento = documento_espejo(pub)
+        nuevo_hash = hash_contenido(documento)
+        if item_id in self.hashes and self.hashes[item_id] == nuevo_hash \
+                and item_id not in self.desaparecidos_previos:
+            self.conteos["sin_cambio"] += 1
+            return
+        self.pendientes.append({"_id": item_id, "documento": documento, "hash": nuevo_hash})
+        if len(self.pendientes) >= LOTE_ESCRITURA:
+            self.escribir_pendientes()
+
+    def escribir_pendientes(self):
+        """Diff contra el documento actual y bulk_write solo con los campos que cambiaron"""
+        from pymongo import UpdateOne
+
+        if not self.pendientes:
+            return
+        ids = [p["_id"] for p in self.pendientes]
+        proyeccion = {campo: 1 for campo in CAMPOS_SYNC}
+        actuales = {doc["_id"]: doc for doc in self.coleccion.find({"_id": {"$in": ids}}, proyeccion)}
+        ahora = datetime.now(timezone.utc)
+
+        operaciones = []
+        for pendiente in self.pendientes:
+            item_id = pendiente["_id"]
+            documento = pendiente["documento"]
+            actual = actuales.get(item_id)
+            marca = {"sync_hash": pendiente["hash"], "sync_actualizado": ahora}
+            if actual is None:
+                self.conteos["nuevos"] += 1
+                cambios = {**documento, "origen": self.clave}
+            else:
+                self.conteos["cambiados"] += 1
+                cambios = {campo: valor for campo, valor in documento.items() if actual.get(campo) != valor}
+            if item_id in self.desaparecidos_previos:
+                self.conteos["reaparecidos"] += 1
+                marca["sync_desaparecido"] = False
+            operaciones.append(UpdateOne({"_id": item_id}, {"$set": {**cambios, **marca}}, upsert=True))
+
+        if not self.dry_run:
+            self.coleccion.bulk_write(operaciones, ordered=False)
+        self.pendientes = []
+
+    def marcar_desaparecidos(self):
+        """Items de la tienda en el espejo que ya no salen en el scan"""
+        en_espejo = list(self.hashes)
+        vistos = self.vistos.contiene(en_espejo)
+        faltantes = [item_id for item_id, visto in zip(en_espejo, vistos)
+                     if not visto and item_id not in self.desaparecidos_previos]
+        self.conteos["desaparecidos"] = len(faltantes)
+        if self.dry_run:
+            return
+        ahora = datetime.now(timezone.utc)
+        for i in range(0, len(faltantes), CHUNK_IN):
+            self.coleccion.update_many(
+                {"_id": {"$in": faltantes[i:i + CHUNK_IN]}},
+                {"$set": {"sync_desaparecido": True, "sync_desaparecido_en": ahora}},
+            )
+
+    def guardar_watermark(self, inicio: datetime, completo: bool):
+        if self.dry_run:
+            return
+        self.watermarks.update_one(
+            {"_id": self.clave},
+            {"$set": {"inicio": inicio, "fin": datetime.now(timezone.utc),
+                      "completo": completo, **self.conteos}},
+            upsert=True,
+        )
+
+    def sincronizar(self) -> Dict[str, Any]:
+        inicio = datetime.now(timezone.utc)
+        start = time.time()
+        self.cargar_hashes()
+
+        exportador = ExportadorTienda(self.tienda)
+        for pub in exportador.detalles():
+            self.procesar(pub)
+        self.escribir_pendientes()
+
+        # Solo un scan que cubrió el total de la tienda permite afirmar que un item desapareció
+        completo = (exportador.error_scan is None and exportador.lotes_fallidos == 0
+                    and exportador.total_reportado is not None
+                    and self.conteos["vistos"] >= exportador.total_reportado)
+        if completo:
+            self.marcar_desaparecidos()
+        else:
+            print(f"[{self.clave}] scan incompleto ({self.conteos['vistos']} de "
+                  f"{exportador.total_reportado or '?'} publicaciones): no se marcan desaparecidos en esta corrida")
+        self.guardar_watermark(inicio, completo)
+
+        escritos = self.conteos["nuevos"] + self.conteos["cambiados"]
+        print(f"[{self.clave}] {self.conteos['vistos']} vistos, {escritos} escritos "
+              f"({self.conteos['nuevos']} nuevos), {self.conteos['desaparecidos']} desaparecidos "
+              f"en {time.time() - start:.1f}s")
+        return {"tienda": self.clave, "completo": completo, **self.conteos}
+
+
+def main():
+    import argparse
+    from pymongo import MongoClient
+
+    parser = argparse.ArgumentParser(description='Sincronización incremental del catálogo ML al espejo Mongo')
+    parser.add_argument('--tiendas', nargs='+', default=list(TIENDAS_ML.keys()),
+                        choices=list(TIENDAS_ML.keys()), help='Tiendas a sincronizar (default: todas)')
+    parser.add_argument('--dry-run', action='store_true', help='Calcular cambios sin escribir en Mongo')
+    args = parser.parse_args()
+
+    if not MONGO_URI:
+        print("MONGO_URI no está configurado en el entorno")
+        return
+
+    print(f"Sincronizando {', '.join(args.tiendas)} → {MONGO_DB}.{MONGO_COLECCION}"
+          f"{' (dry-run)' if args.dry_run else ''}\n")
+    client = MongoClient(MONGO_URI, serverSelectionTimeoutMS=5000)
+    db = client[MONGO_DB]
+    try:
+        with ThreadPoolExecutor(max_workers=len(args.tiendas)) as executor:
+            resultados = list(executor.map(
+                lambda clave: SincronizadorTienda(clave, TIENDAS_ML[clave], db, args.dry_run).sincronizar(),
+                args.tiendas))
+    finally:
+        client.close()
+
+    print("\nRESUMEN SYNC")
+    print("==========================")
+    for r in resultados:
+        escritos = r["nuevos"] + r["cambiados"]
+        porcentaje = escritos / r["vistos"] * 100 if r["vistos"] else 0
+        print(f"{r['tienda']}: {r['vistos']} vistos, {escritos} escritos ({porcentaje:.1f}%), "
+              f"{r['desaparecidos']} desaparecidos{'' if r['completo'] else ' [incompleto]'}")
+    print("==========================")
+
+
+if __name__ == "__main__":
+    main()
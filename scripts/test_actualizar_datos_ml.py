@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+Pruebas del compilador columnar de payloads de actualizar_datos_ml (sin red ni credenciales)
+Compara compilar_payloads con construir_payload fila por fila sobre el mismo DataFrame
+Ejecutar con: python -m pytest -q test_actualizar_datos_ml.py
+"""
+
+import contextlib
+import io
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from actualizar_datos_ml import ActualizadorML, compilar_payloads
+
+# Advertencia de construir_payload → motivo en la tabla de rechazados
+MOTIVOS = {
+    "Precio inválido": "Precio inválido",
+    "Cantidad inválida": "Cantidad inválida",
+    "Status inválido": "Status inválido (debe ser: active, paused, closed)",
+}
+
+# Celdas válidas, inválidas y vacías (None / '' / espacios) mezcladas en todas las columnas
+FILAS = [
+    # ID, Precio, Cantidad disponible, SellerCustomSku, Status
+    ("MLM1", 199.9, 10, "SKU-1", "active"),
+    ("MLM2", "abc", 5, None, "paused"),
+    ("MLM3", 50, "muchos", " SKU-3 ", "Closed"),
+    ("MLM4", " 12.5 ", "7", "", "borrado"),
+    ("MLM5", "", None, "  ", None),
+    ("MLM6", "1,5", "x", None, "pendiente"),
+    (None, 10, 1, "SKU-7", "active"),
+    ("  ", 10, 1, "SKU-8", "active"),
+    ("MLM9", None, 0, None, " ACTIVE "),
+    ("MLM10", "-3", 2.0, 12345, ""),
+]
+
+
+@pytest.fixture(scope="module")
+def actualizador():
+    return ActualizadorML({"access_token": None, "nombre_tienda": "PRUEBA"})
+
+
+def _df(filas):
+    return pd.DataFrame(filas, columns=['ID', 'Precio', 'Cantidad disponible', 'SellerCustomSku', 'Status'],
+                        dtype=object)
+
+
+def _por_fila(actualizador, df):
+    """Comportamiento anterior: construir_payload por fila, rechazos según sus advertencias"""
+    items, rechazados, sin_id = [], [], 0
+    for posicion, fila in enumerate(df.to_dict(orient="records")):
+        item_id = fila['ID']
+        if item_id is None or str(item_id).strip() == "":
+            sin_id += 1
+            continue
+        salida = io.StringIO()
+        with contextlib.redirect_stdout(salida):
+            payload = actualizador.construir_payload(fila)
+        motivos = [motivo for aviso, motivo in MOTIVOS.items() if aviso in salida.getvalue()]
+        if not payload:
+            motivos.append("Sin datos válidos para actualizar")
+        else:
+            items.append({'id': str(item_id).strip(), 'payload': payload})
+        if motivos:
+            rechazados.append((str(item_id).strip(), posicion + 2, "; ".join(motivos), bool(payload)))
+    return items, rechazados, sin_id
+
+
+def test_compilar_igual_que_por_fila(actualizador):
+    df = _df(FILAS)
+    items, rechazados, sin_id = compilar_payloads(df)
+    esperados_items, esperados_rechazados, esperado_sin_id = _por_fila(actualizador, df)
+
+    assert items == esperados_items
+    assert list(rechazados.itertuples(index=False, name=None)) == esperados_rechazados
+    assert sin_id == esperado_sin_id == 2
+
+
+def test_rechazados_detalle():
+    _, rechazados, _ = compilar_payloads(_df(FILAS))
+    por_id = rechazados.set_index('ID')
+    assert por_id.loc['MLM2', 'motivo'] == "Precio inválido" and por_id.loc['MLM2', 'enviado']
+    assert por_id.loc['MLM6', 'motivo'] == ("Precio inválido; Cantidad inválida; "
+                                           "Status inválido (debe ser: active, paused, closed); "
+                                           "Sin datos válidos para actualizar")
+    assert not por_id.loc['MLM6', 'enviado'] and por_id.loc['MLM6', 'fila'] == 7
+    assert not por_id.loc['MLM5', 'enviado']
+    assert 'MLM1' not in por_id.index
+
+
+def test_diferencias_intencionales(actualizador):
+    """Casos donde el compilador corrige a construir_payload a propósito"""
+    df = _df([
+        ("MLM1", np.nan, np.nan, np.nan, np.nan),   # celdas vacías de read_excel
+        ("MLM2", 10, 5.5, None, None),              # cantidad con decimales
+        ("MLM3", 10, "7.0", None, None),            # entero escrito como texto decimal
+    ])
+    items, rechazados, _ = compilar_payloads(df)
+    payloads = {item['id']: item['payload'] for item in items}
+
+    # NaN es celda vacía, no 'nan' en el payload
+    with contextlib.redirect_stdout(io.StringIO()):
+        assert actualizador.construir_payload(df.iloc[0].to_dict())['seller_custom_field'] == 'nan'
+    assert 'MLM1' not in payloads
+    assert rechazados.set_index('ID').loc['MLM1', 'motivo'] == "Sin datos válidos para actualizar"
+    # 5.5 no se trunca a 5: se rechaza la cantidad y se envía el resto
+    assert payloads['MLM2'] == {'price': 10.0}
+    assert rechazados.set_index('ID').loc['MLM2', 'motivo'] == "Cantidad inválida"
+    # "7.0" es un entero válido
+    assert payloads['MLM3'] == {'price': 10.0, 'available_quantity': 7}
@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+"""
+Pruebas del plan de envíos de aplicar_promocion (sin red ni credenciales)
+Ejecutar con: python -m pytest -q test_aplicar_promocion.py
+"""
+
+import pytest
+
+from aplicar_promocion import aplicados_en_journal, pendientes_sin_indice, planificar
+from ml_comun import JournalItems
+
+INDICE = {
+    "MLM1": ("candidate", None),
+    "MLM2": ("started", 100.0),
+    "MLM3": ("pending", 100.0),
+    "MLM4": ("finished", 100.0),
+}
+
+
+@pytest.mark.parametrize("item_id, deal_price, esperado", [
+    ("MLM1", 90.0, "alta"),            # candidate → POST
+    ("MLM2", 90.0, "cambio"),          # started con otro precio → PUT
+    ("MLM3", 90.0, "cambio"),          # pending con otro precio → PUT
+    ("MLM2", 100.0, "sin_cambio"),     # mismo precio → no se envía
+    ("MLM3", 100.0, "sin_cambio"),
+    ("MLM4", 90.0, "no_elegible"),     # estado fuera del índice de participación
+    ("MLM9", 90.0, "no_elegible"),     # no está en la promoción
+])
+def test_planificar_clasifica(item_id, deal_price, esperado):
+    envios, conteos = planificar([(item_id, deal_price)], INDICE)
+    assert conteos[esperado] == 1 and sum(conteos.values()) == 1
+    if esperado in ("alta", "cambio"):
+        assert envios == [(item_id, deal_price, esperado)]
+    else:
+        assert envios == []
+
+
+@pytest.mark.parametrize("deal_price, esperado", [
+    (100.01, "sin_cambio"),   # justo en la tolerancia (100.01 - 100.00 > 0.01 en punto flotante)
+    (99.99, "sin_cambio"),
+    (100.02, "cambio"),       # un centavo fuera
+    (99.98, "cambio"),
+])
+def test_planificar_borde_tolerancia(deal_price, esperado):
+    _, conteos = planificar([("MLM2", deal_price)], INDICE)
+    assert conteos[esperado] == 1
+
+
+def test_planificar_activo_sin_precio_se_reenvia():
+    envios, _ = planificar([("MLM5", 50.0)], {"MLM5": ("started", None)})
+    assert envios == [("MLM5", 50.0, "cambio")]
+
+
+@pytest.mark.parametrize("item_id, deal_price, enviado", [
+    ("MLM1", 100.0, False),   # ya aplicado con el mismo precio
+    ("MLM1", 100.01, False),  # dentro de la tolerancia
+    ("MLM1", 100.02, True),   # precio nuevo
+    ("MLM2", 80.0, True),     # el último intento falló
+    ("MLM3", 70.0, True),     # nunca se intentó
+])
+def test_respaldo_por_journal(tmp_path, item_id, deal_price, enviado):
+    ruta = str(tmp_path / "journal.csv")
+    journal = JournalItems(ruta, extras=["deal_price", "accion"])
+    journal.registrar("MLM1", "OK", 201, deal_price=100.0, accion="alta")
+    journal.registrar("MLM2", "OK", 201, deal_price=80.0, accion="alta")
+    journal.registrar("MLM2", "FAIL", 400, "rechazado", deal_price=80.0, accion="cambio")
+    journal.cerrar()
+
+    aplicados = aplicados_en_journal(ruta)
+    assert aplicados == {"MLM1": 100.0}
+    pendientes = pendientes_sin_indice([(item_id, deal_price)], aplicados)
+    assert pendientes == ([(item_id, deal_price, "alta")] if enviado else [])
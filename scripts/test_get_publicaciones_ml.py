@@ -0,0 +1,48 @@
+#!/usr/bin/env python3
+"""
+Pruebas del export de get_publicaciones_ml (sin red ni credenciales)
+Ejecutar con: python -m pytest -q test_get_publicaciones_ml.py
+"""
+
+import csv
+
+from get_publicaciones_ml import exportar_csv_incremental
+
+
+def _publicaciones(*ids):
+    return iter([{"id": item_id, "title": f"Item {item_id}", "status": "active", "price": 10} for item_id in ids])
+
+
+def _ids_csv(ruta):
+    with open(ruta, newline='', encoding="utf-8") as f:
+        return [fila["id"] for fila in csv.DictReader(f)]
+
+
+def test_csv_incompleto_conserva_el_anterior(tmp_path):
+    nombre = str(tmp_path / "CO")
+    exportar_csv_incremental(_publicaciones("MLM1", "MLM2"), nombre)
+    anterior = (tmp_path / "CO.csv").read_bytes()
+
+    exportar_csv_incremental(_publicaciones("MLM3"), nombre, completo=lambda: False)
+    assert (tmp_path / "CO.csv").read_bytes() == anterior
+    assert _ids_csv(tmp_path / "CO.csv.partial") == ["MLM3"]
+
+
+def test_csv_reanudado_continua_el_parcial(tmp_path):
+    nombre = str(tmp_path / "CO")
+    exportados = []
+    exportar_csv_incremental(_publicaciones("MLM1", "MLM2"), nombre, al_volcar=exportados.extend,
+                             completo=lambda: False)
+    assert not (tmp_path / "CO.csv").exists()
+
+    exportar_csv_incremental(_publicaciones("MLM3"), nombre, append=True, al_volcar=exportados.extend)
+    assert _ids_csv(tmp_path / "CO.csv") == ["MLM1", "MLM2", "MLM3"]
+    assert not (tmp_path / "CO.csv.partial").exists()
+    assert exportados == ["MLM1", "MLM2", "MLM3"]
+
+
+def test_csv_reanudado_sin_registros_nuevos(tmp_path):
+    nombre = str(tmp_path / "CO")
+    exportar_csv_incremental(_publicaciones("MLM1"), nombre, completo=lambda: False)
+    exportar_csv_incremental(_publicaciones(), nombre, append=True)
+    assert _ids_csv(tmp_path / "CO.csv") == ["MLM1"]
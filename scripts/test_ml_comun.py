@@ -0,0 +1,233 @@
+#!/usr/bin/env python3
+"""
+Pruebas de las utilidades compartidas de ml_comun (sin red ni credenciales)
+Ejecutar con: python -m pytest -q test_ml_comun.py
+"""
+
+import asyncio
+import time
+
+import pandas as pd
+import pytest
+
+from ml_comun import (ConjuntoIds, JournalItems, LimitadorAdaptativo, LimitadorTasa, decodificar_multiget,
+                      lock_token_async)
+
+
+# =========== ConjuntoIds ===========
+
+def test_conjunto_pertenencia():
+    ids = ConjuntoIds(["MLM100", "MLM7", "MCO42", "MLM100"])
+    assert len(ids) == 3
+    assert "MLM100" in ids and " MLM7 " in ids and "MCO42" in ids
+    assert "MLM8" not in ids and "MCO100" not in ids and "MLB100" not in ids
+    # Ceros a la izquierda no son el mismo ID
+    assert "MLM0100" not in ids
+
+
+def test_conjunto_ids_irregulares():
+    ids = ConjuntoIds(["MLM1", "abc-1", "MLM", ""])
+    assert "abc-1" in ids and "MLM" in ids
+    assert list(ids.contiene(["abc-1", "MLM1", "xyz"])) == [True, True, False]
+
+
+def test_conjunto_contiene_vectorizado():
+    ids = ConjuntoIds(["MLM1", "MLM3", "MCO2"])
+    consulta = pd.Series(["MLM1", "MLM2", "MCO2", None, "MLM3"])
+    assert list(ids.contiene(consulta)) == [True, False, True, False, True]
+    assert list(ConjuntoIds().contiene(["MLM1"])) == [False]
+
+
+def test_conjunto_agregar_con_buffer():
+    ids = ConjuntoIds()
+    ids.agregar(["MLM5", "MLM6"])
+    assert "MLM5" in ids  # todavía en el buffer
+    assert list(ids.contiene(["MLM6", "MLM7"])) == [True, False]
+    ids.agregar(["MLM7"])
+    assert len(ids) == 3
+    assert sorted(ids) == ["MLM5", "MLM6", "MLM7"]
+
+
+def test_conjunto_lotes_y_archivo(tmp_path):
+    ruta = tmp_path / "procesados.txt"
+    ruta.write_text("MLM3\n\nMLM1\nMLM2\nMLM1\n", encoding="utf-8")
+    ids = ConjuntoIds.leer_archivo(str(ruta))
+    assert len(ids) == 3
+    assert [len(lote) for lote in ids.lotes(2)] == [2, 1]
+
+
+@pytest.mark.parametrize("como", [ConjuntoIds, list, iter])
+def test_conjunto_operaciones(como):
+    a = ConjuntoIds(["MLM1", "MLM2", "MCO1", "raro-1", "raro-2"])
+    b = ["MLM2", "MLM3", "MCO1", "raro-2", "raro-3"]
+    otro = como(b) if como is not ConjuntoIds else ConjuntoIds(b)
+    assert sorted(a.union(otro)) == sorted(set(a) | set(b))
+
+    otro = como(b) if como is not ConjuntoIds else ConjuntoIds(b)
+    assert sorted(a.interseccion(otro)) == ["MCO1", "MLM2", "raro-2"]
+
+    otro = como(b) if como is not ConjuntoIds else ConjuntoIds(b)
+    assert sorted(a.diferencia(otro)) == ["MLM1", "raro-1"]
+
+
+def test_conjunto_operadores_no_modifican_operandos():
+    a = ConjuntoIds(["MLM1", "MLM2"])
+    b = ConjuntoIds(["MLM2", "MLM3"])
+    assert sorted(a | b) == ["MLM1", "MLM2", "MLM3"]
+    assert sorted(a & b) == ["MLM2"]
+    assert sorted(a - b) == ["MLM1"]
+    assert sorted(a) == ["MLM1", "MLM2"] and sorted(b) == ["MLM2", "MLM3"]
+
+
+# =========== JournalItems ===========
+
+def test_journal_ultimo_estado(tmp_path):
+    ruta = str(tmp_path / "journal.csv")
+    assert JournalItems.leer_ultimo_estado(ruta) == {}
+
+    journal = JournalItems(ruta, extras=["accion"])
+    journal.registrar("MLM1", "FAIL", 500, "error\ncon salto", accion="close")
+    journal.registrar("MLM2", "OK", 200, accion="close")
+    journal.registrar("MLM1", "OK", 200, accion="close")
+    journal.cerrar()
+
+    ultimo = JournalItems.leer_ultimo_estado(ruta)
+    assert set(ultimo) == {"MLM1", "MLM2"}
+    assert ultimo["MLM1"]["estado"] == "OK" and ultimo["MLM1"]["accion"] == "close"
+    assert ultimo["MLM2"]["codigo"] == "200"
+
+
+def test_journal_reabierto_conserva_encabezado(tmp_path):
+    ruta = str(tmp_path / "journal.csv")
+    journal = JournalItems(ruta, extras=["accion"])
+    journal.registrar("MLM1", "OK", accion="close")
+    journal.cerrar()
+
+    journal = JournalItems(ruta, extras=["fase"])
+    journal.registrar("MLM2", "OK", accion="delete", fase="x")
+    journal.cerrar()
+    assert open(ruta, encoding="utf-8").readline().strip() == "ts,id,estado,codigo,detalle,accion"
+    assert JournalItems.leer_ultimo_estado(ruta)["MLM2"]["accion"] == "delete"
+
+
+def test_journal_leer_desde_incremental(tmp_path):
+    ruta = str(tmp_path / "journal.csv")
+    assert JournalItems.leer_desde(ruta) == ([], 0)
+
+    journal = JournalItems(ruta)
+    journal.registrar("MLM1", "OK", detalle="uno\ndos")
+    filas, offset = JournalItems.leer_desde(ruta)
+    assert [f["id"] for f in filas] == ["MLM1"] and filas[0]["detalle"] == "uno dos"
+
+    journal.registrar("MLM2", "FAIL", 429)
+    journal.cerrar()
+    # Una línea a medio escribir no se consume hasta que esté completa
+    with open(ruta, "a", encoding="utf-8") as f:
+        f.write("2026-01-01T00:00:00,MLM3,OK")
+    filas, offset = JournalItems.leer_desde(ruta, offset)
+    assert [f["id"] for f in filas] == ["MLM2"]
+    assert JournalItems.leer_desde(ruta, offset)[0] == []
+
+    with open(ruta, "a", encoding="utf-8") as f:
+        f.write(",,\n")
+    filas, offset = JournalItems.leer_desde(ruta, offset)
+    assert [f["id"] for f in filas] == ["MLM3"]
+
+
+def test_journal_leer_desde_archivo_reemplazado(tmp_path):
+    ruta = str(tmp_path / "journal.csv")
+    journal = JournalItems(ruta)
+    for i in range(5):
+        journal.registrar(f"MLM{i}", "OK")
+    journal.cerrar()
+    _, offset = JournalItems.leer_desde(ruta)
+
+    # Journal nuevo más corto que el offset guardado → se relee desde el inicio
+    journal = JournalItems(str(tmp_path / "nuevo.csv"))
+    journal.registrar("MLM9", "OK")
+    journal.cerrar()
+    (tmp_path / "nuevo.csv").replace(ruta)
+    filas, _ = JournalItems.leer_desde(ruta, offset)
+    assert [f["id"] for f in filas] == ["MLM9"]
+
+
+# =========== decodificar_multiget ===========
+
+def test_multiget_por_posicion():
+    respuesta = [
+        {"code": 200, "body": {"id": "MLM1", "status": "active"}},
+        {"code": 404, "body": {"message": "not found"}},
+        "inesperado",
+    ]
+    salida = decodificar_multiget(["MLM1", "MLM2", "MLM3", "MLM4"], respuesta)
+    assert [(item_id, code) for item_id, code, _ in salida] == [
+        ("MLM1", 200), ("MLM2", 404), ("MLM3", None), ("MLM4", None)]
+    assert salida[0][2]["status"] == "active"
+    assert salida[1][2]["message"] == "not found"
+    assert "message" in salida[3][2]
+
+
+def test_multiget_body_nulo():
+    assert decodificar_multiget(["MLM1"], [{"code": 500, "body": None}]) == [("MLM1", 500, {})]
+
+
+# =========== LimitadorTasa ===========
+
+def test_limitador_rafaga_y_ritmo():
+    limitador = LimitadorTasa(rpm=600)  # 10/s, ráfaga de 10
+    inicio = time.monotonic()
+    for _ in range(10):
+        limitador.adquirir()
+    assert time.monotonic() - inicio < 0.1
+    for _ in range(5):
+        limitador.adquirir()
+    assert 0.4 <= time.monotonic() - inicio < 1.0
+
+
+def test_limitador_penalizar_bloquea():
+    limitador = LimitadorTasa(rpm=6000)
+    limitador.penalizar(0.3)
+    inicio = time.monotonic()
+    limitador.adquirir()
+    assert time.monotonic() - inicio >= 0.29
+
+
+def test_limitador_async():
+    limitador = LimitadorTasa(rpm=1200)  # 20/s, ráfaga de 20
+
+    async def consumir():
+        inicio = time.monotonic()
+        await asyncio.gather(*(limitador.adquirir_async() for _ in range(30)))
+        return time.monotonic() - inicio
+
+    assert 0.4 <= asyncio.run(consumir()) < 1.0
+
+
+def test_limitador_adaptativo_baja_una_vez_por_pausa():
+    limitador = LimitadorAdaptativo(rpm=600, rpm_minimo=100, enfriamiento=0.2)
+    limitador.penalizar(0.05)
+    limitador.penalizar(0.05)  # mismo episodio de 429: no vuelve a bajar
+    assert limitador.rpm_actual == pytest.approx(420)
+
+    time.sleep(0.06)
+    for _ in range(5):
+        limitador.penalizar(0)
+        time.sleep(0.001)
+    assert limitador.rpm_actual == pytest.approx(100)
+
+    # Sin 429 durante `enfriamiento` la tasa sube un paso al reservar el siguiente token
+    time.sleep(0.25)
+    limitador._reservar()
+    assert limitador.rpm_actual == pytest.approx(110)
+
+
+# =========== Renovación de token async ===========
+
+def test_lock_token_compartido_por_tienda():
+    async def locks():
+        return lock_token_async("CO"), lock_token_async("CO"), lock_token_async("DS")
+
+    co, co_otra_vez, ds = asyncio.run(locks())
+    assert co is co_otra_vez and co is not ds
+    # Cada event loop tiene sus propios locks
+    assert asyncio.run(locks())[0] is not co
@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+"""
+Pruebas del motor de reglas de precios_oferta (sin red ni credenciales)
+Ejecutar con: python -m pytest -q test_precios_oferta.py
+"""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from precios_oferta import calcular_precios, redondear_abajo, redondear_arriba
+
+# Ordenadas por largo de prefijo como las deja leer_reglas
+REGLAS = pd.DataFrame({
+    "prefijo_sku": ["SF", "SFRE"],
+    "descuento_pct": [10.0, 30.0],
+    "margen_minimo_pct": [np.nan, 25.0],
+})
+
+
+def _calcular(filas, reglas=REGLAS, **kwargs):
+    """filas: (sku, status, precio_base, costo[, min_discounted_price, max_discounted_price])"""
+    catalogo = pd.DataFrame([f + (np.nan,) * (6 - len(f)) for f in filas],
+                            columns=["sku", "status", "precio_base", "costo",
+                                     "min_discounted_price", "max_discounted_price"])
+    catalogo.insert(0, "id", [f"MLM{i}" for i in range(len(filas))])
+    return calcular_precios(catalogo, reglas, **kwargs)
+
+
+@pytest.mark.parametrize("fila, motivo, deal", [
+    # 10% de 100 = 90 → se redondea hacia abajo a 89.99
+    (("SF-1", "active", 100, 50), "ok", 89.99),
+    # SFRE gana por prefijo más largo: 30% = 70, pero el piso de margen 60 * 1.25 = 75 → 75.99
+    (("SFRE-1", "active", 100, 60), "ok", 75.99),
+    # Piso de margen 80 * 1.25 = 100 por encima del máximo que acepta ML (5% de descuento = 95)
+    (("SFRE-2", "active", 100, 80), "margen_insuficiente", None),
+    # El rango propio del item pide al menos 96 y la oferta no puede pasar de 95
+    (("SF-2", "active", 100, 50, 96, np.nan), "fuera_de_rango", None),
+    # El máximo propio del item manda sobre el descuento de la regla
+    (("SF-3", "active", 100, 50, np.nan, 80), "ok", 79.99),
+    (("SF-4", "paused", 100, 50), "inactivo", None),
+    (("SFRE-3", "closed", 100, 80), "inactivo", None),   # inactivo tiene prioridad sobre el resto
+    (("SF-5", "active", 0, 50), "sin_precio", None),
+    (("XX-1", "active", 100, 50), "sin_regla", None),
+    (("SFRE-4", "active", 100, np.nan), "sin_costo", None),
+    # Sin margen mínimo en la regla el costo no hace falta
+    (("SF-6", "active", 100, np.nan), "ok", 89.99),
+])
+def test_motivos(fila, motivo, deal):
+    resultado = _calcular([fila]).iloc[0]
+    assert resultado["motivo"] == motivo
+    if deal is None:
+        assert np.isnan(resultado["deal_price"]) and np.isnan(resultado["descuento_real"])
+    else:
+        assert resultado["deal_price"] == pytest.approx(deal)
+        assert resultado["descuento_real"] == pytest.approx(round((1 - deal / fila[2]) * 100, 2))
+
+
+def test_redondeo_hacia_abajo():
+    precios = np.array([90.0, 89.99, 89.98, 90.985, 1.5])
+    assert redondear_abajo(precios).tolist() == pytest.approx([89.99, 89.99, 88.99, 89.99, 0.99])
+    assert redondear_arriba(np.array([75.0, 75.99, 76.0])).tolist() == pytest.approx([75.99, 75.99, 76.99])
+
+
+def test_redondeo_configurable():
+    # COP sin decimales: 57000 - 10% = 51300 → 50900
+    resultado = _calcular([("SF-1", "active", 57000, 10000)], paso=1000, terminacion=900).iloc[0]
+    assert resultado["motivo"] == "ok"
+    assert resultado["deal_price"] == 50900
+
+
+def test_status_vacio_cuenta_como_activo():
+    resultado = _calcular([("SF-1", None, 100, 50)]).iloc[0]
+    assert resultado["motivo"] == "ok" and resultado["regla"] == "SF"
@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+"""
+Pruebas del muestreo estratificado de validar_datos_ml (sin red ni credenciales)
+Ejecutar con: python -m pytest -q test_validar_datos_ml.py
+"""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from validar_datos_ml import (CHEQUEOS, asignar_cuotas, debe_escalar, estimar_tasas, intervalo_wilson,
+                              muestrear_estratificado)
+
+
+def _excel(filas, semilla=7):
+    rng = np.random.default_rng(semilla)
+    return pd.DataFrame({
+        'ID': [f"MLM{i}" for i in range(filas)],
+        'Precio': rng.uniform(10, 1000, filas).round(2),
+        'Status': rng.choice(["active", "paused", "closed"], filas, p=[0.7, 0.25, 0.05]),
+    })
+
+
+def _validacion(fallas_por_estrato, poblacion_por_estrato):
+    """Resultado de validar una muestra: {estrato: (n, fallas)} con la bandera precio_difiere"""
+    filas = []
+    for estrato, (n, fallas) in fallas_por_estrato.items():
+        for i in range(n):
+            fila = {c: False for columnas in CHEQUEOS.values() for c in columnas}
+            fila['precio_difiere'] = i < fallas
+            fila.update(estrato=estrato, poblacion_estrato=poblacion_por_estrato[estrato])
+            filas.append(fila)
+    return pd.DataFrame(filas)
+
+
+# =========== Asignación y muestra ===========
+
+@pytest.mark.parametrize("tamano", [40, 400, 1234])
+def test_muestra_suma_tamano(tamano):
+    df = _excel(5000)
+    muestra = muestrear_estratificado(df, tamano, semilla=42)
+    assert len(muestra) == tamano
+    assert muestra['ID'].is_unique
+
+    poblacion = muestra.groupby('estrato')['poblacion_estrato'].first()
+    elegidos = muestra.groupby('estrato').size()
+    assert (elegidos >= np.minimum(poblacion, 2)).all() and (elegidos <= poblacion).all()
+    # Proporcional: si el mínimo de 2 no se activa, ningún estrato se aleja una fila de su cuota ideal
+    ideal = poblacion * tamano / len(df)
+    if (ideal >= 2).all():
+        assert ((elegidos - ideal).abs() < 1).all()
+
+
+def test_muestra_misma_semilla_mismas_filas():
+    df = _excel(3000)
+    a = muestrear_estratificado(df, 300, semilla=1)
+    b = muestrear_estratificado(df, 300, semilla=1)
+    assert a['ID'].tolist() == b['ID'].tolist()
+    assert a['ID'].tolist() != muestrear_estratificado(df, 300, semilla=2)['ID'].tolist()
+
+
+def test_cuotas_mayor_resto():
+    poblacion = pd.Series({"a": 50, "b": 30, "c": 15, "d": 5})
+    assert asignar_cuotas(poblacion, 20).to_dict() == {"a": 9, "b": 6, "c": 3, "d": 2}
+    assert asignar_cuotas(poblacion, 33).to_dict() == {"a": 16, "b": 10, "c": 5, "d": 2}
+    # El mínimo de 2 de "c" y "d" se descuenta de los estratos grandes para seguir sumando 10
+    assert asignar_cuotas(poblacion, 10).to_dict() == {"a": 4, "b": 2, "c": 2, "d": 2}
+    # Más que la población → toda la población
+    assert asignar_cuotas(poblacion, 500).to_dict() == poblacion.to_dict()
+    # Los mínimos de 2 mandan cuando la muestra es menor que 2 por estrato
+    assert asignar_cuotas(poblacion, 5).to_dict() == {"a": 2, "b": 2, "c": 2, "d": 2}
+
+
+# =========== Intervalo de Wilson y escalado ===========
+
+def test_wilson_valores_calculados_a_mano():
+    # 0 de 100: [0, z²/n / (1 + z²/n)]
+    inferior, superior = intervalo_wilson(0.0, 100)
+    assert inferior == 0.0
+    assert superior == pytest.approx(0.036995, abs=1e-6)
+    # 10 de 100
+    inferior, superior = intervalo_wilson(0.10, 100)
+    assert inferior == pytest.approx(0.055229, abs=1e-6)
+    assert superior == pytest.approx(0.174367, abs=1e-6)
+    assert intervalo_wilson(0.5, 0) == (0.0, 1.0)
+
+
+def test_tasas_estratificadas():
+    validacion = _validacion({"a": (100, 10), "b": (100, 0)}, {"a": 1000, "b": 3000})
+    tasas = estimar_tasas(validacion)
+    # Peso 1/4 para "a" (10%) y 3/4 para "b" (0%)
+    assert tasas.loc['precio', 'tasa'] == pytest.approx(0.025)
+    assert tasas.loc['general', 'tasa'] == pytest.approx(0.025)
+    assert tasas.loc['sku', 'tasa'] == 0.0 and tasas.loc['sku', 'ic_superior'] > 0.0
+    # n efectivo = p(1-p) / varianza estratificada con corrección por población finita
+    varianza = 0.25 ** 2 * 0.1 * 0.9 / 99 * (1 - 100 / 1000)
+    inferior, superior = intervalo_wilson(0.025, 0.025 * 0.975 / varianza)
+    assert tasas.loc['general', 'ic_inferior'] == pytest.approx(inferior)
+    assert tasas.loc['general', 'ic_superior'] == pytest.approx(superior)
+
+
+def test_censo_es_exacto():
+    tasas = estimar_tasas(_validacion({"a": (50, 5)}, {"a": 50}))
+    assert tuple(tasas.loc['general']) == pytest.approx((0.1, 0.1, 0.1))
+
+
+def test_escala_por_cota_superior_aunque_la_tasa_este_bajo_el_umbral():
+    # 4 errores en 400 de 10000: tasa 1% bajo el umbral de 2%, pero la cota superior lo pasa
+    tasas = estimar_tasas(_validacion({"a": (400, 4)}, {"a": 10000}))
+    assert tasas.loc['general', 'tasa'] == pytest.approx(0.01)
+    assert tasas.loc['general', 'ic_superior'] > 0.02
+    assert debe_escalar(tasas, 0.02)
+
+    # Con la muestra 10 veces más grande la cota baja del umbral
+    tasas = estimar_tasas(_validacion({"a": (4000, 40)}, {"a": 100000}))
+    assert tasas.loc['general', 'tasa'] == pytest.approx(0.01)
+    assert not debe_escalar(tasas, 0.02)
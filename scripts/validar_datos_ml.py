@@ -3,18 +3,27 @@
 Script para validar datos de Excel contra la API de MercadoLibre
 Lee un archivo Excel con columnas: ID, Precio, Cantidad disponible, SellerCustomSku, Status
 Hace consultas multiget a ML en grupos de 20 IDs y valida la información
+(o, con --source snapshot, contra el espejo Mongo `items` / un export Parquet sin usar la API)
 Genera un reporte detallado con estadísticas de validación
 """
 
+import numpy as np
 import pandas as pd
 import requests
 import time
 import json
 import os
+import shutil
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from typing import List, Dict, Tuple, Any
+from typing import List, Dict, Tuple, Any, Optional
 from dotenv import load_dotenv
 
+from ml_comun import (RATE_RPM_DEFAULT, obtener_limitador, crear_sesion, leer_retry_after,
+                      decodificar_multiget, error_multiget, ReporteStream)
+from snapshot_catalogo import cargar_snapshot, describir_edad
+
 load_dotenv()
 
 # === CONFIGURACIÓN ===
@@ -62,10 +71,21 @@ TIENDAS_ML = {
 }
 
 class ValidadorML:
-    def __init__(self, tienda_config: Dict[str, str]):
+    def __init__(self, tienda_config: Dict[str, str], rpm: float = RATE_RPM_DEFAULT, max_en_vuelo: int = 8):
         self.tienda = tienda_config
         self.access_token = tienda_config["access_token"]
         self.nombre_tienda = tienda_config["nombre_tienda"]
+        self.limitador = obtener_limitador(self.nombre_tienda, rpm)
+        self.max_en_vuelo = max_en_vuelo
+        self.session = crear_sesion(pool=max_en_vuelo)
+        self._token_lock = threading.Lock()
+
+    def _renovar_si_vigente(self, token_usado: str) -> bool:
+        """Renueva el token solo si nadie lo renovó mientras esperábamos el lock"""
+        with self._token_lock:
+            if self.access_token != token_usado:
+                return True
+            return self.renovar_token()
         
     def renovar_token(self, max_intentos: int = 3, espera_inicial: int = 1) -> bool:
         """Renueva el token de acceso de MercadoLibre"""
@@ -98,63 +118,87 @@ class ValidadorML:
                     print(f"❌ Falló renovación del token para {self.nombre_tienda} tras {max_intentos} intentos.")
                     return False
 
-    def obtener_detalles_multiget(self, ids: List[str], batch_size: int = 20) -> List[Dict[str, Any]]:
-        """Obtiene detalles de múltiples items usando multiget API"""
-        headers = {"Authorization": f"Bearer {self.access_token}"}
-        todos_los_resultados = []
-        total_batches = (len(ids) + batch_size - 1) // batch_size
+    def _obtener_lote(self, batch: List[str], max_reintentos: int = 4,
+                      campos: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+        """Un GET multiget bajo el limitador de la tienda; devuelve un registro por ID del lote"""
+        url = "https://api.mercadolibre.com/items"
+        params = {"ids": ",".join(batch)}
+        if campos:
+            params["attributes"] = ",".join(campos)
+        error = "Error desconocido"
         
-        print(f"📡 Iniciando consultas a ML API: {len(ids)} IDs en {total_batches} lotes de {batch_size}")
-        
-        for i in range(0, len(ids), batch_size):
-            batch_num = i // batch_size + 1
-            batch = ids[i:i + batch_size]
-            url = "https://api.mercadolibre.com/items"
-            params = {"ids": ",".join(batch)}
-            
-            print(f"🔄 Procesando lote {batch_num}/{total_batches} ({len(batch)} IDs): {batch[0]}{'...' if len(batch) > 1 else ''}")
-            
+        for intento in range(max_reintentos + 1):
+            token_usado = self.access_token
+            self.limitador.adquirir()
             try:
-                resp = requests.get(url, headers=headers, params=params)
-                
-                # Si el token expiró, intentar renovarlo
-                if resp.status_code == 401:
-                    print(f"⚠️  Token expirado para {self.nombre_tienda}, intentando renovar...")
-                    if self.renovar_token():
-                        headers = {"Authorization": f"Bearer {self.access_token}"}
-                        resp = requests.get(url, headers=headers, params=params)
-                        print(f"✅ Token renovado, reintentando lote {batch_num}")
-                    else:
-                        print(f"❌ No se pudo renovar token para {self.nombre_tienda}")
-                        continue
-                
-                resp.raise_for_status()
-                resultados = resp.json()
-                
-                exitosos = 0
-                fallidos = 0
-                
-                for entry in resultados:
-                    if entry.get("code") == 200:
-                        todos_los_resultados.append(entry["body"])
-                        exitosos += 1
-                    else:
-                        # Agregar información de error para IDs que fallaron
-                        error_info = {
-                            "id": batch[resultados.index(entry)] if entry.get("code") else "unknown",
-                            "error": f"Code {entry.get('code')}: {entry.get('body', {}).get('message', 'Unknown error')}"
-                        }
-                        todos_los_resultados.append(error_info)
-                        fallidos += 1
-                
-                print(f"✅ Lote {batch_num} completado: {exitosos} exitosos, {fallidos} fallidos")
-                
-                # Pequeña pausa entre requests para no sobrecargar la API
-                time.sleep(0.1)
-                
+                resp = self.session.get(url, headers={"Authorization": f"Bearer {token_usado}"},
+                                        params=params, timeout=30)
             except requests.RequestException as e:
-                print(f"❌ Error en lote {batch_num} para {self.nombre_tienda}: {e}")
+                error = f"Error de conexión: {e}"
+                time.sleep(min(4.0, 0.5 * 2 ** intento))
                 continue
+            
+            # Si el token expiró, intentar renovarlo
+            if resp.status_code == 401:
+                print(f"⚠️  Token expirado para {self.nombre_tienda}, intentando renovar...")
+                if not self._renovar_si_vigente(token_usado):
+                    error = "No se pudo renovar token"
+                    break
+                continue
+            
+            # Límite de tasa: pausa global para la tienda y reintento
+            if resp.status_code == 429:
+                self.limitador.penalizar(leer_retry_after(resp))
+                error = "Code 429: Too many requests"
+                continue
+            
+            if resp.status_code != 200:
+                error = f"Error HTTP {resp.status_code}"
+                break
+            
+            try:
+                respuesta = resp.json()
+            except ValueError:
+                error = "Respuesta no es JSON válido"
+                break
+            registros = []
+            for item_id, code, body in decodificar_multiget(batch, respuesta):
+                if code != 200:
+                    registros.append(error_multiget(item_id, code, body))
+                elif campos:
+                    registros.append({campo: body.get(campo) for campo in campos})
+                else:
+                    registros.append(body)
+            return registros
+        
+        return [{"id": item_id, "error": error} for item_id in batch]
+
+    def obtener_detalles_multiget(self, ids: List[str], batch_size: int = 20,
+                                  log_cada: int = 50,
+                                  campos: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+        """
+        Obtiene detalles de múltiples items usando multiget API.
+        Los lotes se piden en paralelo (hasta max_en_vuelo) con sesión compartida;
+        el ritmo lo marca el limitador de la tienda. El orden de salida sigue al de `ids`.
+        Con `campos` solo se conservan esas claves de cada item.
+        """
+        batches = [ids[i:i + batch_size] for i in range(0, len(ids), batch_size)]
+        total_batches = len(batches)
+        
+        print(f"📡 Iniciando consultas a ML API: {len(ids)} IDs en {total_batches} lotes de {batch_size} "
+              f"({self.max_en_vuelo} en paralelo)")
+        
+        todos_los_resultados = []
+        fallidos = 0
+        inicio = time.time()
+        with ThreadPoolExecutor(max_workers=self.max_en_vuelo) as executor:
+            obtener = lambda batch: self._obtener_lote(batch, campos=campos)
+            for batch_num, registros in enumerate(executor.map(obtener, batches), start=1):
+                todos_los_resultados.extend(registros)
+                fallidos += sum(1 for r in registros if 'error' in r)
+                if batch_num % log_cada == 0 or batch_num == total_batches:
+                    print(f"🔄 Lotes {batch_num}/{total_batches} - {len(todos_los_resultados)} respuestas, "
+                          f"{fallidos} con error ({len(todos_los_resultados) / max(time.time() - inicio, 1e-6):.0f} IDs/s)")
         
         print(f"📊 Consultas completadas: {len(todos_los_resultados)} respuestas obtenidas")
         return todos_los_resultados
@@ -216,6 +260,211 @@ class ValidadorML:
             'tiene_ventas': ml_data.get('sold_quantity', 0) > 0 if 'sold_quantity' in ml_data else False
         }
 
+# === MOTOR DE VALIDACIÓN COLUMNAR ===
+TOLERANCIA_PRECIO = 0.01
+CAMPOS_ML = ["id", "price", "available_quantity", "seller_custom_field", "status", "sold_quantity"]
+COLUMNAS_EXCEL = ['ID', 'Precio', 'Cantidad disponible', 'SellerCustomSku', 'Status']
+
+def construir_frame_ml(datos_ml: List[Dict[str, Any]]) -> pd.DataFrame:
+    """Pasa las respuestas de ML (cuerpos o {'id','error'}) a un DataFrame columnar por ID"""
+    frame = pd.DataFrame(datos_ml, columns=CAMPOS_ML + ["error"])
+    frame = frame.dropna(subset=["id"])
+    frame["id"] = frame["id"].astype(str)
+    return frame.drop_duplicates(subset=["id"], keep="last").reset_index(drop=True)
+
+def _texto_limpio(serie: pd.Series) -> pd.Series:
+    """Texto sin espacios; vacíos/NaN quedan como NA"""
+    texto = serie.astype("string").str.strip()
+    return texto.mask(texto == "")
+
+def _comparar_numeros(excel: pd.Series, ml: pd.Series, api_ok: np.ndarray, tolerancia: float):
+    """Devuelve (difiere, error_conversion) para una pareja de columnas numéricas"""
+    excel_num = pd.to_numeric(excel, errors="coerce")
+    ml_num = pd.to_numeric(ml, errors="coerce")
+    presente_excel = _texto_limpio(excel).notna().to_numpy()
+    presente_ml = ml.notna().to_numpy()
+    excel_ok = excel_num.notna().to_numpy()
+    ml_ok = ml_num.notna().to_numpy()
+    conversion = api_ok & ((presente_excel & ~excel_ok) | (presente_ml & ~ml_ok))
+    diferencia = np.abs(excel_num.to_numpy(dtype=float) - ml_num.to_numpy(dtype=float))
+    difiere = api_ok & excel_ok & ml_ok & (diferencia > tolerancia)
+    return difiere, conversion
+
+def _comparar_textos(excel: pd.Series, ml: pd.Series, api_ok: np.ndarray, minusculas: bool = False) -> np.ndarray:
+    excel_txt = _texto_limpio(excel)
+    ml_txt = _texto_limpio(ml)
+    if minusculas:
+        excel_txt = excel_txt.str.lower()
+        ml_txt = ml_txt.str.lower()
+    ambos = (excel_txt.notna() & ml_txt.notna()).to_numpy()
+    distintos = (excel_txt != ml_txt).fillna(False).to_numpy(dtype=bool)
+    return api_ok & ambos & distintos
+
+def validar_frame(df_excel: pd.DataFrame, frame_ml: pd.DataFrame,
+                  tolerancia: float = TOLERANCIA_PRECIO, origen_datos: str = "ML") -> pd.DataFrame:
+    """
+    Une Excel y ML por ID y calcula las discrepancias como columnas booleanas:
+    error_api, precio_difiere, precio_conversion, cantidad_difiere, cantidad_conversion,
+    sku_difiere, status_difiere, valido, tiene_ventas
+    """
+    excel = df_excel[COLUMNAS_EXCEL].copy()
+    excel['ID'] = excel['ID'].astype("string").str.strip()
+    excel = excel[excel['ID'].notna()]
+    tabla = excel.merge(frame_ml, left_on='ID', right_on='id', how='left', indicator=True)
+
+    encontrado = (tabla['_merge'] == 'both').to_numpy()
+    con_error = tabla['error'].notna().to_numpy()
+    api_ok = encontrado & ~con_error
+    tabla['error_api'] = ~api_ok
+    tabla['error'] = tabla['error'].where(encontrado, 'ID ' + tabla['ID'] + f' no encontrado en {origen_datos}')
+
+    tabla['precio_difiere'], tabla['precio_conversion'] = _comparar_numeros(
+        tabla['Precio'], tabla['price'], api_ok, tolerancia)
+    # Cantidad: se compara la parte entera, igual que int() en validar_item
+    cantidad_excel = pd.to_numeric(tabla['Cantidad disponible'], errors="coerce")
+    cantidad_ml = pd.to_numeric(tabla['available_quantity'], errors="coerce")
+    tabla['cantidad_difiere'], tabla['cantidad_conversion'] = _comparar_numeros(
+        tabla['Cantidad disponible'].where(cantidad_excel.isna(), np.trunc(cantidad_excel)),
+        tabla['available_quantity'].where(cantidad_ml.isna(), np.trunc(cantidad_ml)),
+        api_ok, 0)
+    tabla['sku_difiere'] = _comparar_textos(tabla['SellerCustomSku'], tabla['seller_custom_field'], api_ok)
+    tabla['status_difiere'] = _comparar_textos(tabla['Status'], tabla['status'], api_ok, minusculas=True)
+
+    banderas = ['error_api', 'precio_difiere', 'precio_conversion', 'cantidad_difiere',
+                'cantidad_conversion', 'sku_difiere', 'status_difiere']
+    tabla['valido'] = ~tabla[banderas].to_numpy().any(axis=1)
+    ventas = pd.to_numeric(tabla['sold_quantity'], errors="coerce").fillna(0).to_numpy()
+    tabla['tiene_ventas'] = api_ok & (ventas > 0)
+    return tabla.drop(columns=['id', '_merge'])
+
+def tabla_diferencias(validacion: pd.DataFrame) -> pd.DataFrame:
+    """Tabla compacta de filas inválidas con el texto de errores (mismo formato que validar_item)"""
+    malos = validacion[~validacion['valido']]
+    texto = lambda serie: serie.map(str)
+    partes = [
+        (malos['error_api'], "Error API ML: " + texto(malos['error'])),
+        (malos['precio_difiere'], "Precio: Excel=" + texto(malos['Precio']) + ", ML=" + texto(malos['price'])),
+        (malos['precio_conversion'], pd.Series("Precio: Error en conversión", index=malos.index)),
+        (malos['cantidad_difiere'], "Cantidad: Excel=" + texto(malos['Cantidad disponible'])
+         + ", ML=" + texto(malos['available_quantity'])),
+        (malos['cantidad_conversion'], pd.Series("Cantidad: Error en conversión", index=malos.index)),
+        (malos['sku_difiere'], "SKU: Excel=" + texto(malos['SellerCustomSku']).str.strip()
+         + ", ML=" + texto(malos['seller_custom_field']).str.strip()),
+        (malos['status_difiere'], "Status: Excel=" + texto(malos['Status']).str.strip().str.lower()
+         + ", ML=" + texto(malos['status']).str.strip().str.lower()),
+    ]
+    errores = np.full(len(malos), "", dtype=object)
+    for marca, mensaje in partes:
+        marca = marca.to_numpy(dtype=bool)
+        separador = np.where(errores[marca] == "", "", ", ").astype(object)
+        errores[marca] = errores[marca] + separador + mensaje.to_numpy(dtype=object)[marca]
+
+    salida = malos[COLUMNAS_EXCEL + ['price', 'available_quantity', 'seller_custom_field', 'status', 'error_api']].copy()
+    salida.insert(1, 'errores', errores)
+    return salida.reset_index(drop=True)
+
+class ReporteValidacion:
+    """Acumula contadores y escribe el detalle de inválidos a medida que se valida"""
+
+    def __init__(self, tienda: str, archivo_salida: Optional[str] = None):
+        self.tienda = tienda
+        self.fecha = datetime.now().isoformat()
+        self.stream = ReporteStream(archivo_salida)
+        self.fuente = None  # texto opcional con el origen de los datos (p.ej. antigüedad del snapshot)
+        self.muestreo = None  # sección opcional con las tasas estimadas por muestreo
+        self.total = 0
+        self.validos = 0
+        self.con_ventas = 0
+
+    def registrar(self, resultado: Dict[str, Any]):
+        self.total += 1
+        if resultado.get('tiene_ventas', False):
+            self.con_ventas += 1
+        if resultado['valido']:
+            self.validos += 1
+            return
+        for error in resultado['errores']:
+            self.stream.registrar_error(error)
+
+        lineas = [
+            f"\nID: {resultado['id']}\n",
+            f"Errores: {', '.join(resultado['errores'])}\n",
+        ]
+        datos_excel = resultado.get('datos_excel')
+        if datos_excel:
+            lineas.append(f"Datos Excel: Precio={datos_excel.get('Precio')}, "
+                          f"Cantidad={datos_excel.get('Cantidad disponible')}, "
+                          f"SKU={datos_excel.get('SellerCustomSku')}, "
+                          f"Status={datos_excel.get('Status')}\n")
+        datos_ml = resultado.get('datos_ml')
+        if datos_ml and 'error' not in datos_ml:
+            lineas.append(f"Datos ML: Precio={datos_ml.get('price')}, "
+                          f"Cantidad={datos_ml.get('available_quantity')}, "
+                          f"SKU={datos_ml.get('seller_custom_field')}, "
+                          f"Status={datos_ml.get('status')}\n")
+        lineas.append("-" * 50 + "\n")
+        self.stream.escribir_detalle("".join(lineas))
+
+    def registrar_tabla(self, validacion: pd.DataFrame, diferencias: pd.DataFrame, chunk: int = 10000):
+        """Registra una validación columnar completa (contadores por suma y detalle por bloques)"""
+        self.total += len(validacion)
+        self.validos += int(validacion['valido'].sum())
+        self.con_ventas += int(validacion['tiene_ventas'].sum())
+        self.stream.sumar_errores({
+            'Error API ML': validacion['error_api'].sum(),
+            'Precio': validacion['precio_difiere'].sum() + validacion['precio_conversion'].sum(),
+            'Cantidad': validacion['cantidad_difiere'].sum() + validacion['cantidad_conversion'].sum(),
+            'SKU': validacion['sku_difiere'].sum(),
+            'Status': validacion['status_difiere'].sum(),
+        })
+
+        for inicio in range(0, len(diferencias), chunk):
+            bloque = diferencias.iloc[inicio:inicio + chunk]
+            texto = lambda columna: bloque[columna].map(str)
+            detalle = ("\nID: " + texto('ID') + "\nErrores: " + texto('errores')
+                       + "\nDatos Excel: Precio=" + texto('Precio')
+                       + ", Cantidad=" + texto('Cantidad disponible')
+                       + ", SKU=" + texto('SellerCustomSku')
+                       + ", Status=" + texto('Status') + "\n")
+            datos_ml = ("Datos ML: Precio=" + texto('price')
+                        + ", Cantidad=" + texto('available_quantity')
+                        + ", SKU=" + texto('seller_custom_field')
+                        + ", Status=" + texto('status') + "\n")
+            detalle = detalle + datos_ml.where(~bloque['error_api'], "") + "-" * 50 + "\n"
+            self.stream.escribir_detalle("".join(detalle.tolist()))
+
+    def cerrar(self) -> str:
+        total_items = self.total
+        base = total_items or 1
+        invalidos = total_items - self.validos
+        sin_ventas = total_items - self.con_ventas
+        linea_fuente = f"Fuente: {self.fuente}\n" if self.fuente else ""
+        encabezado = f"""
+REPORTE DE VALIDACIÓN MERCADOLIBRE
+==================================
+Tienda: {self.tienda}
+Fecha: {self.fecha}
+{linea_fuente}Total de items procesados: {total_items}
+
+ESTADÍSTICAS GENERALES
+=====================
+Items válidos (datos coinciden): {self.validos} ({self.validos/base*100:.1f}%)
+Items inválidos (datos no coinciden): {invalidos} ({invalidos/base*100:.1f}%)
+
+ESTADÍSTICAS DE VENTAS
+=====================
+Items con ventas: {self.con_ventas} ({self.con_ventas/base*100:.1f}%)
+Items sin ventas: {sin_ventas} ({sin_ventas/base*100:.1f}%)
+{self.muestreo or ""}
+ERRORES MÁS COMUNES
+==================
+"""
+        titulo_detalle = """
+DETALLE DE ITEMS INVÁLIDOS
+=========================
+"""
+        return self.stream.cerrar(encabezado, titulo_detalle)
+
 def leer_archivo_excel(ruta_archivo: str) -> pd.DataFrame:
     """Lee el archivo Excel y valida las columnas requeridas"""
     print(f"   📖 Leyendo archivo: {ruta_archivo}")
@@ -241,8 +490,156 @@ def leer_archivo_excel(ruta_archivo: str) -> pd.DataFrame:
     print(f"   ✅ Estructura del archivo válida: todas las columnas requeridas presentes")
     return df
 
-def procesar_validacion(archivo_excel: str, tienda: str = "CO") -> Dict[str, Any]:
-    """Procesa la validación completa de datos"""
+def obtener_frame_api(tienda: str, ids: List[str]) -> pd.DataFrame:
+    """Datos actuales desde la API (multiget concurrente, solo campos validados)"""
+    validador = ValidadorML(TIENDAS_ML[tienda])
+    print(f"✅ Validador configurado para tienda: {tienda}")
+    datos_ml = validador.obtener_detalles_multiget(ids, campos=CAMPOS_ML)
+    return construir_frame_ml(datos_ml)
+
+def obtener_frame_snapshot(tienda: str, ids: List[str], snapshot: str = "mongo") -> Tuple[pd.DataFrame, Optional[datetime]]:
+    """Datos desde el snapshot local (Mongo `items` o Parquet): cero cuota de API"""
+    frame, fecha = cargar_snapshot(snapshot, ids, origen=tienda)
+    frame = frame.copy()
+    frame["error"] = None
+    return frame, fecha
+
+# === VALIDACIÓN POR MUESTREO ===
+FRACCION_MUESTRA = 0.01   # ~1% de las filas
+MUESTRA_MINIMA = 400      # ±5 puntos al 95% en el peor caso
+UMBRAL_ESCALAR = 0.02     # si la cota superior del IC de la tasa de error lo supera → validación completa
+BUCKETS_PRECIO = 4
+Z_95 = 1.96
+CHEQUEOS = {
+    'general': ['error_api', 'precio_difiere', 'precio_conversion', 'cantidad_difiere',
+                'cantidad_conversion', 'sku_difiere', 'status_difiere'],
+    'error_api': ['error_api'],
+    'precio': ['precio_difiere', 'precio_conversion'],
+    'cantidad': ['cantidad_difiere', 'cantidad_conversion'],
+    'sku': ['sku_difiere'],
+    'status': ['status_difiere'],
+}
+
+def asignar_estratos(df: pd.DataFrame, buckets: int = BUCKETS_PRECIO) -> pd.Series:
+    """Estrato = status del Excel × cuartil de precio"""
+    status = df['Status'].astype("string").str.strip().str.lower().fillna("sin_status")
+    precio = pd.to_numeric(df['Precio'], errors="coerce")
+    if precio.notna().sum() >= buckets:
+        bucket = pd.qcut(precio.rank(method="first"), buckets, labels=False)
+    else:
+        bucket = pd.Series(0, index=df.index)
+    bucket = bucket.astype("Int64").astype("string").fillna("sin_precio")
+    return status + "|p" + bucket
+
+def asignar_cuotas(poblacion: pd.Series, tamano: int) -> pd.Series:
+    """
+    Cuota por estrato con asignación proporcional redondeada por mayor resto.
+    Suma exactamente `tamano` (acotado a la población) con mínimo 2 por estrato y sin pasar
+    su población; solo se excede si los mínimos ya piden más que `tamano`.
+    """
+    total = int(poblacion.sum())
+    tamano = min(int(tamano), total)
+    ideal = poblacion * (tamano / max(total, 1))
+    minimo = np.minimum(poblacion, 2)
+    cuota = np.floor(ideal).clip(lower=minimo, upper=poblacion).astype(int)
+    while cuota.sum() != tamano:
+        if cuota.sum() < tamano:
+            cuota[(ideal - cuota)[cuota < poblacion].idxmax()] += 1
+        else:
+            sobrantes = (cuota - ideal)[cuota > minimo]
+            if sobrantes.empty:
+                break
+            cuota[sobrantes.idxmax()] -= 1
+    return cuota
+
+def muestrear_estratificado(df: pd.DataFrame, tamano: int, semilla: Optional[int] = None) -> pd.DataFrame:
+    """
+    Muestra aleatoria estratificada con asignación proporcional (mínimo 2 por estrato).
+    Devuelve las filas elegidas con columnas extra `estrato` y `poblacion_estrato`.
+    """
+    df = df.assign(estrato=asignar_estratos(df))
+    poblacion = df.groupby('estrato')['estrato'].transform('size')
+    cuota = df['estrato'].map(asignar_cuotas(df.groupby('estrato').size(), tamano))
+    # Orden aleatorio dentro de cada estrato y corte por cuota
+    rng = np.random.default_rng(semilla)
+    orden = pd.Series(rng.random(len(df)), index=df.index).groupby(df['estrato']).rank(method="first")
+    muestra = df[orden <= cuota].copy()
+    muestra['poblacion_estrato'] = poblacion[orden <= cuota]
+    return muestra
+
+def intervalo_wilson(tasa: float, n: float, z: float = Z_95) -> Tuple[float, float]:
+    """Intervalo de Wilson; a diferencia del normal no colapsa a [0, 0] sin errores observados"""
+    if n <= 0:
+        return 0.0, 1.0
+    z2 = z * z
+    centro = (tasa + z2 / (2 * n)) / (1 + z2 / n)
+    margen = z / (1 + z2 / n) * np.sqrt(tasa * (1 - tasa) / n + z2 / (4 * n * n))
+    return max(0.0, centro - margen), min(1.0, centro + margen)
+
+def estimar_tasas(validacion: pd.DataFrame, z: float = Z_95) -> pd.DataFrame:
+    """
+    Tasa de error estratificada por chequeo con intervalo de confianza de Wilson sobre el
+    tamaño efectivo de la muestra (varianza estratificada con corrección por población finita).
+    Si la muestra cubre toda la población la tasa es exacta.
+    Índice: chequeo; columnas: tasa, ic_inferior, ic_superior.
+    """
+    n_h = validacion.groupby('estrato').size()
+    N_h = validacion.groupby('estrato')['poblacion_estrato'].first()
+    pesos = N_h / N_h.sum()
+    fpc = (1 - n_h / N_h).clip(lower=0)
+    censo = bool((fpc == 0).all())
+
+    filas = {}
+    for chequeo, columnas in CHEQUEOS.items():
+        falla = validacion[columnas].to_numpy().any(axis=1)
+        p_h = pd.Series(falla, index=validacion.index).groupby(validacion['estrato']).mean()
+        var_h = p_h * (1 - p_h) / (n_h - 1).clip(lower=1) * fpc
+        tasa = float((pesos * p_h).sum())
+        varianza = float((pesos ** 2 * var_h).sum())
+        if censo:
+            inferior, superior = tasa, tasa
+        else:
+            # Sin varianza observada (0% o 100% en todos los estratos) se usa el n total de la muestra
+            n_efectivo = tasa * (1 - tasa) / varianza if varianza > 0 else float(n_h.sum())
+            inferior, superior = intervalo_wilson(tasa, n_efectivo, z)
+        filas[chequeo] = {'tasa': tasa, 'ic_inferior': inferior, 'ic_superior': superior}
+    return pd.DataFrame.from_dict(filas, orient='index')
+
+def debe_escalar(tasas: pd.DataFrame, umbral: float = UMBRAL_ESCALAR) -> bool:
+    """Se decide con la cota superior: una muestra chica y limpia no alcanza para dar GO"""
+    return bool(tasas.loc['general', 'ic_superior'] > umbral)
+
+def texto_muestreo(muestreo: Dict[str, Any]) -> str:
+    """Sección del reporte con las tasas estimadas"""
+    lineas = [
+        "\nMUESTREO ESTRATIFICADO\n",
+        "=====================\n",
+        f"Muestra: {muestreo['tamano_muestra']} de {muestreo['poblacion']} filas "
+        f"({muestreo['estratos']} estratos status × precio)\n",
+    ]
+    for chequeo, fila in muestreo['tasas'].items():
+        lineas.append(f"Tasa {chequeo}: {fila['tasa']*100:.2f}% "
+                      f"(IC 95%: {fila['ic_inferior']*100:.2f}% - {fila['ic_superior']*100:.2f}%)\n")
+    decision = "validación completa" if muestreo['escalado'] else "sin escalar"
+    lineas.append(f"Umbral (cota superior del IC): {muestreo['umbral']*100:.2f}% → {decision}\n")
+    return "".join(lineas)
+
+def _frame_actual(fuente: str, tienda: str, ids: List[str], snapshot: str) -> Tuple[pd.DataFrame, Optional[datetime]]:
+    if fuente == "snapshot":
+        return obtener_frame_snapshot(tienda, ids, snapshot)
+    return obtener_frame_api(tienda, ids), None
+
+def procesar_validacion(archivo_excel: str, tienda: str = "CO",
+                        archivo_reporte: Optional[str] = None,
+                        fuente: str = "api", snapshot: str = "mongo",
+                        muestra: Optional[float] = None, umbral: float = UMBRAL_ESCALAR,
+                        semilla: Optional[int] = None) -> Dict[str, Any]:
+    """
+    Procesa la validación completa de datos; el reporte se escribe mientras avanza.
+    fuente='api' consulta MercadoLibre; fuente='snapshot' usa `snapshot` ('mongo' o ruta .parquet).
+    Con `muestra` (fracción de filas) se valida primero una muestra estratificada y solo se
+    escala a la validación completa si la cota superior del IC de la tasa de error supera `umbral`.
+    """
     print(f"🚀 Iniciando validación para tienda: {tienda}")
     print("=" * 60)
     
@@ -254,57 +651,114 @@ def procesar_validacion(archivo_excel: str, tienda: str = "CO") -> Dict[str, Any
         return None
     print(f"✅ Archivo Excel leído exitosamente: {len(df)} filas")
     
-    # Configurar validador
+    # Verificar tienda y fuente
     print("\n🔧 Paso 2/5: Configurando validador...")
     if tienda not in TIENDAS_ML:
         print(f"❌ Error: Tienda {tienda} no encontrada. Tiendas disponibles: {list(TIENDAS_ML.keys())}")
         return None
+    if fuente not in ("api", "snapshot"):
+        print(f"❌ Error: Fuente {fuente} no soportada (usa 'api' o 'snapshot')")
+        return None
+    print(f"✅ Fuente de datos: {fuente}")
+    origen_datos = "snapshot" if fuente == "snapshot" else "ML"
     
-    validador = ValidadorML(TIENDAS_ML[tienda])
-    print(f"✅ Validador configurado para tienda: {tienda}")
+    df = df[df['ID'].notna()].copy()
+    df['ID'] = df['ID'].astype(str).str.strip()
+    
+    # Muestreo estratificado (opcional)
+    muestreo = None
+    filas = df
+    if muestra:
+        tamano = min(len(df), max(MUESTRA_MINIMA, int(np.ceil(len(df) * muestra))))
+        filas = muestrear_estratificado(df, tamano, semilla)
+        print(f"🎲 Muestreo: {len(filas)} de {len(df)} filas ({len(filas)/max(len(df), 1)*100:.1f}%)")
     
     # Obtener IDs únicos
     print("\n🔍 Paso 3/5: Preparando IDs para consulta...")
-    ids = df['ID'].dropna().unique().tolist()
+    ids = filas['ID'].unique().tolist()
     print(f"✅ Procesando {len(ids)} IDs únicos")
     
-    # Obtener datos de ML
-    print("\n🌐 Paso 4/5: Obteniendo datos de MercadoLibre...")
-    datos_ml = validador.obtener_detalles_multiget(ids)
-    print(f"✅ Obtenidos {len(datos_ml)} respuestas de ML")
-    
-    # Crear diccionario para búsqueda rápida
+    # Obtener datos actuales (solo los campos que se validan)
+    if fuente == "snapshot":
+        print(f"\n🗄️  Paso 4/5: Cargando snapshot del catálogo ({snapshot})...")
+    else:
+        print("\n🌐 Paso 4/5: Obteniendo datos de MercadoLibre...")
+    try:
+        frame_ml, fecha_snapshot = _frame_actual(fuente, tienda, ids, snapshot)
+    except Exception as e:
+        print(f"❌ Error obteniendo datos ({fuente}): {e}")
+        return None
+    print(f"✅ Obtenidos {len(frame_ml)} registros de {origen_datos}")
+    if fuente == "snapshot":
+        print(f"🕒 Antigüedad del snapshot: {describir_edad(fecha_snapshot)}")
+    
+    if muestra:
+        validacion_muestra = validar_frame(filas, frame_ml, origen_datos=origen_datos)
+        validacion_muestra['estrato'] = filas['estrato'].to_numpy()
+        validacion_muestra['poblacion_estrato'] = filas['poblacion_estrato'].to_numpy()
+        tasas = estimar_tasas(validacion_muestra)
+        general = tasas.loc['general']
+        muestreo = {
+            'tamano_muestra': len(filas),
+            'poblacion': len(df),
+            'estratos': int(filas['estrato'].nunique()),
+            'tasas': tasas.to_dict(orient='index'),
+            'umbral': umbral,
+            'escalado': debe_escalar(tasas, umbral),
+        }
+        print(f"📐 Tasa de error estimada: {general['tasa']*100:.2f}% "
+              f"(IC 95%: {general['ic_inferior']*100:.2f}% - {general['ic_superior']*100:.2f}%)")
+        if muestreo['escalado']:
+            # Se reutiliza lo ya consultado y solo se piden los IDs fuera de la muestra
+            print(f"⚠️  La cota superior ({general['ic_superior']*100:.2f}%) supera el umbral de {umbral*100:.2f}% → validación completa")
+            faltantes = df.loc[~df['ID'].isin(frame_ml['id']), 'ID'].unique().tolist()
+            try:
+                resto, _ = _frame_actual(fuente, tienda, faltantes, snapshot)
+            except Exception as e:
+                print(f"❌ Error obteniendo datos ({fuente}): {e}")
+                return None
+            frame_ml = pd.concat([frame_ml, resto], ignore_index=True)
+            filas = df
+        else:
+            print(f"✅ Cota superior bajo el umbral de {umbral*100:.2f}% → no se requiere validación completa")
+    
+    # Validación columnar: join por ID + comparaciones vectorizadas
     print("\n📊 Paso 5/5: Procesando validaciones...")
-    datos_ml_dict = {}
-    for item in datos_ml:
-        if 'id' in item:
-            datos_ml_dict[item['id']] = item
-    
-    print(f"🔄 Validando {len(df)} filas del Excel...")
-    resultados_validacion = []
-    items_procesados = 0
-    
-    for idx, row in df.iterrows():
-        id_item = row['ID']
-        if pd.isna(id_item):
-            continue
-            
-        datos_ml_item = datos_ml_dict.get(id_item, {'error': f'ID {id_item} no encontrado en ML'})
-        resultado = validador.validar_item(row.to_dict(), datos_ml_item)
-        resultados_validacion.append(resultado)
-        
-        items_procesados += 1
-        if items_procesados % 50 == 0 or items_procesados == len(df):
-            print(f"   📈 Progreso: {items_procesados}/{len(df)} items validados ({items_procesados/len(df)*100:.1f}%)")
-    
-    print(f"✅ Validación completada: {len(resultados_validacion)} items procesados")
+    print(f"🔄 Validando {len(filas)} filas del Excel...")
+    archivo_reporte = archivo_reporte or f"reporte_validacion_{tienda}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.txt"
+    reporte = ReporteValidacion(tienda, archivo_reporte)
+    if fuente == "snapshot":
+        reporte.fuente = f"snapshot {snapshot}, antigüedad {describir_edad(fecha_snapshot)}"
+    if muestreo:
+        reporte.muestreo = texto_muestreo(muestreo)
+    validacion = validar_frame(filas, frame_ml, origen_datos=origen_datos)
+    diferencias = tabla_diferencias(validacion)
+    reporte.registrar_tabla(validacion, diferencias)
+    
+    archivo_diferencias = None
+    if len(diferencias) > 0:
+        archivo_diferencias = f"{os.path.splitext(archivo_reporte)[0]}_diferencias.csv"
+        diferencias.to_csv(archivo_diferencias, index=False, encoding="utf-8")
+        print(f"⚠️  {len(diferencias)} filas con diferencias → {archivo_diferencias}")
+    
+    print(f"✅ Validación completada: {reporte.total} items procesados")
     print("=" * 60)
     
+    print(f"\n📋 Generando reporte: {archivo_reporte}")
+    resumen = reporte.cerrar()
+    
     return {
         'tienda': tienda,
-        'total_items': len(resultados_validacion),
-        'resultados': resultados_validacion,
-        'fecha_procesamiento': datetime.now().isoformat()
+        'total_items': reporte.total,
+        'items_validos': reporte.validos,
+        'items_con_ventas': reporte.con_ventas,
+        'archivo_reporte': archivo_reporte,
+        'archivo_diferencias': archivo_diferencias,
+        'fuente': fuente,
+        'fecha_snapshot': fecha_snapshot,
+        'muestreo': muestreo,
+        'reporte': resumen,
+        'fecha_procesamiento': reporte.fecha
     }
 
 def generar_reporte(resultados: Dict[str, Any], archivo_salida: str = None) -> str:
@@ -312,80 +766,19 @@ def generar_reporte(resultados: Dict[str, Any], archivo_salida: str = None) -> s
     if not resultados:
         return "No hay resultados para reportar"
     
-    print("📊 Generando reporte detallado...")
-    
-    # Calcular estadísticas
-    total_items = resultados['total_items']
-    items_validos = sum(1 for r in resultados['resultados'] if r['valido'])
-    items_invalidos = total_items - items_validos
-    items_con_ventas = sum(1 for r in resultados['resultados'] if r.get('tiene_ventas', False))
-    items_sin_ventas = total_items - items_con_ventas
-    
-    print(f"   📈 Calculando estadísticas: {total_items} items totales")
-    
-    # Contar errores por tipo
-    print("   🔍 Analizando errores...")
-    errores_por_tipo = {}
-    for resultado in resultados['resultados']:
-        if not resultado['valido']:
-            for error in resultado['errores']:
-                tipo_error = error.split(':')[0] if ':' in error else error
-                errores_por_tipo[tipo_error] = errores_por_tipo.get(tipo_error, 0) + 1
-    
-    # Generar reporte
-    reporte = f"""
-REPORTE DE VALIDACIÓN MERCADOLIBRE
-==================================
-Tienda: {resultados['tienda']}
-Fecha: {resultados['fecha_procesamiento']}
-Total de items procesados: {total_items}
-
-ESTADÍSTICAS GENERALES
-=====================
-Items válidos (datos coinciden): {items_validos} ({items_validos/total_items*100:.1f}%)
-Items inválidos (datos no coinciden): {items_invalidos} ({items_invalidos/total_items*100:.1f}%)
-
-ESTADÍSTICAS DE VENTAS
-=====================
-Items con ventas: {items_con_ventas} ({items_con_ventas/total_items*100:.1f}%)
-Items sin ventas: {items_sin_ventas} ({items_sin_ventas/total_items*100:.1f}%)
-
-ERRORES MÁS COMUNES
-==================
-"""
-    
-    for tipo_error, cantidad in sorted(errores_por_tipo.items(), key=lambda x: x[1], reverse=True):
-        reporte += f"{tipo_error}: {cantidad} ocurrencias\n"
-    
-    reporte += f"""
-DETALLE DE ITEMS INVÁLIDOS
-=========================
-"""
+    # procesar_validacion ya escribió el reporte mientras validaba
+    if 'resultados' not in resultados:
+        origen = resultados.get('archivo_reporte')
+        if archivo_salida and origen and os.path.abspath(origen) != os.path.abspath(archivo_salida):
+            shutil.copyfile(origen, archivo_salida)
+        return resultados.get('reporte', '')
     
+    print("📊 Generando reporte detallado...")
+    reporte = ReporteValidacion(resultados['tienda'], archivo_salida)
+    reporte.fecha = resultados['fecha_procesamiento']
     for resultado in resultados['resultados']:
-        if not resultado['valido']:
-            reporte += f"\nID: {resultado['id']}\n"
-            reporte += f"Errores: {', '.join(resultado['errores'])}\n"
-            if resultado['datos_excel']:
-                reporte += f"Datos Excel: Precio={resultado['datos_excel'].get('Precio')}, "
-                reporte += f"Cantidad={resultado['datos_excel'].get('Cantidad disponible')}, "
-                reporte += f"SKU={resultado['datos_excel'].get('SellerCustomSku')}, "
-                reporte += f"Status={resultado['datos_excel'].get('Status')}\n"
-            if resultado['datos_ml'] and 'error' not in resultado['datos_ml']:
-                reporte += f"Datos ML: Precio={resultado['datos_ml'].get('price')}, "
-                reporte += f"Cantidad={resultado['datos_ml'].get('available_quantity')}, "
-                reporte += f"SKU={resultado['datos_ml'].get('seller_custom_field')}, "
-                reporte += f"Status={resultado['datos_ml'].get('status')}\n"
-            reporte += "-" * 50 + "\n"
-    
-    # Guardar reporte si se especifica archivo
-    if archivo_salida:
-        print(f"💾 Guardando reporte en: {archivo_salida}")
-        with open(archivo_salida, 'w', encoding='utf-8') as f:
-            f.write(reporte)
-        print(f"✅ Reporte guardado exitosamente")
-    
-    return reporte
+        reporte.registrar(resultado)
+    return reporte.cerrar()
 
 def main():
     """Función principal"""
@@ -396,6 +789,15 @@ def main():
     parser.add_argument('--tienda', default='CO', choices=list(TIENDAS_ML.keys()), 
                        help='Tienda a procesar (default: CO)')
     parser.add_argument('--salida', help='Archivo de salida para el reporte')
+    parser.add_argument('--source', default='api', choices=['api', 'snapshot'],
+                       help="Origen de los datos a comparar: API en vivo o snapshot local (default: api)")
+    parser.add_argument('--snapshot', default='mongo',
+                       help="Con --source snapshot: 'mongo' o ruta a un export .parquet (default: mongo)")
+    parser.add_argument('--muestra', type=float, nargs='?', const=FRACCION_MUESTRA,
+                       help=f'Validar una muestra estratificada (fracción de filas, default {FRACCION_MUESTRA})')
+    parser.add_argument('--umbral', type=float, default=UMBRAL_ESCALAR,
+                       help=f'Cota superior (IC 95%) de la tasa de error que escala a validación completa (default: {UMBRAL_ESCALAR})')
+    parser.add_argument('--semilla', type=int, help='Semilla del muestreo (reproducible)')
     
     args = parser.parse_args()
     
@@ -403,6 +805,7 @@ def main():
     print("=" * 50)
     print(f"📁 Archivo: {args.archivo_excel}")
     print(f"🏪 Tienda: {args.tienda}")
+    print(f"🗄️  Fuente: {args.source}" + (f" ({args.snapshot})" if args.source == 'snapshot' else ""))
     print(f"⏰ Inicio: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
     print("=" * 50)
     
@@ -411,32 +814,39 @@ def main():
         print(f"❌ Error: El archivo {args.archivo_excel} no existe")
         return
     
-    # Procesar validación
+    # Procesar validación (el reporte se escribe en streaming)
+    archivo_reporte = args.salida or f"reporte_validacion_{args.tienda}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.txt"
     print("\n🚀 Iniciando proceso de validación...")
-    resultados = procesar_validacion(args.archivo_excel, args.tienda)
+    resultados = procesar_validacion(args.archivo_excel, args.tienda, archivo_reporte=archivo_reporte,
+                                     fuente=args.source, snapshot=args.snapshot,
+                                     muestra=args.muestra, umbral=args.umbral, semilla=args.semilla)
     
     if not resultados:
         print("❌ Error en el procesamiento")
         return
     
-    # Generar reporte
-    archivo_reporte = args.salida or f"reporte_validacion_{args.tienda}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.txt"
-    print(f"\n📋 Generando reporte: {archivo_reporte}")
-    reporte = generar_reporte(resultados, archivo_reporte)
-    
     # Mostrar resumen en consola
     print("\n" + "="*60)
     print("📊 RESUMEN EJECUTIVO")
     print("="*60)
     
     total_items = resultados['total_items']
-    items_validos = sum(1 for r in resultados['resultados'] if r['valido'])
-    items_con_ventas = sum(1 for r in resultados['resultados'] if r.get('tiene_ventas', False))
+    items_validos = resultados['items_validos']
+    items_con_ventas = resultados['items_con_ventas']
     
     print(f"📈 Total items: {total_items}")
     print(f"✅ Items válidos: {items_validos} ({items_validos/total_items*100:.1f}%)")
     print(f"❌ Items inválidos: {total_items - items_validos} ({(total_items - items_validos)/total_items*100:.1f}%)")
     print(f"💰 Items con ventas: {items_con_ventas} ({items_con_ventas/total_items*100:.1f}%)")
+    muestreo = resultados['muestreo']
+    if muestreo:
+        general = muestreo['tasas']['general']
+        print(f"🎲 Muestra: {muestreo['tamano_muestra']} de {muestreo['poblacion']} filas")
+        print(f"📐 Tasa de error estimada: {general['tasa']*100:.2f}% "
+              f"(IC 95%: {general['ic_inferior']*100:.2f}% - {general['ic_superior']*100:.2f}%)")
+        print(f"🚦 {'NO-GO: se ejecutó la validación completa' if muestreo['escalado'] else 'GO: bajo el umbral'}")
+    if resultados['fuente'] == 'snapshot':
+        print(f"🕒 Antigüedad del snapshot: {describir_edad(resultados['fecha_snapshot'])}")
     print(f"📄 Reporte completo: {archivo_reporte}")
     print(f"⏰ Finalizado: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
     print("="*60)